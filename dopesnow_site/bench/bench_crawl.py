@@ -0,0 +1,132 @@
+# bench/bench_crawl.py
+# 离线压测：起本地合成店铺（fixture_site），跑一遍完整 crawl，报告吞吐 / 分阶段 CPU / 峰值 RSS。
+#   python bench/bench_crawl.py --products 1000 --latency 0.02 --concurrency 8
+#   python bench/bench_crawl.py --json > bench_output.txt      # 机器可读，便于对比回归
+import argparse, contextlib, json, os, resource, sys, threading, time
+from collections import defaultdict
+from typing import Dict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from config import Settings                      # noqa: E402
+from httpclient import create_client             # noqa: E402
+from products import iter_products               # noqa: E402
+import parse                                     # noqa: E402
+from fixture_site import FixtureStore            # noqa: E402
+
+# crawl 中各阶段的实际入口（PageDocument 方法）；soup 惰性构建，计入首个触发它的阶段
+STAGES = {
+    "classify_page_context": "classify",
+    "discover_product_links_from_html": "product_links",
+    "parse_product_page": "parse_product",
+}
+
+class StageTimer:
+    """包裹 PageDocument 方法，按阶段累计线程 CPU 时间（time.thread_time，不含网络等待）。"""
+
+    def __init__(self):
+        self.cpu: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._orig = {}
+
+    def install(self) -> None:
+        for stage, meth in STAGES.items():
+            orig = getattr(parse.PageDocument, meth)
+            self._orig[meth] = orig
+
+            def wrapper(doc, *a, _orig=orig, _stage=stage, **kw):
+                t0 = time.thread_time()
+                try:
+                    return _orig(doc, *a, **kw)
+                finally:
+                    dt = time.thread_time() - t0
+                    with self._lock:
+                        self.cpu[_stage] += dt
+                        self.calls[_stage] += 1
+            setattr(parse.PageDocument, meth, wrapper)
+
+    def uninstall(self) -> None:
+        for meth, orig in self._orig.items():
+            setattr(parse.PageDocument, meth, orig)
+        self._orig.clear()
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位是 KB，macOS 上是字节
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024
+
+def run(products: int, latency: float, concurrency: int, pages: int, delay: float,
+        use_sitemap: bool, parse_workers: int = 0, backend: str = "requests",
+        fast_parse: bool = True) -> Dict:
+    store = FixtureStore(products=products, latency=latency)
+    server = store.serve()
+    client = create_client(Settings(base_url=store.base_url, delay_seconds=delay, concurrence=concurrency,
+                                    parse_workers=parse_workers, backend=backend,
+                                    fast_parse=fast_parse))
+    seeds = [store.base_url] if use_sitemap else [store.base_url] + store.seeds()
+
+    timer = StageTimer(); timer.install()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    n = 0
+    try:
+        # crawl 自身的进度输出转到 stderr，stdout 只留报告
+        with contextlib.redirect_stdout(sys.stderr):
+            for _ in iter_products(client, seeds, max_pages=pages):
+                n += 1
+    finally:
+        timer.uninstall()
+        client.close()
+        server.shutdown()
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+
+    return {
+        "config": {"products": products, "latency": latency, "concurrency": concurrency,
+                   "max_pages": pages, "delay": delay, "sitemap": use_sitemap,
+                   "parse_workers": parse_workers, "backend": backend,
+                   "fast_parse": fast_parse},
+        "wall_seconds": round(wall, 3),
+        "process_cpu_seconds": round(cpu, 3),
+        "requests": store.requests,
+        "products": n,
+        "pages_per_sec": round(store.requests / wall, 2) if wall else 0.0,
+        "products_per_sec": round(n / wall, 2) if wall else 0.0,
+        "stages": {s: {"calls": timer.calls[s], "cpu_seconds": round(timer.cpu[s], 4),
+                       "ms_per_call": round(1000 * timer.cpu[s] / timer.calls[s], 3) if timer.calls[s] else 0.0}
+                   for s in STAGES},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline crawl/parse throughput benchmark")
+    ap.add_argument("--products", type=int, default=500, help="Synthetic catalog size")
+    ap.add_argument("--latency", type=float, default=0.0, help="Server-side latency per request (s)")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--pages", type=int, default=2000, help="Discovery page budget")
+    ap.add_argument("--delay", type=float, default=0.0, help="Client rate-limit delay (s)")
+    ap.add_argument("--sitemap", action="store_true", help="Seed from sitemap.xml instead of listing URLs")
+    ap.add_argument("--parse-workers", type=int, default=0,
+                    help="Parse in worker processes (stage CPU below then only covers inline parsing)")
+    ap.add_argument("--backend", choices=["requests", "async"], default="requests")
+    ap.add_argument("--no-fast-parse", dest="fast_parse", action="store_false",
+                    help="Parse product pages through the full DOM only")
+    ap.add_argument("--json", action="store_true", help="Print the report as JSON")
+    a = ap.parse_args(argv)
+
+    report = run(a.products, a.latency, a.concurrency, a.pages, a.delay, a.sitemap, a.parse_workers, a.backend,
+                 a.fast_parse)
+    if a.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"products={report['products']} requests={report['requests']} wall={report['wall_seconds']}s "
+          f"cpu={report['process_cpu_seconds']}s")
+    print(f"  pages/sec    {report['pages_per_sec']}")
+    print(f"  products/sec {report['products_per_sec']}")
+    for s, st in report["stages"].items():
+        print(f"  {s:<34} calls={st['calls']:<6} cpu={st['cpu_seconds']:.3f}s  {st['ms_per_call']:.3f} ms/call")
+    print(f"  peak RSS     {report['peak_rss_mb']} MB")
+
+if __name__ == "__main__":
+    main()
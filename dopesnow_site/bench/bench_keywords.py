@@ -0,0 +1,115 @@
+# bench/bench_keywords.py
+# 链接分类微基准：编译后的 KeywordMatcher vs. 逐词 any(k in s) 子串扫描。
+# 先校验两者结果逐条一致，再分别报告冷缓存（每条链接首次出现）与热缓存（链接在各页重复出现）的吞吐。
+#   python bench/bench_keywords.py --links 20000 --repeat 5
+import argparse, json, os, random, sys, time
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+import parse                                     # noqa: E402
+from parse import CATEGORY_CANON, CATEGORY_DENY, EXPAND_KEYWORDS, PRODUCT_LINK_DENY   # noqa: E402
+from fixture_site import CATEGORIES, COLORS      # noqa: E402
+
+# —— 参照实现：关键词引擎之前的逐词扫描写法 ——
+def ref_categories(url: str, extra: str = "") -> List[str]:
+    ctx = (url + " " + (extra or "")).lower()
+    return [c for c, keys in CATEGORY_CANON.items()
+            if c not in parse.COLLECTION_SIGNALS and any(k in ctx for k in keys)]
+
+def ref_gender(url: str, extra: str = "") -> Optional[str]:
+    ctx = f" {url} {(extra or '')} ".lower()
+    if " women " in ctx or "/womens" in ctx or "womens-" in ctx: return "women"
+    if " men " in ctx or "/mens" in ctx or "mens-" in ctx: return "men"
+    return None
+
+def ref_listing(url: str, t: str) -> bool:
+    u, t = url.lower(), (t or "").lower()
+    if "page=" in u: return True
+    has_gender = ("men" in u or "women" in u or "men" in t or "women" in t)
+    return has_gender and any(any(k in u or k in t for k in keys) for keys in CATEGORY_CANON.values())
+
+def ref_link(low: str) -> tuple:
+    deny_p = any(x in low for x in PRODUCT_LINK_DENY)
+    deny_c = any(x in low for x in CATEGORY_DENY)
+    expand = ("?page=" in low) or ("men" in low) or ("women" in low) or any(k in low for k in EXPAND_KEYWORDS)
+    return deny_p, deny_c, expand
+
+def new_link(low: str) -> tuple:
+    hits = parse.KEYWORDS.match(low)
+    return "deny:product_link" in hits, "deny:category" in hits, "expand" in hits
+
+def classify_ref(u: str) -> tuple:
+    return ref_categories(u), ref_gender(u), ref_listing(u, ""), ref_link(u.lower())
+
+def classify_new(u: str) -> tuple:
+    return (parse.infer_categories_from_url_or_text(u), parse.detect_gender_from_url_or_text(u),
+            parse.looks_like_listing_url(u, ""), new_link(u.lower()))
+
+def make_links(n: int, seed: int = 7) -> List[str]:
+    rnd = random.Random(seed)
+    base = "https://www.dopesnow.com"
+    paths = ["/account", "/cart", "/help", "/blog/news", "/pages/travel", "/collections/sale",
+             "/collections/bestsellers", "/collections/new-in"]
+    words = CATEGORIES + ["base-layers", "facemasks", "ski-socks", "backpacks", "t-shirts", "bibs"]
+    out = []
+    for i in range(n):
+        r = rnd.random()
+        if r < 0.45:
+            out.append(f"{base}/item-{i}-{rnd.choice(words).rstrip('s')}-unisex-{rnd.choice(COLORS)}")
+        elif r < 0.8:
+            g = rnd.choice(["mens", "womens"])
+            q = f"?page={rnd.randint(2, 9)}" if rnd.random() < 0.3 else ""
+            out.append(f"{base}/{g}-snowboard-{rnd.choice(words)}{q}")
+        else:
+            out.append(base + rnd.choice(paths) + (f"/{i}" if rnd.random() < 0.5 else ""))
+    return out
+
+def timeit(fn, links: List[str], repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for u in links:
+            fn(u)
+    return time.perf_counter() - t0
+
+def run(links: int, repeat: int) -> Dict:
+    urls = make_links(links)
+    bad = [u for u in urls if classify_ref(u) != classify_new(u)]
+    if bad:
+        raise SystemExit(f"mismatch on {len(bad)} links, e.g. {bad[0]}: {classify_ref(bad[0])} != {classify_new(bad[0])}")
+
+    parse.KEYWORDS.match.cache_clear()
+    ref = timeit(classify_ref, urls, repeat)
+    # 冷：只跑一遍且缓存为空（每个文本都要真正扫描一次）；热：后续重复出现的链接直接命中缓存
+    parse.KEYWORDS.match.cache_clear()
+    cold = timeit(classify_new, urls, 1)
+    warm = timeit(classify_new, urls, repeat)
+    total = links * repeat
+    return {
+        "links": links, "repeat": repeat,
+        "reference_links_per_sec": round(total / ref),
+        "compiled_cold_links_per_sec": round(links / cold),
+        "compiled_warm_links_per_sec": round(total / warm),
+        "speedup_cold": round((links / cold) / (total / ref), 2),
+        "speedup_warm": round(ref / warm, 2),
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Link-classification throughput: compiled matcher vs substring scans")
+    ap.add_argument("--links", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=5, help="Passes over the link set (links recur across pages)")
+    ap.add_argument("--json", action="store_true")
+    a = ap.parse_args(argv)
+    report = run(a.links, a.repeat)
+    if a.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"links={report['links']} x{report['repeat']} (results identical to reference)")
+    print(f"  reference      {report['reference_links_per_sec']:>10} links/sec")
+    print(f"  compiled cold  {report['compiled_cold_links_per_sec']:>10} links/sec  ({report['speedup_cold']}x)")
+    print(f"  compiled warm  {report['compiled_warm_links_per_sec']:>10} links/sec  ({report['speedup_warm']}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# bench/fixture_site.py
+# 本地合成店铺：类目列表页（?page=N 分页 + rel=next）、带 JSON-LD / 面包屑的详情页、sitemap 索引（含 .xml.gz）。
+# 目录规模与每请求延迟可配置，供离线压测 crawl / parse 吞吐，不访问线上站点。
+import gzip, json, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+GENDERS = [("mens", "Men"), ("womens", "Women")]
+CATEGORIES = ["jackets", "pants", "goggles", "hoodies", "beanies", "gloves"]
+COLORS = ["black", "blue", "green", "white"]
+
+class FixtureStore:
+    def __init__(self, products: int = 500, page_size: int = 24, latency: float = 0.0,
+                 description_words: int = 120):
+        self.products = products
+        self.page_size = page_size
+        self.latency = latency
+        self.description_words = description_words
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.base_url = ""
+
+    # —— 目录 ——
+    def category_of(self, i: int) -> str:
+        return CATEGORIES[i % len(CATEGORIES)]
+
+    def product_path(self, i: int) -> str:
+        cat = self.category_of(i)
+        return f"/item-{i}-{cat.rstrip('s')}-unisex-{COLORS[i % len(COLORS)]}"
+
+    def listing_items(self, gender: str, cat: str) -> List[int]:
+        # 奇数编号的商品同时挂在 men / women 列表下（gender=both），偶数编号只在 men 下
+        items = [i for i in range(self.products) if self.category_of(i) == cat]
+        return items if gender == "mens" else [i for i in items if i % 2 == 1]
+
+    def listing_path(self, gender: str, cat: str) -> str:
+        return f"/{gender}-snowboard-{cat}"
+
+    # —— 页面 ——
+    def _page(self, title: str, body: str, head: str = "") -> str:
+        nav = "".join(f'<a href="{self.listing_path(g, c)}">{label} {c}</a>'
+                      for g, label in GENDERS for c in CATEGORIES)
+        return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title>{head}</head>"
+                f"<body><header><nav>{nav}<a href='/account'>Account</a><a href='/cart'>Cart</a></nav></header>"
+                f"{body}<footer><a href='/help'>Help</a><a href='/blog/news'>Blog</a></footer></body></html>")
+
+    def home(self) -> str:
+        return self._page("Dope Snow", "<h1>Welcome</h1>")
+
+    def listing(self, gender: str, label: str, cat: str, page: int) -> Optional[str]:
+        items = self.listing_items(gender, cat)
+        pages = max(1, -(-len(items) // self.page_size))
+        if page > pages:
+            return None
+        chunk = items[(page - 1) * self.page_size: page * self.page_size]
+        cards = "".join(
+            f'<div class="product-card"><a href="{self.product_path(i)}"><img src="/images/{i}_01.jpg" alt="">'
+            f'<span class="product-name">Item {i}</span></a><span class="price">$ {20 + i % 180}.00</span></div>'
+            for i in chunk)
+        path = self.listing_path(gender, cat)
+        pager = "".join(f'<a href="{path}?page={n}">{n}</a>' for n in range(1, pages + 1))
+        head = f'<link rel="next" href="{path}?page={page + 1}">' if page < pages else ""
+        body = (f"<h1>{label}'s Snowboard {cat.title()}</h1><p class='count'>{len(items)} products</p>"
+                f"<div class='grid'>{cards}</div><div class='pagination'>{pager}</div>")
+        return self._page(f"{label}'s {cat.title()} | Dope", body, head)
+
+    def product(self, i: int) -> Optional[str]:
+        if not (0 <= i < self.products):
+            return None
+        cat = self.category_of(i)
+        url = self.base_url.rstrip("/") + self.product_path(i)
+        words = " ".join(f"word{(i * 7 + k) % 97}" for k in range(self.description_words))
+        ld = {"@context": "https://schema.org", "@type": "Product", "name": f"Dope Item {i}",
+              "sku": f"H{i:04d}", "brand": {"@type": "Brand", "name": "Dope"},
+              "image": [f"/images/{i}_0{k}.jpg" for k in range(1, 5)], "description": words,
+              "offers": {"@type": "Offer", "price": f"{20 + i % 180}.00", "priceCurrency": "USD"}}
+        bc = {"@context": "https://schema.org", "@type": "BreadcrumbList",
+              "itemListElement": [{"@type": "ListItem", "position": 1, "name": "Home"},
+                                  {"@type": "ListItem", "position": 2, "name": cat.title()}]}
+        head = (f'<link rel="canonical" href="{url}">'
+                f'<script type="application/ld+json">{json.dumps(ld)}</script>'
+                f'<script type="application/ld+json">{json.dumps(bc)}</script>')
+        related = "".join(f'<a href="{self.product_path((i + k) % self.products)}">Related {k}</a>' for k in range(1, 5))
+        body = (f"<h1>Dope Item {i}</h1><div class='price'>$ {20 + i % 180}.00</div>"
+                f"<div class='product-description'>{words}</div><div class='related'>{related}</div>")
+        return self._page(f"Dope Item {i}", body, head)
+
+    def sitemap_index(self) -> str:
+        base = self.base_url.rstrip("/")
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                f'<sitemap><loc>{base}/sitemap-collections.xml</loc></sitemap>'
+                f'<sitemap><loc>{base}/sitemap-products.xml.gz</loc></sitemap>'
+                '</sitemapindex>')
+
+    def sitemap_urls(self, paths: List[str]) -> str:
+        base = self.base_url.rstrip("/")
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                + "".join(f"<url><loc>{base}{p}</loc><lastmod>2026-01-01</lastmod></url>" for p in paths)
+                + "</urlset>")
+
+    def image(self, i: int, k: int, size: int = 20000) -> bytes:
+        """伪图片正文：第 4 张是所在类目共用的尺码表（内容相同、URL 不同），其余每个商品各不相同。"""
+        key = f"size-chart-{self.category_of(i)}" if k == 4 else f"{i}-{k}"
+        seed = key.encode() * (size // len(key) + 1)
+        return b"\xff\xd8\xff\xe0" + seed[:size]
+
+    def render(self, raw_path: str) -> Tuple[int, str, bytes]:
+        """返回 (status, content_type, body)。"""
+        u = urlparse(raw_path)
+        path, q = u.path, parse_qs(u.query)
+        html = None
+        if path == "/":
+            html = self.home()
+        elif path == "/sitemap.xml":
+            return 200, "application/xml", self.sitemap_index().encode()
+        elif path == "/sitemap-collections.xml":
+            paths = [self.listing_path(g, c) for g, _ in GENDERS for c in CATEGORIES]
+            return 200, "application/xml", self.sitemap_urls(paths).encode()
+        elif path == "/sitemap-products.xml.gz":
+            xml = self.sitemap_urls([self.product_path(i) for i in range(self.products)])
+            return 200, "application/x-gzip", gzip.compress(xml.encode())
+        elif path.startswith("/images/") and path.endswith(".jpg"):
+            try:
+                i, k = (int(x) for x in path[len("/images/"):-len(".jpg")].split("_"))
+            except ValueError:
+                i = k = -1
+            if 0 <= i < self.products:
+                return 200, "image/jpeg", self.image(i, k)
+        elif path.startswith("/item-"):
+            try: html = self.product(int(path.split("-")[1]))
+            except ValueError: html = None
+        else:
+            for g, label in GENDERS:
+                for c in CATEGORIES:
+                    if path == self.listing_path(g, c):
+                        html = self.listing(g, label, c, int((q.get("page") or ["1"])[0]))
+        if html is None:
+            return 404, "text/html; charset=utf-8", b"<html><body>Not found</body></html>"
+        return 200, "text/html; charset=utf-8", html.encode("utf-8")
+
+    # —— HTTP 服务 ——
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True   # 头和正文分两次写，不关 Nagle 会被延迟 ACK 卡 40ms
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with store._lock:
+                    store.requests += 1
+                if store.latency:
+                    time.sleep(store.latency)
+                status, ctype, body = store.render(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        self.base_url = f"http://{host}:{server.server_address[1]}/"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def seeds(self) -> List[str]:
+        return [self.base_url.rstrip("/") + self.listing_path(g, c) for g, _ in GENDERS for c in CATEGORIES]
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Serve the synthetic benchmark store")
+    ap.add_argument("--products", type=int, default=500)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--port", type=int, default=8765)
+    a = ap.parse_args()
+    store = FixtureStore(products=a.products, latency=a.latency)
+    srv = store.serve(port=a.port)
+    print(f"Serving {a.products} products at {store.base_url} (Ctrl+C to stop)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,192 @@
+# src/assets.py
+import hashlib, os, sqlite3, tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from httpclient import CHUNK_SIZE, HttpClient, ResponseTooLarge, UnwantedContentType
+from metrics import BYTES_BUCKETS, METRICS, failure_reason
+
+# 产品图片的资产阶段（可选，crawl --assets DIR）：产品定稿之后、写出之前，并发下载它的 images，
+# 走共享的 HttpClient（同一套按 host 限速 / 重试 / 指标；图片 CDN 的 host 有自己的令牌桶）。
+# 文件按内容寻址：DIR/objects/<sha256 前两位>/<sha256>.<扩展名>，颜色变体之间、多次运行之间的同一张图只存一份。
+# manifest（DIR/manifest.sqlite）记 URL -> sha256 / 大小：下过的 URL（文件还在）不再请求。
+# 图片 CDN 的 host 按 delay（crawl --asset-delay）单独限速，不沿用抓页面的 --delay，否则并发下载会被排成一条队；
+# 同时也在抓页面的 host 不动，仍按页面速率。
+# 产品记录补上 image_assets：[{"url", "sha256", "size", "path"}]（path 相对 DIR），顺序同 images，下载失败的不列出。
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, content_type TEXT,
+    path TEXT NOT NULL, fetched TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS assets_sha256 ON assets(sha256);
+"""
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/jpg": ".jpg", "image/png": ".png", "image/webp": ".webp",
+                    "image/gif": ".gif", "image/avif": ".avif", "image/svg+xml": ".svg"}
+MAX_ASSET_BYTES = 32 * 1024 * 1024
+WINDOW = 64   # 同时等待图片的产品数；超过时按顺序阻塞等待最早的产品
+
+def _extension(content_type: str, url: str) -> str:
+    ext = IMAGE_EXTENSIONS.get(content_type)
+    if ext:
+        return ext
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return ext if 1 < len(ext) <= 5 and ext[1:].isalnum() else ""
+
+class AssetStore:
+    """内容寻址的图片库。attach() 包装产品迭代器：按原顺序产出，产出前该产品的图片已下载（或已在库中）。
+
+    下载在线程池里进行（workers，默认 Settings.concurrence）：正文边读边算哈希边写临时文件，完成后改名到哈希路径。
+    manifest 只在调用线程里读写。delay 非 None 时，图片 host 第一次出现时按 delay 配置它自己的令牌桶
+    （突发 workers 个；<=0 不限速，只受 workers 约束）；None 表示与页面共用全局速率。
+    """
+
+    def __init__(self, root: str, client: HttpClient, workers: Optional[int] = None,
+                 max_bytes: int = MAX_ASSET_BYTES, commit_every: int = 200, delay: Optional[float] = None):
+        self.root = root
+        self.client = client
+        self.workers = max(1, workers or client.settings.concurrence)
+        self.max_bytes = max_bytes
+        self.commit_every = max(1, commit_every)
+        self.delay = delay
+        self._hosts: Set[str] = set()   # 已配置过限速的图片 host
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "manifest.sqlite"))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(MANIFEST_SCHEMA)
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM assets").fetchone()[0]
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """manifest 中的记录；文件已被删除的视为没有。"""
+        row = self.conn.execute("SELECT sha256, size, path FROM assets WHERE url=?", (url,)).fetchone()
+        if row is None or not os.path.exists(os.path.join(self.root, row[2])):
+            return None
+        return {"url": url, "sha256": row[0], "size": row[1], "path": row[2]}
+
+    def _record(self, rec: Dict[str, Any]) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO assets(url, sha256, size, content_type, path, fetched) "
+                          "VALUES (?, ?, ?, ?, ?, ?)",
+                          (rec["url"], rec["sha256"], rec["size"], rec.get("content_type"), rec["path"],
+                           datetime.now(timezone.utc).isoformat()))
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def _configure_host(self, url: str) -> None:
+        host = urlparse(url).netloc.lower()
+        if self.delay is None or host in self._hosts:
+            return
+        self._hosts.add(host)
+        self.client.ratelimiter.configure(host, delay=self.delay, burst=self.workers, replace=False)
+
+    def download(self, url: str) -> Dict[str, Any]:
+        """下载一张图片到内容寻址路径（线程安全）；返回 {"url", "sha256", "size", "path", "content_type"}。"""
+        resp = self.client.get(url, stream=True)
+        tmp = None
+        try:
+            ctype = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if ctype and not ctype.startswith("image/"):
+                raise UnwantedContentType(f"{ctype}: {url}", response=resp)
+            length = resp.headers.get("Content-Length", "")
+            if self.max_bytes and length.isdigit() and int(length) > self.max_bytes:
+                raise ResponseTooLarge(f"Content-Length {length} > {self.max_bytes}: {url}", response=resp)
+            h, size = hashlib.sha256(), 0
+            fd, tmp = tempfile.mkstemp(dir=os.path.join(self.root, "objects"), suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if self.max_bytes and size > self.max_bytes:
+                        raise ResponseTooLarge(f"more than {self.max_bytes} bytes: {url}", response=resp)
+                    h.update(chunk)
+                    f.write(chunk)
+            METRICS.inc("http_bytes_total", size)
+            METRICS.observe("http_response_bytes", size, buckets=BYTES_BUCKETS)
+            digest = h.hexdigest()
+            rel = f"objects/{digest[:2]}/{digest}{_extension(ctype, url)}"
+            path = os.path.join(self.root, rel)
+            if os.path.exists(path):
+                METRICS.inc("assets_total", result="duplicate")   # 别的 URL 已存过同样的内容
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+                tmp = None
+                METRICS.inc("assets_total", result="downloaded")
+                METRICS.inc("assets_bytes_total", size)
+            return {"url": url, "sha256": digest, "size": size, "path": rel, "content_type": ctype}
+        finally:
+            resp.close()
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def attach(self, items: Iterable[Any], product_of: Optional[Callable[[Any], Optional[Dict]]] = None) -> Iterator[Any]:
+        """逐条产出 items，每个产品补上 image_assets。至多 WINDOW 个产品同时在等图片，同一 URL 只下载一次。
+
+        product_of 从条目里取出产品 dict（如增量模式的变更记录），返回 None 的条目原样透传。
+        """
+        product_of = product_of or (lambda item: item)
+        inflight: Dict[str, Future] = {}
+        window: "deque[Tuple[Any, Optional[Dict], List[Tuple[str, Future]]]]" = deque()
+
+        def submit(pool: ThreadPoolExecutor, url: str) -> Future:
+            fut = inflight.get(url)
+            if fut is not None:
+                return fut
+            rec = self.lookup(url)
+            if rec is not None:
+                METRICS.inc("assets_total", result="cached")
+                fut = Future(); fut.set_result(rec)
+                return fut
+            self._configure_host(url)
+            fut = inflight[url] = pool.submit(self.download, url)
+            return fut
+
+        def finish(item: Any, prod: Optional[Dict], futs: List[Tuple[str, Future]]) -> Any:
+            if prod is None:
+                return item
+            assets = []
+            for url, fut in futs:
+                try:
+                    rec = fut.result()
+                except Exception as e:
+                    if inflight.pop(url, None) is not None:
+                        METRICS.inc("assets_total", result="failed")
+                        METRICS.inc("crawl_failures_total", stage="asset", reason=failure_reason(e))
+                    continue
+                if inflight.pop(url, None) is not None:
+                    self._record(rec)
+                assets.append({k: rec[k] for k in ("url", "sha256", "size", "path")})
+            prod["image_assets"] = assets
+            return item
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asset")
+        try:
+            for item in items:
+                prod = product_of(item)
+                futs = [(u, submit(pool, u)) for u in (prod.get("images") or [])] if prod is not None else []
+                window.append((item, prod, futs))
+                while window and (len(window) > WINDOW or all(f.done() for _, f in window[0][2])):
+                    yield finish(*window.popleft())
+            while window:
+                yield finish(*window.popleft())
+        finally:
+            # 中途停止（中断 / 调用方不再迭代）时不再开始排队中的下载
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,171 @@
+# src/asyncclient.py
+import asyncio, io, threading, time
+from collections import deque
+from typing import Iterable, Iterator, Optional, Tuple, Union
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from tenacity import retry, retry_if_exception
+
+try:
+    import httpx   # 可选依赖：pip install "httpx[http2]"
+except ImportError:
+    httpx = None
+
+from config import Settings
+from httpclient import (CHUNK_SIZE, DRAIN_BYTES, HttpClient, PageReader, StopFn,
+                        _retryable, _wait_backoff, _count_retry, _stop_after_settings)
+
+# httpx + asyncio 后端：所有请求跑在同一个后台事件循环上，一个连接池（keep-alive，可选 HTTP/2 多路复用），
+# 重试退避与限速等待都是 await，不占线程；上千个在途请求只需一个线程。
+# 对外仍是 HttpClient 的接口：get() 同步桥接到事件循环，fetch_many() 在循环上并发、按输入顺序产出；
+# 返回值转换成 requests.Response，缓存 / 解析 / sitemap 等调用方无需区分后端。
+
+def to_requests_response(r: "httpx.Response", body: bool = True) -> requests.Response:
+    """body=False 用于流式响应：只转换状态与头部，正文由调用方读取后填入。"""
+    resp = requests.Response()
+    resp.status_code = r.status_code
+    resp.reason = r.reason_phrase
+    resp.url = str(r.url)
+    resp.headers = CaseInsensitiveDict(r.headers)
+    resp.encoding = get_encoding_from_headers(resp.headers)   # 与 requests 的默认编码规则一致
+    content = r.content if body else b""
+    resp.raw = io.BytesIO(content)   # stream=True 的调用方（sitemap）按文件对象读取
+    if body:
+        resp._content = content
+    return resp
+
+def _as_requests_error(exc: Exception) -> requests.RequestException:
+    """把 httpx 异常映射为 requests 异常，重试判定与失败归类沿用同步后端的规则。"""
+    if isinstance(exc, httpx.TimeoutException):
+        return requests.Timeout(str(exc) or type(exc).__name__)
+    return requests.ConnectionError(str(exc) or type(exc).__name__)
+
+class AsyncHttpClient(HttpClient):
+    """settings.backend="async" 时使用。
+
+    超时分为建连（connect_timeout）与读写（timeout）；连接池大小由 max_connections 给出，
+    fetch_many 的并发度（workers / concurrence）可以远大于线程池后端的合理取值。
+    get(stream=True) 不做真正的流式：正文读完后以文件对象形式提供给调用方；页面抓取（get_page）是真正分块读取的。
+    """
+
+    def __init__(self, settings: Settings):
+        if httpx is None:
+            raise RuntimeError('backend "async" requires httpx (pip install "httpx[http2]")')
+        super().__init__(settings)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="http-event-loop", daemon=True)
+        self._thread.start()
+        limits = httpx.Limits(max_connections=settings.max_connections,
+                              max_keepalive_connections=settings.max_connections)
+        timeout = httpx.Timeout(settings.timeout, connect=settings.connect_timeout)
+        self.aclient = httpx.AsyncClient(http2=settings.http2, limits=limits, timeout=timeout,
+                                         headers={"User-Agent": settings.user_agent}, follow_redirects=True)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _offload(self, fn, *args):
+        """有磁盘缓存时 fn（_lookup / _finish / _store_page 会读写缓存文件）放到线程里执行，不阻塞事件循环。"""
+        if self.cache is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    @retry(reraise=True,
+           retry=retry_if_exception(_retryable),
+           wait=_wait_backoff,
+           stop=_stop_after_settings,
+           before_sleep=_count_retry,
+           )
+    async def aget(self, url: str, stream: bool = False) -> requests.Response:
+        cached, hit = await self._offload(self._lookup, url, stream)
+        if hit is not None:
+            return hit
+
+        sleep = self.ratelimiter.reserve(url)
+        if sleep > 0:
+            await asyncio.sleep(sleep)
+        t0 = time.monotonic()
+        try:
+            r = await self.aclient.get(url, headers=cached.validators() if cached is not None else None)
+        except httpx.HTTPError as e:
+            err = _as_requests_error(e)
+            self._failed(url, err)
+            raise err from e
+        return await self._offload(self._finish, url, to_requests_response(r), cached, time.monotonic() - t0, stream)
+
+    @retry(reraise=True,
+           retry=retry_if_exception(_retryable),
+           wait=_wait_backoff,
+           stop=_stop_after_settings,
+           before_sleep=_count_retry,
+           )
+    async def aget_page(self, url: str, until: Optional[StopFn] = None) -> requests.Response:
+        """HttpClient.get_page 的异步版本：httpx 流式响应，读到 until 给出的位置即断开。"""
+        cached, hit = await self._offload(self._lookup, url, False)
+        if hit is not None:
+            return hit
+
+        sleep = self.ratelimiter.reserve(url)
+        if sleep > 0:
+            await asyncio.sleep(sleep)
+        t0 = time.monotonic()
+        try:
+            async with self.aclient.stream("GET", url, headers=cached.validators() if cached is not None else None) as r:
+                head = to_requests_response(r, body=False)
+                resp = await self._offload(self._finish, url, head, cached, time.monotonic() - t0, True)
+                if resp is not head:   # 304：缓存里的完整正文
+                    return resp
+                reader = PageReader(url, head, self.settings.max_response_bytes, until)
+                chunks = r.aiter_bytes(CHUNK_SIZE)
+                async for chunk in chunks:
+                    reader.append(chunk)
+                    if until is not None and await asyncio.to_thread(reader.check):
+                        length = head.headers.get("Content-Length", "")
+                        if length.isdigit() and int(length) - r.num_bytes_downloaded <= DRAIN_BYTES:
+                            async for _ in chunks:
+                                pass
+                        break
+        except httpx.HTTPError as e:
+            err = _as_requests_error(e)
+            self._failed(url, err)
+            raise err from e
+        return await self._offload(self._store_page, url, reader.finish())
+
+    def get_page(self, url: str, until: Optional[StopFn] = None) -> requests.Response:
+        return self._run(self.aget_page(url, until))
+
+    def get(self, url: str, stream: bool = False) -> requests.Response:
+        # 重试已在 aget 内完成；不可在事件循环线程内调用
+        return self._run(self.aget(url, stream))
+
+    def fetch_many(self, urls: Iterable[str], workers: Optional[int] = None,
+                   until: Optional[StopFn] = None) -> Iterator[Tuple[str, Union[requests.Response, Exception]]]:
+        """在事件循环上并发抓取，按输入顺序产出 (url, 响应或异常)；在途请求不超过 workers，排队不超过 2*workers。"""
+        workers = max(1, workers or self.settings.concurrence)
+        sem = asyncio.Semaphore(workers)
+        stream = self.settings.stream_pages
+
+        async def fetch(u: str):
+            async with sem:
+                try:
+                    return await (self.aget_page(u, until) if stream else self.aget(u))
+                except Exception as e:
+                    return e
+
+        pending = deque()
+        for u in urls:
+            pending.append((u, asyncio.run_coroutine_threadsafe(fetch(u), self.loop)))
+            if len(pending) >= workers * 2:
+                u0, fut = pending.popleft()
+                yield u0, fut.result()
+        while pending:
+            u0, fut = pending.popleft()
+            yield u0, fut.result()
+
+    def close(self) -> None:
+        if self.loop.is_running():
+            self._run(self.aclient.aclose())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+        super().close()
@@ -0,0 +1,99 @@
+# src/cache.py
+import hashlib, json, os, tempfile, time
+from typing import Dict, Optional
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# 磁盘响应缓存：按 URL 的 sha1 分桶存放 <hash>.json（元数据）+ <hash>.body（原始字节）。
+# 元数据里保留 ETag / Last-Modified，供条件请求复用；写入走临时文件 + os.replace，多线程安全。
+KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Content-Language")
+
+class CacheEntry:
+    def __init__(self, meta: Dict, body_path: str):
+        self.meta = meta
+        self.body_path = body_path
+
+    @property
+    def age(self) -> float:
+        return time.time() - float(self.meta.get("stored_at", 0))
+
+    def fresh(self, max_age: float) -> bool:
+        return max_age > 0 and self.age <= max_age
+
+    def validators(self) -> Dict[str, str]:
+        """条件请求头：If-None-Match / If-Modified-Since。"""
+        h = {}
+        if self.meta.get("etag"): h["If-None-Match"] = self.meta["etag"]
+        if self.meta.get("last_modified"): h["If-Modified-Since"] = self.meta["last_modified"]
+        return h
+
+    def response(self) -> requests.Response:
+        """还原成 requests.Response，调用方无需区分是否命中缓存（from_cache=True）。"""
+        r = requests.Response()
+        r.status_code = 200
+        r.url = self.meta.get("final_url") or self.meta.get("url", "")
+        r.headers = CaseInsensitiveDict(self.meta.get("headers") or {})
+        r.encoding = self.meta.get("encoding")
+        with open(self.body_path, "rb") as f:
+            r._content = f.read()
+        r.from_cache = True
+        return r
+
+class ResponseCache:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, url: str):
+        h = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        d = os.path.join(self.root, h[:2])
+        return d, os.path.join(d, h + ".json"), os.path.join(d, h + ".body")
+
+    def load(self, url: str) -> Optional[CacheEntry]:
+        _, meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not os.path.exists(body_path):
+            return None
+        return CacheEntry(meta, body_path)
+
+    def store(self, url: str, resp: requests.Response) -> None:
+        d, meta_path, body_path = self._paths(url)
+        os.makedirs(d, exist_ok=True)
+        meta = {
+            "url": url,
+            "final_url": resp.url,
+            "stored_at": time.time(),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "encoding": resp.encoding,
+            "headers": {k: resp.headers[k] for k in KEEP_HEADERS if k in resp.headers},
+        }
+        # 先写 body 再写 meta：meta 存在即代表 body 完整
+        _atomic_write(body_path, resp.content)
+        _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def touch(self, entry: CacheEntry, resp: Optional[requests.Response] = None) -> None:
+        """304 命中：刷新存储时间，并吸收服务端下发的新校验头。"""
+        meta = dict(entry.meta)
+        meta["stored_at"] = time.time()
+        if resp is not None:
+            meta["etag"] = resp.headers.get("ETag") or meta.get("etag")
+            meta["last_modified"] = resp.headers.get("Last-Modified") or meta.get("last_modified")
+        _, meta_path, _ = self._paths(meta["url"])
+        _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+        entry.meta = meta
+
+def _atomic_write(path: str, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
@@ -1,27 +1,160 @@
 # src/cli.py
-import argparse
+import argparse, os, secrets
+from datetime import datetime, timezone
+from typing import Optional
 from config import Settings
-from httpclient import HttpClient
+from httpclient import RateLimiter, create_client
 from menu import crawl_menu   # 仍可保留；抓不到菜单也不影响
-from products import crawl_products
-from saver import write_site_json_single, write_site_csv_single
+from products import iter_product_changes, iter_products
+from productstore import ProductStore
+from saver import COLUMNAR_FORMATS, SITE_CSV_FIELDNAMES, ChangeSink, ensure_dir, open_sink
+from state import CrawlState
+from sitemap import parse_lastmod
+from metrics import METRICS
+from multisite import MultiSiteCrawler
+from distributed import Coordinator, job_spec, run_worker
+from assets import AssetStore
+from siteprofile import load_profile, load_profiles
 
-def main(argv=None):
-    parser = argparse.ArgumentParser(description="Dopesnow crawler (single-file output, with category provenance)")
-    sub = parser.add_subparsers(dest="cmd", required=True)
-
-    p = sub.add_parser("crawl")
-    p.add_argument("--base", default="https://www.dopesnow.com/", help="Base URL")
+def add_client_args(p: argparse.ArgumentParser) -> None:
+    """HTTP 客户端与解析参数（crawl / crawl-sites / worker 共用）。"""
     p.add_argument("--delay", type=float, default=1.2, help="Delay seconds")
+    p.add_argument("--concurrency", type=int, default=1, help="Concurrent fetch workers")
+    p.add_argument("--backend", choices=["requests","async"], default="requests",
+                   help="HTTP backend: thread pool over requests, or one asyncio event loop over httpx")
+    p.add_argument("--max-connections", type=int, default=100, help="Connection pool size (async backend)")
+    p.add_argument("--http2", action="store_true", help="Enable HTTP/2 multiplexing (async backend, needs h2)")
+    p.add_argument("--connect-timeout", type=float, default=10.0, help="Connect timeout seconds")
+    p.add_argument("--timeout", type=float, default=20.0, help="Read timeout seconds")
+    p.add_argument("--parse-workers", type=int, default=0,
+                   help="Parse pages in this many worker processes (0 = inline, -1 = one per CPU)")
+    p.add_argument("--max-response-bytes", type=int, default=8 * 1024 * 1024,
+                   help="Abort pages larger than this many (decoded) bytes (0 = no limit)")
+    p.add_argument("--no-stream", dest="stream_pages", action="store_false",
+                   help="Download whole pages (disable Content-Type checks and early stop while reading)")
+    p.add_argument("--burst", type=int, default=1, help="Requests allowed back-to-back per host")
+    p.add_argument("--max-rate", type=float, default=None, help="Upper bound (req/s per host) for adaptive rate")
+    p.add_argument("--cache-dir", default=None, help="Disk HTTP cache directory (enables conditional GETs)")
+    p.add_argument("--max-age", type=float, default=0.0,
+                   help="Serve cache hits younger than this many seconds without a request ('inf' = offline)")
+
+def add_fetch_args(p: argparse.ArgumentParser) -> None:
+    """crawl 与 crawl-sites 共用的抓取 / 输出参数。"""
+    add_client_args(p)
     p.add_argument("--pages", type=int, default=1500, help="Max pages to explore")
-    p.add_argument("--format", choices=["json","csv"], default="json")
+    p.add_argument("--format", choices=["json","jsonl","csv","parquet","arrow"], default="json",
+                   help="Output format; parquet/arrow write a typed columnar file (needs pyarrow)")
     p.add_argument("--out", default=None)
-    p.add_argument("--seeds", default="", help="Comma-separated extra seed URLs")
+    p.add_argument("--row-group-size", type=int, default=10000,
+                   help="Products per Parquet row group / Arrow record batch")
+    p.add_argument("--partition-by", default="",
+                   help="parquet/arrow: comma-separated partition columns (run_date, gender); --out becomes a directory")
+    p.add_argument("--seen-filter", type=int, default=0, metavar="CAPACITY",
+                   help="Use a Bloom filter sized for CAPACITY URLs as the frontier seen-set (0 = exact set)")
+    p.add_argument("--no-fast-parse", dest="fast_parse", action="store_false",
+                   help="Always build the full DOM for product pages (disable the JSON-LD fast path)")
+    p.add_argument("--resume", action="store_true", help="Resume from the checkpoint")
+    p.add_argument("--listing-only", action="store_true",
+                   help="Take name / price / image from listing-page product cards; fetch detail pages only for "
+                        "incomplete cards (and, with --delta, for cards that changed since the last run)")
+    p.add_argument("--assets", default=None, metavar="DIR",
+                   help="Download product images into this content-addressed store (deduplicated across products "
+                        "and runs via DIR/manifest.sqlite) and add image_assets (sha256, size, path) to each product")
+    p.add_argument("--asset-delay", type=float, default=0.0,
+                   help="Per-host delay for image hosts that serve no pages (e.g. a CDN); 0 = limited only by "
+                        "--concurrency. Hosts that also serve pages keep --delay")
+    p.add_argument("--sitemap-since", default=None,
+                   help="Only seed sitemap URLs with <lastmod> after this ISO date, or 'last' for the previous run")
+    p.add_argument("--metrics-out", default="data/crawl_metrics.json", help="Write run metrics here ('' to disable)")
+    p.add_argument("--metrics-format", choices=["json","prom"], default="json",
+                   help="Metrics file format: JSON snapshot or Prometheus text exposition")
 
-    args = parser.parse_args(argv)
+def settings_from_args(args, base_url: str) -> Settings:
+    return Settings(base_url=base_url, delay_seconds=args.delay, concurrence=args.concurrency,
+                    burst=args.burst, max_rate=args.max_rate, parse_workers=args.parse_workers,
+                    fast_parse=args.fast_parse, seen_filter_capacity=args.seen_filter,
+                    stream_pages=args.stream_pages, max_response_bytes=args.max_response_bytes,
+                    cache_dir=args.cache_dir, cache_max_age=args.max_age,
+                    backend=args.backend, max_connections=args.max_connections, http2=args.http2,
+                    timeout=args.timeout, connect_timeout=args.connect_timeout)
+
+def sink_options(args, csv_fieldnames=None) -> dict:
+    """open_sink 的格式相关参数。"""
+    if args.format in COLUMNAR_FORMATS:
+        return {"row_group_size": args.row_group_size,
+                "partition_by": [c.strip() for c in args.partition_by.split(",") if c.strip()]}
+    if args.partition_by:
+        raise SystemExit("--partition-by requires --format parquet or arrow")
+    if args.format == "csv" and csv_fieldnames:
+        return {"fieldnames": csv_fieldnames}
+    return {}
+
+def write_metrics(args) -> None:
+    # 中断 / 异常退出时也写出指标，便于定位问题
+    if args.metrics_out:
+        ensure_dir(args.metrics_out)
+        METRICS.write(args.metrics_out, args.metrics_format)
+
+def print_summary(args, count: int, out_path: str, label: str = "products") -> None:
+    print(f"  {label}: {count}")
+    lat = next((h for h in METRICS.snapshot()["histograms"] if h["name"] == "http_request_seconds"), None)
+    if lat:
+        fails = sum(v for (n, _), v in METRICS.counters.items() if n == "crawl_failures_total")
+        print(f"  requests: {lat['count']} (p50 {lat['p50']}s, p95 {lat['p95']}s), failures: {int(fails)}")
+    fast_hit = sum(v for (n, l), v in METRICS.counters.items() if n == "parse_fast_path_total" and ("result", "hit") in l)
+    fast_all = sum(v for (n, _), v in METRICS.counters.items() if n == "parse_fast_path_total")
+    if fast_all:
+        print(f"  fast-path parses: {int(fast_hit)}/{int(fast_all)} ({int(fast_all - fast_hit)} fell back to DOM)")
+    assets = {dict(l).get("result"): int(v) for (n, l), v in METRICS.counters.items() if n == "assets_total"}
+    if assets:
+        mb = METRICS.counter_value("assets_bytes_total") / 1e6
+        print("  images: " + ", ".join(f"{k} {v}" for k, v in sorted(assets.items())) + f" ({mb:.1f} MB new)")
+    if args.metrics_out:
+        print(f"  metrics -> {args.metrics_out}")
+    print(f"Done. Wrote -> {out_path}")
+
+def resolve_sitemap_since(value: Optional[str], state: Optional[CrawlState] = None) -> Optional[datetime]:
+    """--sitemap-since：ISO 日期，或 "last"（state 里上一次完整跑完的时间；还没有时不过滤）。
+    给了值却解析不出时直接报错，不能悄悄退化成全量 sitemap。"""
+    if not value:
+        return None
+    if value == "last":
+        return parse_lastmod(state.get_meta("sitemap_last_run")) if state is not None else None
+    since = parse_lastmod(value)
+    if since is None:
+        raise SystemExit(f"invalid --sitemap-since {value!r}: expected an ISO date (e.g. 2024-01-02 or "
+                         f"2024-01-02T10:00:00Z) or 'last'")
+    return since
 
-    settings = Settings(base_url=args.base, delay_seconds=args.delay)
-    client = HttpClient(settings)
+def start_coordinator(args, settings: Settings, profile) -> Optional[Coordinator]:
+    """--serve / --local-workers：起协调端点（及本机工作进程）；否则返回 None，本进程自己抓取。"""
+    if not (args.serve or args.local_workers):
+        return None
+    host, _, port = (args.serve or "127.0.0.1:0").rpartition(":")
+    rules = profile.rules() if profile is not None else None
+    # 没给令牌时随机生成一个（本机工作进程自动带上）；按 host 计量租约，整个集群遵守本进程的 --delay
+    token = args.token or secrets.token_urlsafe(16)
+    limiter = RateLimiter(settings.delay_seconds, burst=settings.burst, adaptive=False)
+    coord = Coordinator(job_spec(settings, rules, args.listing_only), host or "127.0.0.1", int(port),
+                        lease_seconds=args.lease_seconds, token=token, limiter=limiter).start()
+    hint = f"cli.py worker {coord.url}" + ("" if args.token else f" --token {token}")
+    print(f"  Coordinator listening on {coord.url} (run: {hint})")
+    if args.local_workers:
+        coord.start_local(args.local_workers, settings)
+        print(f"  Started {args.local_workers} local workers")
+    return coord
+
+def cmd_crawl(args) -> None:
+    # 先校验全部选项，再抓菜单、起协调端点（本机工作进程不是守护进程，起了之后出错必须关掉）
+    resolve_sitemap_since(args.sitemap_since)
+    if args.delta and args.format not in ("json", "jsonl"):
+        raise SystemExit("--delta writes JSON Lines change records; --format must be json or jsonl")
+    options = sink_options(args) if not args.delta else {}
+    profile = load_profile(args.profile) if args.profile else None
+    settings = settings_from_args(args, args.base)
+    if profile is not None:
+        settings = profile.settings(settings)
+    client = create_client(settings)
 
     print("[1/3] Crawling menu...")
     menu_rows = crawl_menu(client)
@@ -29,18 +162,176 @@ def main(argv=None):
 
     print("[2/3] Building seeds from menu + home...")
     extra_seeds = [s.strip() for s in args.seeds.split(",") if s.strip()]
+    if profile is not None:
+        extra_seeds = profile.seeds + extra_seeds
     seeds = [settings.base_url] + [r["url"] for r in menu_rows] + extra_seeds
 
     print("[3/3] Crawling products (discovery + detail parse)...")
-    products = crawl_products(client, seeds=seeds, max_pages=args.pages)
+    site = profile.name if profile is not None else "dopesnow_site"
+    if args.delta:
+        cmd_crawl_delta(args, client, menu_rows, seeds, profile, f"data/{site}_changes.jsonl")
+        return
+    out_path = args.out or f"data/{site}_product.{args.format}"
+    max_pages = profile.max_pages if profile is not None and profile.max_pages else args.pages
+    # 产品逐条定稿逐条写出：中途中断时已解析的产品仍保留在输出文件里
+    ensure_dir(args.state)
+    state = CrawlState(args.state, resume=args.resume)
+    assets = AssetStore(args.assets, client, delay=args.asset_delay) if args.assets else None
+    sitemap_since = resolve_sitemap_since(args.sitemap_since, state)
+    started = datetime.now(timezone.utc).isoformat()
+    remote = None
+    try:
+        remote = start_coordinator(args, settings, profile)
+        with open_sink(args.format, out_path, menu_rows, **options) as sink:
+            products = iter_products(client, seeds=seeds, max_pages=max_pages, state=state,
+                                     sitemap_since=sitemap_since, profile=profile, listing_only=args.listing_only,
+                                     remote=remote)
+            if assets is not None:
+                products = assets.attach(products)
+            for product in products:
+                sink.write(product)
+        # 只有完整跑完才推进 sitemap 增量基准时间
+        state.set_meta("sitemap_last_run", started, commit=True)
+    finally:
+        if remote is not None:
+            remote.close()
+        if assets is not None:
+            assets.close()
+        state.close()
+        client.close()
+        write_metrics(args)
+    print_summary(args, sink.count, out_path)
+
+def cmd_crawl_delta(args, client, menu_rows, seeds, profile, default_out: str) -> None:
+    """增量模式：对照 --delta 产品库，只写出新增 / 变化 / 下架的产品（JSON Lines 变更记录）。"""
+    out_path = args.out or default_out
+    max_pages = profile.max_pages if profile is not None and profile.max_pages else args.pages
+    ensure_dir(args.state)
+    ensure_dir(args.delta)
+    state = CrawlState(args.state, resume=args.resume)
+    store = ProductStore(args.delta, resume=args.resume, removed_after=args.removed_after)
+    assets = AssetStore(args.assets, client, delay=args.asset_delay) if args.assets else None
+    sitemap_since = resolve_sitemap_since(args.sitemap_since, state)
+    started = datetime.now(timezone.utc).isoformat()
+    remote = None
+    try:
+        remote = start_coordinator(args, client.settings, profile)
+        with ChangeSink(out_path) as sink:
+            changes = iter_product_changes(client, seeds, store, max_pages=max_pages, state=state,
+                                           sitemap_since=sitemap_since, profile=profile,
+                                           listing_only=args.listing_only, remote=remote)
+            if assets is not None:
+                # 下架的产品不再下载图片
+                changes = assets.attach(changes, lambda c: c["product"] if c["change"] != "removed" else None)
+            for change in changes:
+                sink.write(change)
+        state.set_meta("sitemap_last_run", started, commit=True)
+    finally:
+        if remote is not None:
+            remote.close()
+        if assets is not None:
+            assets.close()
+        store.close()
+        state.close()
+        client.close()
+        write_metrics(args)
+    print("  " + ", ".join(f"{k}: {int(METRICS.counter_value('delta_products_total', result=k))}"
+                           for k in ("added", "changed", "removed", "unchanged", "missing")))
+    print_summary(args, sink.count, out_path, label="changes")
 
-    out_path = args.out or ("data/dopesnow_site_product.json" if args.format=="json" else "data/dopesnow_site_product.csv")
-    if args.format == "json":
-        write_site_json_single(out_path, menu_rows, products)
+def cmd_crawl_sites(args) -> None:
+    resolve_sitemap_since(args.sitemap_since)   # 各站点的 "last" 由 MultiSiteCrawler 按站点状态解析
+    profiles = load_profiles(args.profiles)
+    if not profiles:
+        raise SystemExit("no site profiles found")
+    settings = settings_from_args(args, profiles[0].base_url)
+    out_path = args.out or f"data/sites_product.{args.format}"
+    options = sink_options(args, SITE_CSV_FIELDNAMES)
+    print(f"Crawling {len(profiles)} sites, {args.parallel} at a time...")
+    with MultiSiteCrawler(profiles, settings, parallel=args.parallel, max_pages=args.pages,
+                          state_dir=args.state_dir, resume=args.resume,
+                          sitemap_since=args.sitemap_since, listing_only=args.listing_only) as crawler:
+        assets = AssetStore(args.assets, crawler.client, delay=args.asset_delay) if args.assets else None
+        try:
+            menu_rows = crawler.menus()
+            print(f"  menu: {len(menu_rows)} items")
+            # 所有站点写进同一个输出文件，每条记录带 site 字段
+            with open_sink(args.format, out_path, menu_rows, **options) as sink:
+                products = crawler.products()
+                if assets is not None:
+                    products = assets.attach(products)
+                for product in products:
+                    sink.write(product)
+        finally:
+            if assets is not None:
+                assets.close()
+            write_metrics(args)
+    for p in profiles:
+        err = crawler.errors.get(p.name)
+        print(f"  {p.name}: {crawler.counts[p.name]} products" + (f" (failed: {err!r})" if err else ""))
+    print_summary(args, sink.count, out_path)
+
+def cmd_worker(args) -> None:
+    settings = settings_from_args(args, "")
+    print(f"Working for {args.coordinator}...")
+    try:
+        n = run_worker(args.coordinator, settings, name=args.name, lease_size=args.lease_size, token=args.token)
+    except PermissionError as e:
+        raise SystemExit(str(e))
+    print(f"Done. Returned {n} results")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dopesnow crawler (single-file output, with category provenance)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("crawl")
+    p.add_argument("--base", default="https://www.dopesnow.com/", help="Base URL")
+    p.add_argument("--profile", default=None,
+                   help="Site profile JSON (base URL, domains, keyword tables, selectors); overrides --base")
+    p.add_argument("--seeds", default="", help="Comma-separated extra seed URLs")
+    p.add_argument("--state", default="data/crawl_state.sqlite", help="Checkpoint database (SQLite)")
+    p.add_argument("--delta", default=None, metavar="STORE",
+                   help="Delta mode: compare against this product store (SQLite, kept across runs) and write "
+                        "only added / changed / removed products as JSON Lines change records")
+    p.add_argument("--removed-after", type=int, default=3, metavar="N",
+                   help="Delta mode: report a product as removed once it has been missing from N consecutive "
+                        "complete runs (a 404/410 on its detail page removes it at once)")
+    p.add_argument("--serve", default=None, metavar="HOST:PORT",
+                   help="Coordinator mode: hand out fetch/parse tasks to `worker` processes on this address "
+                        "(host defaults to 127.0.0.1; frontier, provenance, output and checkpoints stay here; "
+                        "--concurrency is then the number of pages in flight across all workers, and --delay "
+                        "the per-host rate of the whole cluster)")
+    p.add_argument("--token", default=os.environ.get("CRAWL_TOKEN"),
+                   help="Coordinator mode: shared token workers must send (default: $CRAWL_TOKEN, else a random "
+                        "one that is printed)")
+    p.add_argument("--local-workers", type=int, default=0,
+                   help="Start this many worker processes on this machine (serves on 127.0.0.1 unless --serve)")
+    p.add_argument("--lease-seconds", type=float, default=120.0,
+                   help="Re-issue tasks a worker has not returned within this many seconds")
+    add_fetch_args(p)
+
+    p = sub.add_parser("crawl-sites", help="Crawl many stores in parallel from site profiles into one output")
+    p.add_argument("profiles", nargs="+", help="Site profile JSON files, or directories of them")
+    p.add_argument("--parallel", type=int, default=4, help="Sites crawled at the same time")
+    p.add_argument("--state-dir", default="data/sites_state", help="One checkpoint database per site in this directory")
+    add_fetch_args(p)
+
+    p = sub.add_parser("worker", help="Fetch and parse pages leased from a `crawl --serve` coordinator")
+    p.add_argument("coordinator", help="Coordinator URL, e.g. http://10.0.0.5:8700")
+    p.add_argument("--name", default=None, help="Worker name (default: host-pid)")
+    p.add_argument("--lease-size", type=int, default=0, help="Tasks leased per request (0 = 2 x --concurrency)")
+    p.add_argument("--token", default=os.environ.get("CRAWL_TOKEN"),
+                   help="Shared token printed by the coordinator (default: $CRAWL_TOKEN)")
+    add_client_args(p)
+    p.set_defaults(seen_filter=0, fast_parse=True)   # 由协调进程的 job 决定
+
+    args = parser.parse_args(argv)
+    if args.cmd == "crawl-sites":
+        cmd_crawl_sites(args)
+    elif args.cmd == "worker":
+        cmd_worker(args)
     else:
-        write_site_csv_single(out_path, menu_rows, products)
-    print(f"Done. Wrote -> {out_path}")
+        cmd_crawl(args)
 
 if __name__ == "__main__":
     main()
-
@@ -1,15 +1,30 @@
 # src/config.py
 
 from dataclasses import dataclass, field
-from typing import Set
+from typing import Optional, Set
 
 @dataclass
 class Settings:
     base_url:str=r"https://www.dopesnow.com/"
     user_agent: str =("Mozilla/5.0 (Windows NT 10.0; Win64; x64)")
-    timeout:int=20
+    timeout:float=20                   # 读取超时（秒）
+    connect_timeout:float=10.0         # 建连超时（秒）
     delay_seconds:float=0.01
     max_retries:int=3
     concurrence:int=1
+    burst:int=1                        # 每个 host 令牌桶允许的突发请求数
+    max_rate:Optional[float]=None      # 自适应限速的上限（次/秒）；None 表示不超过 1/delay_seconds
+    adaptive_rate:bool=True            # 按 429/5xx/延迟做 AIMD 调速
     output_file:str="./data/product.csv"
+    cache_dir:Optional[str]=None       # 磁盘响应缓存目录；None 表示不缓存
+    cache_max_age:float=0.0            # 缓存新鲜期（秒）：期内直接用缓存不发请求；0 表示总是发条件请求
+    backend:str="requests"            # HTTP 后端："requests"（线程池）/ "async"（httpx + asyncio）
+    max_connections:int=100            # async 后端连接池上限（同时也是 keep-alive 连接数上限）
+    http2:bool=False                   # async 后端启用 HTTP/2 多路复用（需要 h2）
+    parse_workers:int=0                # 解析进程数：0 = 在抓取线程内解析；<0 = 每核一个
+    seen_filter_capacity:int=0         # >0 时 frontier 用按此容量设计的 Bloom 过滤器代替精确 set
+    seen_filter_error:float=0.001      # Bloom 过滤器的目标误判率
+    fast_parse:bool=True               # 详情页先走 JSON-LD 快速路径（不建 DOM），字段不全再回退
+    stream_pages:bool=True             # 页面分块读取：先查 Content-Type / Content-Length，可提前停止读取
+    max_response_bytes:int=8*1024*1024 # 单个页面响应的字节上限（解压后）；0 表示不限
     allowed_domains: Set[str] = field(default_factory=lambda: {"www.dopesnow.com", "dopesnow.com"})
@@ -0,0 +1,419 @@
+# src/distributed.py
+import dataclasses, hmac, itertools, json, multiprocessing, os, socket, threading, time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import requests
+
+from config import Settings
+from httpclient import RateLimiter, create_client
+from metrics import METRICS, Histogram, failure_reason
+from parse import SiteRules, analyze_listing_page, analyze_product_page
+from parsepool import ParsePool
+from products import Duplicate, detail_fetches, listing_fetches, product_key, remember_listing
+
+# 多机分布式抓取：协调进程（crawl --serve）跑的仍是 _crawl —— frontier、产品来源（product_contexts）、分页、
+# 定稿、检查点与输出都只在它这里；每一轮要抓的列表页 / 详情 URL 放进租约表，经一个 HTTP 端点（JSON）交给
+# 工作进程（cli.py worker）。工作进程成批租用任务，抓取 + 解析后交回分析结果（详情链接 / 扩展链接 / 卡片 /
+# 分页，或产品字段），不定稿。租约到期还没交回（工作进程挂了、网络断了）的任务重新排队给别的工作进程；
+# 同一任务先交回的结果为准，迟到的重复结果直接丢弃，所以任务被执行两次也不影响输出。
+# 端点只认带共享令牌（TOKEN_HEADER）的请求。按 host 的限速在协调进程上统一计量：租出任务时在该 host 的令牌桶里
+# 预约发车时间，随任务交给工作进程（wait），工作进程到点才发请求；不论有多少工作进程，
+# 整个集群对同一站点的请求速率不超过协调进程的 --delay。
+LEASE_SECONDS = 120.0   # 租约时长；工作进程每次交回结果时顺延它手上其余任务的租约
+MAX_ATTEMPTS = 3        # 同一任务最多租出次数，之后记为失败（lease_expired）
+POLL_SECONDS = 1.0      # 工作进程无任务可租时的等待间隔；协调进程检查过期租约的间隔
+FLUSH_RESULTS = 16      # 工作进程每攒够这么多结果交回一次
+RPC_ATTEMPTS = 6        # 工作进程调用协调进程失败时的重试次数（退避 1, 2, 4 … 秒）；用尽即退出
+SCAN_BLOCKED = 64       # 租用时跳过限速中的任务最多这么多个（其它 host 的任务可以先租出）
+TOKEN_HEADER = "X-Crawl-Token"
+
+class RemoteFailure(Exception):
+    """任务在工作进程上抓取 / 解析失败，或租约多次过期；failure_reason 沿用工作进程给出的归类。"""
+
+    def __init__(self, reason: str, url: str):
+        super().__init__(f"{reason}: {url}")
+        self.remote_reason = reason
+
+def job_spec(settings: Settings, rules: Optional[SiteRules], listing_only: bool) -> Dict[str, Any]:
+    """工作进程需要与协调进程一致的部分：站点地址 / 域名、词表与选择器、解析方式。抓取参数各自由命令行给出。"""
+    return {"base_url": settings.base_url, "allowed_domains": sorted(settings.allowed_domains),
+            "rules": json.loads(rules.spec) if rules is not None else None,
+            "listing_only": listing_only, "fast_parse": settings.fast_parse}
+
+# —— 指标随结果交回：工作进程 drain() 出增量，协调进程 merge() ——
+def _metrics_to_json(counters: Dict, histograms: Dict) -> Dict[str, List]:
+    return {"counters": [[n, list(l), v] for (n, l), v in counters.items()],
+            "histograms": [[n, list(l), h.buckets, h.counts, h.sum, h.count] for (n, l), h in histograms.items()]}
+
+def _metrics_from_json(data: Dict[str, List]) -> Tuple[Dict, Dict]:
+    counters = {(n, tuple(tuple(kv) for kv in l)): v for n, l, v in data.get("counters", [])}
+    histograms = {}
+    for n, l, buckets, counts, total, count in data.get("histograms", []):
+        h = Histogram(buckets); h.counts = counts; h.sum = total; h.count = count
+        histograms[(n, tuple(tuple(kv) for kv in l))] = h
+    return counters, histograms
+
+class _Task:
+    __slots__ = ("id", "kind", "url", "owner", "expires", "attempts", "result")
+
+    def __init__(self, id: int, kind: str, url: str):
+        self.id, self.kind, self.url = id, kind, url
+        self.owner: Optional[str] = None
+        self.expires = 0.0
+        self.attempts = 0
+        self.result: Optional[Dict[str, Any]] = None
+
+class LeaseTable:
+    """协调进程内的任务表（线程安全：HTTP 处理线程租出 / 交回，抓取主线程放入 / 取走结果）。
+
+    任务按放入顺序租出；过期的租约在下一次租用或取结果时收回，重新排在队首。
+    给出 limiter 时按任务 URL 的 host 计量：只租出 POLL_SECONDS 之内轮得到发车的任务（附上到发车还要等的秒数），
+    其余留在队列里。
+    """
+
+    def __init__(self, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS,
+                 limiter: Optional[RateLimiter] = None):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.limiter = limiter
+        self._ids = itertools.count(1)
+        self._open: Dict[int, _Task] = {}     # 还没有结果的任务
+        self._pending: deque = deque()        # 待租出（可能含已有结果的任务，租出时跳过）
+        self._leased: Dict[int, _Task] = {}
+        self._finished: deque = deque()       # 有结果、等主线程取走
+        self._cond = threading.Condition()
+        self.closed = False
+        self.workers: Dict[str, float] = {}   # 工作进程 -> 最近一次联系的时间
+
+    def add(self, kind: str, urls: List[str]) -> List[int]:
+        with self._cond:
+            tasks = [_Task(next(self._ids), kind, u) for u in urls]
+            for t in tasks:
+                self._open[t.id] = t
+                self._pending.append(t)
+            return [t.id for t in tasks]
+
+    def _expire(self) -> None:
+        now = time.time()
+        for t in [t for t in self._leased.values() if t.expires <= now]:
+            del self._leased[t.id]
+            METRICS.inc("dist_leases_total", result="expired")
+            if t.attempts >= self.max_attempts:
+                del self._open[t.id]
+                t.result = {"id": t.id, "error": "lease_expired"}
+                self._finished.append(t)
+                self._cond.notify_all()
+            else:
+                self._pending.appendleft(t)
+
+    def lease(self, owner: str, n: int) -> List[Dict[str, Any]]:
+        with self._cond:
+            now = time.time()
+            self.workers[owner] = now
+            self._expire()
+            out = []
+            held: List[_Task] = []   # 所在 host 限速中、留在队首的任务
+            while self._pending and len(out) < n and len(held) < SCAN_BLOCKED and not self.closed:
+                t = self._pending.popleft()
+                if t.id not in self._open:
+                    continue
+                wait = self.limiter.try_reserve(t.url, POLL_SECONDS) if self.limiter is not None else 0.0
+                if wait is None:
+                    held.append(t)
+                    continue
+                t.owner, t.expires = owner, now + self.lease_seconds
+                t.attempts += 1
+                self._leased[t.id] = t
+                out.append({"id": t.id, "kind": t.kind, "url": t.url, "wait": round(wait, 3)})
+            self._pending.extendleft(reversed(held))
+            if held:
+                METRICS.inc("dist_leases_total", len(held), result="rate_limited")
+            if out:
+                METRICS.inc("dist_leases_total", len(out), result="granted")
+            return out
+
+    def complete(self, owner: str, results: List[Dict[str, Any]]) -> int:
+        """收下交回的结果，返回采纳的条数；已有结果的任务（租约过期后别人先交了）丢弃。"""
+        with self._cond:
+            now = time.time()
+            self.workers[owner] = now
+            accepted = 0
+            for r in results:
+                t = self._open.pop(r["id"], None)
+                if t is None:
+                    METRICS.inc("dist_results_total", result="stale")
+                    continue
+                self._leased.pop(t.id, None)
+                t.result = r
+                self._finished.append(t)
+                accepted += 1
+            # 交回即续租：同一工作进程手上其余的任务顺延
+            for t in self._leased.values():
+                if t.owner == owner:
+                    t.expires = now + self.lease_seconds
+            if accepted:
+                self._cond.notify_all()
+            return accepted
+
+    def take(self, timeout: float = POLL_SECONDS) -> List[_Task]:
+        """取走已有结果的任务；没有时至多等待 timeout 秒（期间顺带收回过期租约）。"""
+        with self._cond:
+            if not self._finished:
+                self._cond.wait(timeout)
+            self._expire()
+            out = list(self._finished)
+            self._finished.clear()
+            return out
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+class _Handler(BaseHTTPRequestHandler):
+    # GET /job -> job_spec；POST /lease {"worker", "n"} -> {"tasks", "done"}；
+    # POST /complete {"worker", "results", "metrics"} -> {"accepted"}
+    def log_message(self, *args) -> None:
+        pass
+
+    def _reply(self, obj: Any, status: int = 200) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        token = self.server.coordinator.token
+        if token is None or hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), token):
+            return True
+        METRICS.inc("dist_requests_total", result="forbidden")
+        self._reply({"error": "forbidden"}, 403)
+        return False
+
+    def do_GET(self) -> None:
+        if not self._authorized():
+            return
+        if self.path == "/job":
+            self._reply(self.server.coordinator.job)
+        else:
+            self._reply({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        coord: Coordinator = self.server.coordinator
+        if not self._authorized():
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            worker = str(body["worker"])
+        except (ValueError, KeyError) as e:
+            self._reply({"error": f"bad request: {e}"}, 400)
+            return
+        if self.path == "/lease":
+            tasks = coord.table.lease(worker, max(1, int(body.get("n", 1))))
+            if coord.table.closed:
+                coord.released.add(worker)
+            self._reply({"tasks": tasks, "done": coord.table.closed})
+        elif self.path == "/complete":
+            if body.get("metrics"):
+                METRICS.merge(*_metrics_from_json(body["metrics"]))
+            self._reply({"accepted": coord.table.complete(worker, body.get("results", []))})
+        else:
+            self._reply({"error": "not found"}, 404)
+
+class Coordinator:
+    """租约表 + HTTP 端点；作为 iter_products(remote=...) 传入，代替本进程的抓取与解析。
+
+    listing() 按批次顺序产出列表页分析结果（与 _crawl 本地路径的形状相同），details() 按完成顺序产出产品字段。
+    start_local(n) 在本机再起 n 个工作进程（测试 / 单机多进程用）。
+    token 非空时端点只接受带该令牌的请求；limiter 给出时按 host 计量租出速率（见 LeaseTable）。
+    """
+
+    def __init__(self, job: Dict[str, Any], host: str = "127.0.0.1", port: int = 0,
+                 lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS,
+                 token: Optional[str] = None, limiter: Optional[RateLimiter] = None):
+        self.job = job
+        self.token = token
+        self.table = LeaseTable(lease_seconds, max_attempts, limiter)
+        self.released: Set[str] = set()   # 已被告知结束的工作进程
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+        self._thread = threading.Thread(target=self.server.serve_forever, name="coordinator", daemon=True)
+        self._procs: List[multiprocessing.Process] = []
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        if host in ("0.0.0.0", ""):
+            host = socket.gethostname()
+        return f"http://{host}:{port}"
+
+    def start(self) -> "Coordinator":
+        self._thread.start()
+        return self
+
+    def start_local(self, n: int, settings: Settings) -> None:
+        # spawn：本进程已有 HTTP / 事件循环线程，fork 出的子进程可能继承到被持有的锁
+        ctx = multiprocessing.get_context("spawn")
+        for i in range(n):
+            p = ctx.Process(target=run_worker, args=(self.url, settings),
+                            kwargs={"name": f"local-{i + 1}", "token": self.token}, name=f"worker-{i + 1}")
+            p.start()
+            self._procs.append(p)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _result(self, t: _Task) -> Any:
+        r = t.result
+        if "error" in r:
+            METRICS.inc("dist_tasks_total", kind=t.kind, result="failed")
+            return RemoteFailure(r["error"], t.url)
+        METRICS.inc("dist_tasks_total", kind=t.kind, result="ok")
+        if "duplicate" in r:
+            return Duplicate(r["duplicate"])
+        return r["page"]
+
+    def listing(self, batch: List[str]) -> Iterator[Tuple[Tuple[str, None], Any]]:
+        """一批列表页：按 batch 顺序产出 ((url, None), 分析结果或异常)；前面的页到齐即产出，不等整批。"""
+        ids = self.table.add("page", batch)
+        done: Dict[int, _Task] = {}
+        for i, url in zip(ids, batch):
+            while i not in done:
+                done.update((t.id, t) for t in self.table.take())
+            yield (url, None), self._result(done.pop(i))
+
+    def details(self, urls: List[str]) -> Iterator[Tuple[str, Any]]:
+        """详情页：按完成顺序产出 (url, 产品字段 / Duplicate / 异常)。"""
+        remaining = len(self.table.add("detail", urls))
+        while remaining:
+            for t in self.table.take():
+                remaining -= 1
+                yield t.url, self._result(t)
+
+    def close(self, grace: float = 3 * POLL_SECONDS + 2) -> None:
+        """通知工作进程结束：等仍在联系的工作进程都收到 done（至多 grace 秒）再关闭端点。"""
+        self.table.close()
+        deadline = time.time() + grace
+        while time.time() < deadline:
+            active = {w for w, t in self.table.workers.items() if time.time() - t < grace}
+            if active <= self.released:
+                break
+            time.sleep(0.1)
+        for p in self._procs:
+            p.join(timeout=max(0.0, deadline - time.time()) + 5)
+            if p.is_alive():
+                p.terminate()
+        self.server.shutdown()
+        self.server.server_close()
+
+# —— 工作进程 ——
+def _rpc(session: requests.Session, method: str, url: str, payload: Optional[Dict] = None,
+         timeout: float = 30.0) -> Dict[str, Any]:
+    for attempt in range(RPC_ATTEMPTS):
+        try:
+            r = session.request(method, url, json=payload, timeout=timeout)
+            r.raise_for_status()
+            return r.json()
+        except requests.RequestException as e:
+            status = getattr(e.response, "status_code", None)
+            if attempt == RPC_ATTEMPTS - 1 or (status is not None and status < 500):
+                raise   # 4xx（令牌不对 / 请求有误）重试也没用
+            time.sleep(2 ** attempt)
+
+def _paced(tasks: List[Dict[str, Any]], t0: float) -> Iterator[str]:
+    """按协调进程预约的发车时间（租到时 t0 + wait）依次给出 URL；抓取池拿到 URL 即发请求。"""
+    for t in tasks:
+        delay = t0 + t.get("wait", 0.0) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        yield t["url"]
+
+def run_worker(coordinator: str, settings: Settings, name: Optional[str] = None,
+               lease_size: Optional[int] = None, token: Optional[str] = None) -> int:
+    """工作进程主循环：租任务 → 抓取 + 解析 → 交回，直到协调进程宣布结束（或联系不上）；返回交回的结果数。
+
+    抓取参数（并发 / 限速 / 后端 / 缓存 / 解析进程）取自 settings；站点与解析方式取自协调进程的 job。
+    集群对同一站点的总速率由协调进程按 host 计量租约来保证，本进程的限速器只管本进程内的间隔。
+    协调进程拒绝令牌时抛 PermissionError。
+    """
+    coordinator = coordinator.rstrip("/")
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    session = requests.Session()
+    if token:
+        session.headers[TOKEN_HEADER] = token
+    try:
+        job = _rpc(session, "GET", f"{coordinator}/job")
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 403:
+            raise PermissionError(f"{coordinator} rejected the worker token") from e
+        raise
+    rules = SiteRules(**job["rules"]) if job["rules"] else None
+    settings = dataclasses.replace(settings, base_url=job["base_url"], allowed_domains=set(job["allowed_domains"]),
+                                   fast_parse=job["fast_parse"])
+    client = create_client(settings)
+    workers = max(1, settings.concurrence)
+    lease_size = max(1, lease_size or 2 * workers)
+    cache: "OrderedDict[bytes, Dict]" = OrderedDict()   # 本进程内的列表页正文去重
+    emitted: Set[str] = set()   # 本进程解析出的产品键：同一 canonical 的变体只交回 Duplicate
+    out: List[Dict[str, Any]] = []
+    sent = 0
+
+    def flush(force: bool = False) -> None:
+        nonlocal sent
+        if out and (force or len(out) >= FLUSH_RESULTS):
+            payload = {"worker": name, "results": list(out), "metrics": _metrics_to_json(*METRICS.drain())}
+            _rpc(session, "POST", f"{coordinator}/complete", payload)
+            sent += len(out)
+            out.clear()
+
+    try:
+        with ParsePool(settings.parse_workers) as pool:
+            while True:
+                try:
+                    reply = _rpc(session, "POST", f"{coordinator}/lease", {"worker": name, "n": lease_size})
+                    leased_at = time.monotonic()
+                except requests.RequestException:
+                    break   # 协调进程已退出；手上没有未交回的任务
+                if reply["done"]:
+                    break
+                if not reply["tasks"]:
+                    time.sleep(POLL_SECONDS)
+                    continue
+                for kind in ("page", "detail"):
+                    leased = [t for t in reply["tasks"] if t["kind"] == kind]
+                    if not leased:
+                        continue
+                    ids = {t["url"]: t["id"] for t in leased}
+                    urls = _paced(leased, leased_at)
+                    if kind == "page":
+                        tasks = listing_fetches(client, urls, workers, rules, job["listing_only"], cache)
+                        for (url, digest), page in pool.map(analyze_listing_page, tasks):
+                            if isinstance(page, Exception):
+                                out.append({"id": ids[url], "error": failure_reason(page)})
+                            else:
+                                remember_listing(cache, digest, page)
+                                out.append({"id": ids[url], "page": page})
+                            flush()
+                    else:
+                        tasks = detail_fetches(client, urls, workers, rules, settings.fast_parse, emitted)
+                        for purl, pdata in pool.map(analyze_product_page, tasks):
+                            if isinstance(pdata, Exception):
+                                out.append({"id": ids[purl], "error": failure_reason(pdata)})
+                            elif isinstance(pdata, Duplicate):
+                                out.append({"id": ids[purl], "duplicate": pdata.key})
+                            else:
+                                if pdata.get("name") or pdata.get("price") is not None:
+                                    emitted.add(product_key(pdata))
+                                out.append({"id": ids[purl], "page": pdata})
+                            flush()
+                flush(force=True)
+    finally:
+        client.close()
+    return sent
@@ -0,0 +1,95 @@
+# src/frontier.py
+import heapq, itertools
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from parse import DEFAULT_RULES, SiteRules
+
+# —— 调度优先级（数值越小越先抓）——
+PRIORITY_PAGINATION = 0   # ?page=N 分页：同一列表的后续页，产出详情链接最密集
+PRIORITY_LISTING = 1      # 看起来是 men/women + 类目的列表页
+PRIORITY_LINK = 2         # 其它种子 / 扩展链接
+PRIORITY_SITEMAP = 3      # sitemap 里的非列表 URL（多为详情页），预算最后才轮到
+
+# source 取值："seed" / "link" / "page"（按页码直接排期的分页）/ "sitemap"
+PriorityFn = Callable[[str, str], int]
+
+MAX_REQUEUES = 2   # 抓取失败的页面最多重新入队几次
+
+def _priority(url: str, source: str, rules: SiteRules) -> int:
+    low = url.lower()
+    if source == "page" or "page=" in low:
+        return PRIORITY_PAGINATION
+    if rules.looks_like_listing(url, ""):
+        return PRIORITY_LISTING
+    return PRIORITY_SITEMAP if source == "sitemap" else PRIORITY_LINK
+
+def default_priority(url: str, source: str = "link") -> int:
+    return _priority(url, source, DEFAULT_RULES)
+
+def site_priority(rules: SiteRules) -> PriorityFn:
+    """与 default_priority 相同的分级，列表页按该站点自己的词表判断。"""
+    return lambda url, source="link": _priority(url, source, rules)
+
+def fifo_priority(url: str, source: str = "link") -> int:
+    """退化为纯 BFS（入队顺序），用于对比或需要旧行为时。"""
+    return 0
+
+class Frontier:
+    """待抓队列：入队即去重（见过的 URL 不再入队），二叉堆按 (优先级, 入队序号) 出队。
+
+    push / pop 均为 O(log n)；同优先级内保持 FIFO，结果可复现。
+    seen 可传入任何支持 add / update / in 的集合（如 urltable.BloomFilter），默认是精确的 set。
+    抓取失败的 URL 已记为见过，用 requeue() 重新入队（每个 URL 至多 max_requeues 次）。
+    """
+
+    def __init__(self, priority: Optional[PriorityFn] = None, seen=None, max_requeues: int = MAX_REQUEUES):
+        self.priority = priority or default_priority
+        self.max_requeues = max_requeues
+        self._heap: List[Tuple[int, int, str, str]] = []
+        self._seq = itertools.count()
+        self._seen = set() if seen is None else seen
+        self._requeued: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __bool__(self) -> bool:
+        return bool(self._heap)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._seen
+
+    def mark_seen(self, urls: Iterable[str]) -> None:
+        """把已抓取的 URL 标记为见过（恢复检查点时用），之后不会再入队。"""
+        self._seen.update(urls)
+
+    def push(self, url: str, source: str = "link") -> bool:
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        heapq.heappush(self._heap, (self.priority(url, source), next(self._seq), url, source))
+        return True
+
+    def requeue(self, url: str, source: str = "link") -> bool:
+        """抓取失败的 URL 重新入队（排在同优先级的队尾）；已重试 max_requeues 次的返回 False。"""
+        n = self._requeued.get(url, 0)
+        if n >= self.max_requeues:
+            return False
+        self._requeued[url] = n + 1
+        heapq.heappush(self._heap, (self.priority(url, source), next(self._seq), url, source))
+        return True
+
+    def extend(self, urls: Iterable[str], source: str = "link") -> int:
+        return sum(1 for u in urls if self.push(u, source))
+
+    def pop(self) -> str:
+        return heapq.heappop(self._heap)[2]
+
+    def pop_item(self) -> Tuple[str, str]:
+        """出队 (url, source)。"""
+        _, _, url, source = heapq.heappop(self._heap)
+        return url, source
+
+    def pending(self) -> List[Tuple[str, str]]:
+        """按出队顺序列出尚未抓取的 (url, source)（检查点快照用）。"""
+        return [(u, src) for _, _, u, src in sorted(self._heap)]
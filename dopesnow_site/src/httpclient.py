@@ -1,23 +1,248 @@
-import time, threading
+import copy, time, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
 import requests
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from tenacity import retry, wait_exponential, retry_if_exception
 from urllib.parse import urlparse
 from urllib import robotparser
 from config import Settings
+from cache import ResponseCache
+from metrics import METRICS, BYTES_BUCKETS, failure_reason
 
 
+class TokenBucket:
+    """单个 host 的令牌桶（GCRA 实现）：平均 rate 次/秒，允许 burst 次突发。
+
+    reserve() 只在锁内计算并预约发车时间，睡眠在锁外进行，等待者之间互不阻塞。
+    """
+
+    def __init__(self, rate:float, burst:int=1, min_rate:float=0.0, max_rate:Optional[float]=None):
+        self.rate=rate
+        self.burst=max(1, burst)
+        self.min_rate=min_rate
+        self.max_rate=rate if max_rate is None else max_rate
+        self.blocked_until=0.0
+        self.latency_ewma:Optional[float]=None
+        self.latency_floor:Optional[float]=None
+        self._tat=0.0           # theoretical arrival time
+        self._lock=threading.Lock()
+
+    @property
+    def interval(self)->float:
+        return 1.0/self.rate if self.rate>0 and self.rate!=float("inf") else 0.0
+
+    def reserve(self)->float:
+        """预约一个令牌，返回调用方需要睡眠的秒数。"""
+        with self._lock:
+            now=time.monotonic()
+            start=max(now, self.blocked_until)
+            tat=max(self._tat, start)
+            allowed_at=max(start, tat-(self.burst-1)*self.interval)
+            self._tat=tat+self.interval
+            return allowed_at-now
+
+    def try_reserve(self, horizon:float=0.0)->Optional[float]:
+        """发车时间在 horizon 秒之内时预约并返回需等待的秒数；否则不预约，返回 None（调用方稍后再试）。"""
+        with self._lock:
+            now=time.monotonic()
+            start=max(now, self.blocked_until)
+            tat=max(self._tat, start)
+            allowed_at=max(start, tat-(self.burst-1)*self.interval)
+            if allowed_at-now>horizon:
+                return None
+            self._tat=tat+self.interval
+            return allowed_at-now
+
+    def pause(self, seconds:float)->None:
+        """Retry-After：整个 host 暂停 seconds 秒，之后不突发、按当前速率恢复。"""
+        with self._lock:
+            until=time.monotonic()+seconds
+            if until>self.blocked_until:
+                self.blocked_until=until
+                self._tat=max(self._tat, until+(self.burst-1)*self.interval)
+
+    def feedback(self, status:Optional[int], latency:Optional[float],
+                 increase:float=0.1, decrease:float=0.5)->None:
+        """AIMD：成功加性升速（不超过 max_rate），429/5xx/超时或延迟明显升高时乘性降速。"""
+        with self._lock:
+            if self.rate==float("inf"):
+                return
+            congested=status is None or status==429 or status>=500
+            if latency is not None and not congested:
+                self.latency_ewma=latency if self.latency_ewma is None else 0.8*self.latency_ewma+0.2*latency
+                self.latency_floor=self.latency_ewma if self.latency_floor is None else min(self.latency_floor, self.latency_ewma)
+                # 平滑延迟超过历史最低水平的 3 倍：服务端开始吃力，轻度降速
+                if self.latency_ewma>3*self.latency_floor and self.latency_floor>0:
+                    self.rate=max(self.min_rate, self.rate*0.9)
+                    return
+            if congested:
+                self.rate=max(self.min_rate, self.rate*decrease)
+            else:
+                self.rate=min(self.max_rate, self.rate+increase*self.max_rate)
+
 class RateLimiter:
-    def __init__(self, delay:float):
+    """按 host 分桶的自适应限速器。delay 给出初始间隔（rate=1/delay）；delay<=0 表示不限速，只遵守 Retry-After。"""
+
+    def __init__(self, delay:float, burst:int=1, max_rate:Optional[float]=None, adaptive:bool=True):
         self.delay=delay
+        self.burst=burst
+        self.rate=1.0/delay if delay>0 else float("inf")
+        self.max_rate=max(self.rate, max_rate) if max_rate else self.rate
+        self.adaptive=adaptive
+        self._buckets:Dict[str, TokenBucket]={}
         self._lock=threading.Lock()
-        self._last=0.0
-    def wait(self):
+
+    def bucket(self, url:str="")->TokenBucket:
+        host=urlparse(url).netloc.lower()
         with self._lock:
-            now=time.time()
-            sleep=max(0.0, self._last+self.delay-now)
-            if sleep>0: time.sleep(sleep)
-            self._last=time.time()
-    
+            b=self._buckets.get(host)
+            if b is None:
+                b=self._buckets[host]=TokenBucket(self.rate, self.burst, min_rate=self.rate/20, max_rate=self.max_rate)
+            return b
+
+    def configure(self, host:str, delay:Optional[float]=None, burst:Optional[int]=None,
+                  max_rate:Optional[float]=None, replace:bool=True)->bool:
+        """为单个 host 设定自己的速率（多站点抓取时每个站点各一份）；未给出的参数沿用全局值。
+
+        replace=False 时该 host 已有令牌桶（已按页面速率在用）就保持不变，返回 False。
+        """
+        rate=self.rate if delay is None else (1.0/delay if delay>0 else float("inf"))
+        burst=self.burst if burst is None else burst
+        max_rate=max(rate, max_rate) if max_rate else (self.max_rate if delay is None else rate)
+        with self._lock:
+            if not replace and host.lower() in self._buckets:
+                return False
+            self._buckets[host.lower()]=TokenBucket(rate, burst, min_rate=rate/20, max_rate=max_rate)
+            return True
+
+    def reserve(self, url:str="")->float:
+        """预约该 host 的下一个发车时间，返回需等待的秒数（不睡眠，同步 / 异步调用方各自等待）。"""
+        sleep=max(0.0, self.bucket(url).reserve())
+        METRICS.observe("ratelimit_wait_seconds", sleep)
+        return sleep
+
+    def try_reserve(self, url:str="", horizon:float=0.0)->Optional[float]:
+        return self.bucket(url).try_reserve(horizon)
+
+    def wait(self, url:str="")->float:
+        sleep=self.reserve(url)
+        if sleep>0: time.sleep(sleep)
+        return sleep
+
+    def feedback(self, url:str, status:Optional[int], latency:Optional[float]=None,
+                 retry_after:Optional[float]=None)->None:
+        b=self.bucket(url)
+        if retry_after is not None:
+            b.pause(retry_after)
+        if self.adaptive:
+            b.feedback(status, latency)
+
+def parse_retry_after(value:Optional[str], cap:float=300.0)->Optional[float]:
+    """Retry-After 支持秒数与 HTTP 日期两种写法。"""
+    if not value:
+        return None
+    value=value.strip()
+    try:
+        secs=float(value)
+    except ValueError:
+        try:
+            secs=(parsedate_to_datetime(value)-datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(cap, max(0.0, secs))
+
+RETRY_STATUS={429, 500, 502, 503, 504}
+
+# —— 页面的流式读取：先看响应头（类型 / 长度），再分块读正文；字节上限与提前停止 ——
+HTML_TYPES=("text/html", "application/xhtml+xml")
+CHUNK_SIZE=16*1024
+# 提前停止后剩余未读的字节不多时读完丢弃，保住 keep-alive 连接（断开重连比多读几十 KB 更贵）
+DRAIN_BYTES=64*1024
+# until(url, 已读字节（bytearray，勿保留引用）, 上次调用时已读的字节数) -> 可以停止读取的位置（正文截到这里）或 None（继续读）
+# 每读一块调用一次：之前的字节已检查过，只需看新读到的部分，避免每块都重扫整个正文
+StopFn=Callable[[str, bytearray, int], Optional[int]]
+
+class UnwantedContentType(requests.RequestException):
+    """Content-Type 不是 HTML（PDF / 图片等）：不读正文、不重试。"""
+
+class ResponseTooLarge(requests.RequestException):
+    """Content-Length 或已读字节超过 max_response_bytes：放弃该响应、不重试。"""
+
+class PageReader:
+    """逐块接收正文（gzip 等传输编码已由 HTTP 库逐块解开），同步与异步后端共用。
+
+    feed() 返回 True 表示可以停止读取：until 给出了截断位置，之后的字节不再下载。
+    """
+
+    def __init__(self, url:str, resp:requests.Response, cap:int, until:Optional[StopFn]=None):
+        self.url=url
+        self.resp=resp
+        self.cap=cap
+        self.until=until
+        self.buf=bytearray()
+        self.checked=0   # 上次调用 until 时已读的字节数
+        self.cut:Optional[int]=None
+        ctype=resp.headers.get("Content-Type", "")
+        if ctype and ctype.split(";")[0].strip().lower() not in HTML_TYPES:
+            METRICS.inc("http_page_reads_total", result="content_type")
+            raise UnwantedContentType(f"{ctype}: {url}", response=resp)
+        length=resp.headers.get("Content-Length", "")
+        if cap and length.isdigit() and int(length)>cap:
+            METRICS.inc("http_page_reads_total", result="too_large")
+            raise ResponseTooLarge(f"Content-Length {length} > {cap}: {url}", response=resp)
+
+    def feed(self, chunk:bytes)->bool:
+        self.append(chunk)
+        return self.check()
+
+    def append(self, chunk:bytes)->None:
+        self.buf+=chunk
+        if self.cap and len(self.buf)>self.cap:
+            METRICS.inc("http_page_reads_total", result="too_large")
+            raise ResponseTooLarge(f"more than {self.cap} bytes: {self.url}", response=self.resp)
+
+    def check(self)->bool:
+        """调用 until 看新读到的部分够不够用（异步后端在线程里调用，不占事件循环）。"""
+        if self.until is not None and self.cut is None:
+            self.cut=self.until(self.url, self.buf, self.checked)
+            self.checked=len(self.buf)
+        return self.cut is not None
+
+    def finish(self)->requests.Response:
+        body=bytes(self.buf if self.cut is None else self.buf[:self.cut])
+        self.resp._content=body
+        self.resp._content_consumed=True
+        self.resp.partial=self.cut is not None
+        METRICS.inc("http_page_reads_total", result="partial" if self.resp.partial else "full")
+        METRICS.inc("http_bytes_total", len(self.buf))
+        METRICS.observe("http_response_bytes", len(self.buf), buckets=BYTES_BUCKETS)
+        return self.resp
+
+def _retryable(exc:BaseException)->bool:
+    # 4xx（除 429）重试也不会变，直接失败
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+def _wait_backoff(retry_state)->float:
+    # 服务端给了 Retry-After：限速器已暂停该 host，这里不再叠加退避
+    exc=retry_state.outcome.exception()
+    if isinstance(exc, requests.HTTPError) and exc.response is not None \
+            and parse_retry_after(exc.response.headers.get("Retry-After")) is not None:
+        return 0.0
+    return wait_exponential(multiplier=1, min=1, max=16)(retry_state)
+
+def _count_retry(retry_state)->None:
+    METRICS.inc("http_retries_total", reason=failure_reason(retry_state.outcome.exception()))
+
+def _stop_after_settings(retry_state)->bool:
+    client=retry_state.args[0]
+    return retry_state.attempt_number>=max(1, client.settings.max_retries)
+
 class Robots:
     def __init__(self, base_url:str,user_agent:str):
         self.robotparser=robotparser.RobotFileParser()
@@ -41,9 +266,16 @@ class HttpClient:
     def __init__(self, settings:Settings):
         self.session=requests.Session()
         self.session.headers.update({"User-Agent":settings.user_agent})
-        self.timeout=settings.timeout
-        self.ratelimiter=RateLimiter(settings.delay_seconds)
+        # 连接池至少容纳全部并发 worker，避免 urllib3 丢弃连接
+        pool=max(10, settings.concurrence)
+        adapter=HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.timeout=(settings.connect_timeout, settings.timeout)   # (连接, 读取)
+        self.ratelimiter=RateLimiter(settings.delay_seconds, burst=settings.burst,
+                                     max_rate=settings.max_rate, adaptive=settings.adaptive_rate)
         self.robots=Robots(settings.base_url, settings.user_agent)
+        self.cache=ResponseCache(settings.cache_dir) if settings.cache_dir else None
         self.settings=settings
 
     def same_domain(self, url:str)->bool:
@@ -51,20 +283,163 @@ class HttpClient:
         return (netloc.split(":")[0] in self.settings.allowed_domains)
     
     @retry(reraise=True,
-           retry=retry_if_exception_type((requests.RequestException,)),
-           wait=wait_exponential(multiplier=1, min=1, max=16),
-           stop=stop_after_attempt(3)
+           retry=retry_if_exception(_retryable),
+           wait=_wait_backoff,
+           stop=_stop_after_settings,
+           before_sleep=_count_retry,
            )
-    
-    def get(self, url:str) ->requests.Response:
+    def get(self, url:str, stream:bool=False) ->requests.Response:
         # if not self.same_domain(url):
         #     raise requests.RequestException(f"Blocked cross-domain: {url}")
         
         # if not self.robots.allowed(url):
         #     raise requests.RequestException(f"Disallowed by robots.txt: {url}")
         
-        self.ratelimiter.wait()
-        request = self.session.get(url, timeout=self.timeout)
+        # 缓存：新鲜期内直接返回；否则带 If-None-Match / If-Modified-Since 发条件请求，304 时复用缓存正文
+        # stream=True 时正文由调用方边读边处理（调用方负责 close），不经过缓存
+        cached, hit = self._lookup(url, stream)
+        if hit is not None:
+            return hit
+
+        self.ratelimiter.wait(url)
+        t0 = time.monotonic()
+        try:
+            request = self.session.get(url, timeout=self.timeout, stream=stream,
+                                       headers=cached.validators() if cached is not None else None)
+        except requests.RequestException as e:
+            self._failed(url, e)
+            raise
+        return self._finish(url, request, cached, time.monotonic()-t0, stream)
+
+    @retry(reraise=True,
+           retry=retry_if_exception(_retryable),
+           wait=_wait_backoff,
+           stop=_stop_after_settings,
+           before_sleep=_count_retry,
+           )
+    def get_page(self, url:str, until:Optional[StopFn]=None) ->requests.Response:
+        """抓取 HTML 页面：读正文之前按 Content-Type / Content-Length 放弃非 HTML 与超过 max_response_bytes 的响应，
+        正文分块读取；until 给出截断位置时立即断开，不再下载剩余部分（resp.partial=True，不写缓存）。"""
+        cached, hit = self._lookup(url, False)
+        if hit is not None:
+            return hit
+
+        self.ratelimiter.wait(url)
+        t0 = time.monotonic()
+        try:
+            request = self.session.get(url, timeout=self.timeout, stream=True,
+                                       headers=cached.validators() if cached is not None else None)
+        except requests.RequestException as e:
+            self._failed(url, e)
+            raise
+        resp = self._finish(url, request, cached, time.monotonic()-t0, True)
+        if resp is not request:   # 304：缓存里的完整正文
+            return resp
+        try:
+            reader = PageReader(url, request, self.settings.max_response_bytes, until)
+            chunks = request.iter_content(CHUNK_SIZE)
+            for chunk in chunks:
+                if reader.feed(chunk):
+                    left = getattr(request.raw, "length_remaining", None)
+                    if left is not None and left <= DRAIN_BYTES:
+                        for _ in chunks:
+                            pass
+                    break
+        except requests.RequestException as e:
+            if not isinstance(e, (UnwantedContentType, ResponseTooLarge)):
+                self._failed(url, e)
+            raise
+        finally:
+            request.close()
+        return self._store_page(url, reader.finish())
+
+    def _store_page(self, url:str, resp:requests.Response)->requests.Response:
+        # 截断的正文不能当作完整页面缓存
+        if self.cache is not None and not resp.partial:
+            METRICS.inc("http_cache_total", result="miss")
+            self.cache.store(url, resp)
+        return resp
+
+    # —— get 的前后处理（缓存 / 限速反馈 / 指标），同步与异步后端共用 ——
+    def _lookup(self, url:str, stream:bool):
+        """返回 (缓存条目, 可直接返回的新鲜响应)。"""
+        cached = self.cache.load(url) if self.cache and not stream else None
+        if cached is not None and cached.fresh(self.settings.cache_max_age):
+            METRICS.inc("http_cache_total", result="fresh")
+            return cached, cached.response()
+        return cached, None
+
+    def _failed(self, url:str, exc:Exception)->None:
+        self.ratelimiter.feedback(url, None)
+        METRICS.inc("http_errors_total", reason=failure_reason(exc))
+
+    def _finish(self, url:str, request:requests.Response, cached, latency:float, stream:bool)->requests.Response:
+        METRICS.observe("http_request_seconds", latency)
+        METRICS.inc("http_responses_total", status=request.status_code)
+        self.ratelimiter.feedback(url, request.status_code, latency,
+                                  parse_retry_after(request.headers.get("Retry-After"))
+                                  if request.status_code in (429, 503) else None)
+        if request.status_code == 304 and cached is not None:
+            METRICS.inc("http_cache_total", result="revalidated")
+            self.cache.touch(cached, request)
+            return cached.response()
+        if stream and request.status_code >= 400:
+            request.close()
         request.raise_for_status()
+        if not stream:
+            # 流式响应的字节数由调用方读取，这里只统计一次性下载的正文
+            METRICS.inc("http_bytes_total", len(request.content))
+            METRICS.observe("http_response_bytes", len(request.content), buckets=BYTES_BUCKETS)
+        if self.cache is not None and not stream:
+            METRICS.inc("http_cache_total", result="miss")
+            self.cache.store(url, request)
         return request
 
+    def scoped(self, settings:Settings)->"HttpClient":
+        """共享连接池 / 限速器 / 缓存、只换 settings（base_url、并发度等）的视图，多站点抓取时每站一个。
+
+        视图不单独关闭：抓取结束后关闭原客户端即可。
+        """
+        view=copy.copy(self)
+        view.settings=settings
+        view.robots=Robots(settings.base_url, settings.user_agent)
+        return view
+
+    def close(self)->None:
+        self.session.close()
+
+    def fetch_many(self, urls:Iterable[str], workers:Optional[int]=None,
+                   until:Optional[StopFn]=None) -> Iterator[Tuple[str, Union[requests.Response, Exception]]]:
+        """并发抓取一批页面，按输入顺序产出 (url, 响应或异常)；在途请求不超过 2*workers。
+
+        settings.stream_pages 为真时走 get_page（非 HTML / 超大响应直接放弃，until 可提前停止读取），否则整页 get。
+        """
+        workers=max(1, workers or self.settings.concurrence)
+
+        def fetch(u:str):
+            try:
+                return self.get_page(u, until) if self.settings.stream_pages else self.get(u)
+            except Exception as e:
+                return e
+
+        if workers==1:
+            for u in urls:
+                yield u, fetch(u)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending=deque()
+            for u in urls:
+                pending.append((u, pool.submit(fetch, u)))
+                if len(pending)>=workers*2:
+                    u0, fut=pending.popleft()
+                    yield u0, fut.result()
+            while pending:
+                u0, fut=pending.popleft()
+                yield u0, fut.result()
+
+def create_client(settings:Settings)->HttpClient:
+    """按 settings.backend 选择实现："requests"（线程池）或 "async"（httpx + asyncio，可选依赖）。"""
+    if settings.backend=="async":
+        from asyncclient import AsyncHttpClient
+        return AsyncHttpClient(settings)
+    return HttpClient(settings)
@@ -0,0 +1,54 @@
+# src/keywords.py
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable
+
+# 多组关键词的子串匹配引擎：所有组的关键词在构建时编译成一个正则，对文本扫描一遍即可得到
+# “哪些组至少有一个关键词是它的子串”，与逐组 any(k in s for k in keys) 的结果完全一致。
+#
+# 正则写成零宽前瞻 (?=(k1|k2|...))，finditer 在每个起点都尝试一次，因此重叠的命中也不会漏
+# （如 "womens" 里的 "women" 与 "men"）。同一起点只返回最长的那个关键词，
+# 比它短、且是它前缀的关键词在该起点必然也命中，所以每个关键词预先并上“自身所有前缀关键词”
+# 所属的组（前缀闭包），一次匹配即可报告全部组。
+# 交替分支按字典树展开（公共前缀只写一次），每个起点只需比较一两个字符就能排除，不必逐个关键词尝试。
+
+def _trie_pattern(node: Dict) -> str:
+    """字典树 -> 正则；"" 键表示到此为一个完整关键词。可选分组是贪婪的，因此总是得到最长匹配。"""
+    alts = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    return f"(?:{body})?" if "" in node else body
+
+class KeywordMatcher:
+    def __init__(self, groups: Dict[str, Iterable[str]], cache_size: int = 65536):
+        owners: Dict[str, set] = {}
+        for group, keys in groups.items():
+            for k in keys:
+                owners.setdefault(k, set()).add(group)
+        keys = sorted(owners, key=len, reverse=True)
+        self.groups = tuple(groups)
+        self._closure: Dict[str, FrozenSet[str]] = {
+            k: frozenset(g for p in owners if k.startswith(p) for g in owners[p]) for k in keys
+        }
+        trie: Dict = {}
+        for k in keys:
+            node = trie
+            for ch in k:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+        self._regex = re.compile("(?=(" + _trie_pattern(trie) + "))") if keys else None
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, text: str) -> FrozenSet[str]:
+        """返回命中的组名集合；调用方负责大小写归一（关键词表均为小写）。"""
+        if self._regex is None:
+            return frozenset()
+        closure = self._closure
+        hits: set = set()
+        for m in self._regex.finditer(text):
+            hits |= closure[m.group(1)]
+        return frozenset(hits)
+
+    def any(self, text: str, group: str) -> bool:
+        return group in self.match(text)
@@ -0,0 +1,170 @@
+# src/metrics.py
+import functools, json, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 进程内指标注册表：计数器 + 直方图，线程安全；抓取结束时导出为 JSON 或 Prometheus 文本格式。
+# 指标名遵循 Prometheus 习惯（*_total 计数、*_seconds / *_bytes 直方图），labels 用关键字参数给出。
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+BYTES_BUCKETS = [1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 5e6]
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, "" if v is None else str(v)) for k, v in labels.items()))
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(buckets) + 1)    # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶上界估计分位数（落在 +Inf 桶时返回最大有限上界）。"""
+        if not self.count:
+            return None
+        rank, acc = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return self.buckets[min(i, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+        self.histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self.started = time.time()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear(); self.histograms.clear()
+            self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Optional[List[float]] = None, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram(buckets or LATENCY_BUCKETS)
+            h.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    # —— 跨进程汇总：子进程 drain() 出增量，父进程 merge() 进自己的注册表 ——
+    def drain(self) -> Tuple[Dict, Dict]:
+        with self._lock:
+            out = (self.counters, self.histograms)
+            self.counters, self.histograms = {}, {}
+        return out
+
+    def merge(self, counters: Dict, histograms: Dict) -> None:
+        with self._lock:
+            for key, v in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + v
+            for key, h in histograms.items():
+                mine = self.histograms.get(key)
+                if mine is None:
+                    self.histograms[key] = h
+                    continue
+                mine.counts = [a + b for a, b in zip(mine.counts, h.counts)]
+                mine.sum += h.sum; mine.count += h.count
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get((name, _labels(labels)), 0)
+
+    # —— 导出 ——
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.counters.items())]
+            hists = []
+            for (n, l), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                hists.append({
+                    "name": n, "labels": dict(l), "count": h.count, "sum": round(h.sum, 6),
+                    "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99),
+                    "buckets": {**{str(b): c for b, c in zip(h.buckets, h.counts)}, "+Inf": h.counts[-1]},
+                })
+        return {"started": self.started, "elapsed_seconds": round(time.time() - self.started, 3),
+                "counters": counters, "histograms": hists}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        def fmt(labels: Dict, extra: Optional[Tuple[str, str]] = None) -> str:
+            items = list(labels.items()) + ([extra] if extra else [])
+            if not items: return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+        snap = self.snapshot()
+        lines: List[str] = []
+        typed = set()
+        for c in snap["counters"]:
+            if c["name"] not in typed:
+                lines.append(f"# TYPE {c['name']} counter"); typed.add(c["name"])
+            lines.append(f"{c['name']}{fmt(c['labels'])} {c['value']}")
+        for h in snap["histograms"]:
+            if h["name"] not in typed:
+                lines.append(f"# TYPE {h['name']} histogram"); typed.add(h["name"])
+            acc = 0
+            for le, cnt in h["buckets"].items():
+                acc += cnt
+                lines.append(f"{h['name']}_bucket{fmt(h['labels'], ('le', le))} {acc}")
+            lines.append(f"{h['name']}_sum{fmt(h['labels'])} {h['sum']}")
+            lines.append(f"{h['name']}_count{fmt(h['labels'])} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, fmt: str = "json") -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus() if fmt == "prom" else self.to_json())
+
+# 进程级默认注册表
+METRICS = Metrics()
+
+def failure_reason(exc: BaseException) -> str:
+    """失败原因归类：HTTP 错误按状态码，其它按异常类型名；工作进程上的失败沿用工作进程给出的归类。"""
+    remote = getattr(exc, "remote_reason", None)
+    if remote:
+        return remote
+    resp = getattr(exc, "response", None)
+    status = getattr(resp, "status_code", None)
+    # 带着 2xx 响应的异常（如按 Content-Type / 大小放弃的页面）按类型名归类
+    return f"http_{status}" if status and status >= 400 else type(exc).__name__
+
+def timed(stage: str, name: str = "parse_seconds"):
+    """装饰解析入口：记录耗时直方图；抛异常时按原因计入 parse_failures_total 后原样抛出。"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                METRICS.inc("parse_failures_total", stage=stage, reason=failure_reason(e))
+                raise
+            finally:
+                METRICS.observe(name, time.perf_counter() - t0, stage=stage)
+        return wrapper
+    return deco
@@ -0,0 +1,143 @@
+# src/multisite.py
+import os, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from config import Settings
+from httpclient import HttpClient, create_client
+from menu import crawl_menu
+from metrics import METRICS, failure_reason
+from parsepool import ParsePool
+from products import iter_products
+from siteprofile import SiteProfile
+from sitemap import parse_lastmod
+from state import CrawlState
+
+# 多站点抓取：每个站点（SiteProfile）一个抓取线程，跑的就是单站点的 iter_products。
+# 站点之间共享 HTTP 连接池、响应缓存和解析进程池。限速器本来就按 host 分桶，每个站点按自己 profile 里的速率单独设定。
+# 产品经一个有界队列汇总到调用线程，由唯一的 sink 写出（sink 不需要线程安全），每条记录带 site 字段。
+QUEUE_SIZE = 256
+_DONE = object()
+
+class MultiSiteCrawler:
+    """parallel 个站点同时抓取，其余排队；某个站点失败只记录错误，不影响其它站点。
+
+    state_dir 给出时每个站点一个检查点库 <state_dir>/<name>.sqlite，resume=True 时各自从检查点继续。
+    sitemap_since 可为 ISO 日期，或 "last"（各站点上一次完整跑完的时间）。listing_only 见 iter_products。
+    """
+
+    def __init__(self, profiles: List[SiteProfile], settings: Settings, parallel: int = 4,
+                 max_pages: int = 1500, state_dir: Optional[str] = None, resume: bool = False,
+                 sitemap_since: Optional[str] = None, listing_only: bool = False):
+        self.profiles = profiles
+        self.parallel = max(1, parallel)
+        self.max_pages = max_pages
+        self.state_dir = state_dir
+        self.resume = resume
+        self.sitemap_since = sitemap_since
+        self.listing_only = listing_only
+        self.client = create_client(settings)
+        self.pool = ParsePool(settings.parse_workers)
+        self.clients: Dict[str, HttpClient] = {}
+        for p in profiles:
+            if (p.delay_seconds, p.burst, p.max_rate) != (None, None, None):
+                for host in {p.host} | p.domains():
+                    self.client.ratelimiter.configure(host, p.delay_seconds, p.burst, p.max_rate)
+            self.clients[p.name] = self.client.scoped(p.settings(settings))
+        self.menu_rows: Dict[str, List[Dict[str, str]]] = {}
+        self.counts: Dict[str, int] = {p.name: 0 for p in profiles}
+        self.errors: Dict[str, Exception] = {}
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.pool.close()
+        self.client.close()
+
+    def menus(self) -> List[Dict[str, str]]:
+        """并发抓取各站点菜单，返回带 site 字段的菜单行（抓不到菜单不影响该站点的抓取）。"""
+        def one(p: SiteProfile) -> List[Dict[str, str]]:
+            try:
+                return crawl_menu(self.clients[p.name])
+            except Exception as e:
+                METRICS.inc("crawl_failures_total", stage="menu", reason=failure_reason(e))
+                return []
+
+        with ThreadPoolExecutor(max_workers=self.parallel) as ex:
+            for p, rows in zip(self.profiles, ex.map(one, self.profiles)):
+                self.menu_rows[p.name] = rows
+        return [{"site": p.name, **r} for p in self.profiles for r in self.menu_rows[p.name]]
+
+    def seeds(self, p: SiteProfile) -> List[str]:
+        extra = [urljoin(p.base_url, s) if s.startswith("/") else s for s in p.seeds]
+        return [p.base_url] + [r["url"] for r in self.menu_rows.get(p.name, [])] + extra
+
+    def _crawl_site(self, p: SiteProfile, out: "queue.Queue", stop: threading.Event) -> None:
+        state = None
+        try:
+            if self.state_dir:
+                state = CrawlState(os.path.join(self.state_dir, f"{p.name}.sqlite"), resume=self.resume)
+            since = self.sitemap_since
+            if since == "last":
+                since = state.get_meta("sitemap_last_run") if state is not None else None
+            started = datetime.now(timezone.utc).isoformat()
+            for product in iter_products(self.clients[p.name], seeds=self.seeds(p), max_pages=p.max_pages or self.max_pages,
+                                         state=state, sitemap_since=parse_lastmod(since), profile=p, pool=self.pool,
+                                         listing_only=self.listing_only):
+                item = (p.name, {"site": p.name, **product})
+                while not stop.is_set():
+                    try:
+                        out.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            if state is not None:
+                state.set_meta("sitemap_last_run", started, commit=True)
+            METRICS.inc("crawl_sites_total", result="ok")
+        except Exception as e:
+            METRICS.inc("crawl_sites_total", result="failed")
+            self.errors[p.name] = e
+        finally:
+            if state is not None:
+                state.close()
+            out.put((p.name, _DONE))
+
+    def products(self) -> Iterator[Dict]:
+        """逐条产出各站点的产品（站点之间交错）。调用方中途停止迭代时，各站点线程在下一次写队列时退出。"""
+        if not self.menu_rows:
+            self.menus()
+        out: "queue.Queue[Tuple[str, object]]" = queue.Queue(maxsize=QUEUE_SIZE)
+        stop = threading.Event()
+        slots = threading.Semaphore(self.parallel)
+
+        def run(p: SiteProfile) -> None:
+            with slots:
+                if not stop.is_set():
+                    self._crawl_site(p, out, stop)
+                else:
+                    out.put((p.name, _DONE))
+
+        # 守护线程：中断时不等待仍在发现阶段的站点（检查点保留到最近一次提交）
+        for p in self.profiles:
+            threading.Thread(target=run, args=(p,), name=f"site-{p.name}", daemon=True).start()
+        remaining = len(self.profiles)
+        try:
+            while remaining:
+                name, item = out.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                self.counts[name] += 1
+                yield item
+        finally:
+            stop.set()
@@ -0,0 +1,107 @@
+# src/pagination.py
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# 分页列表的直接枚举：列表页给出分页信息（PageDocument.pagination）后，不再等 rel=next / 页码链接被逐页"碰到"，
+# 而是直接生成 ?page=2..N 入队（分页优先级最高，同一批并发抓取）。末页未知时按窗口向前预排 window 页，
+# 每抓到一页非空的再顺延。某一页为空、或与同一列表之前某页的产品链接完全相同（越界页回显末页 / 第一页）、
+# 或列表一直带 rel=next 而这一页没有时，该列表到此为止，队列里更靠后的页出队时直接跳过，不发请求。
+
+def page_url(listing: str, param: str, n: int) -> str:
+    """列表 URL（不含页码参数）的第 n 页；第 1 页就是列表 URL 本身。"""
+    if n <= 1:
+        return listing
+    p = urlparse(listing)
+    query = parse_qsl(p.query, keep_blank_values=True) + [(param, str(n))]
+    return urlunparse(p._replace(query=urlencode(query)))
+
+def split_page(url: str, param: str) -> Tuple[str, int]:
+    """(去掉页码参数的列表 URL, 页码)；没有页码参数时为第 1 页。"""
+    p = urlparse(url)
+    query = parse_qsl(p.query, keep_blank_values=True)
+    n = next((int(v) for k, v in query if k == param and v.isdigit()), 1)
+    rest = urlencode([(k, v) for k, v in query if k != param])
+    return urlunparse(p._replace(query=rest)), n
+
+class _Listing:
+    __slots__ = ("param", "last", "scheduled", "stop", "seen", "uses_next")
+
+    def __init__(self, param: str):
+        self.param = param
+        self.last: Optional[int] = None   # 已知末页
+        self.scheduled: Set[int] = set()  # 已入队（或已抓到）的页码
+        self.stop: Optional[int] = None   # 第一张空页 / 重复页
+        self.seen: Set[int] = set()       # 各页产品链接的 hash（识别重复页）
+        self.uses_next = False            # 该列表的页面带 rel=next：某页没有 next 即为末页
+
+class Paginator:
+    """按列表跟踪分页进度。listing 键是去掉页码参数的 URL；同一路径只认第一次识别到的页码参数。"""
+
+    def __init__(self, window: int = 4):
+        self.window = max(1, window)
+        self._listings: Dict[str, _Listing] = {}
+        self._params: Dict[str, str] = {}   # path -> 页码参数
+
+    def _locate(self, url: str) -> Optional[Tuple[str, int, _Listing]]:
+        param = self._params.get(urlparse(url).path)
+        if param is None:
+            return None
+        listing, n = split_page(url, param)
+        state = self._listings.get(listing)
+        return (listing, n, state) if state is not None else None
+
+    def is_page(self, url: str) -> bool:
+        """url 是已跟踪列表的某一页（这些页由 Paginator 排期，扩展链接里不必再收）。"""
+        return self._locate(url) is not None
+
+    def skip(self, url: str) -> bool:
+        """url 在所属列表的空页 / 重复页之后：不必再抓。"""
+        loc = self._locate(url)
+        return loc is not None and loc[2].stop is not None and loc[1] > loc[2].stop
+
+    def observe(self, url: str, info: Optional[Dict], links: List[str]) -> List[str]:
+        """处理一张已抓取的列表页，返回需要新入队的分页 URL。
+
+        info 为 analyze_listing_page 给出的分页信息；内容重复而复用分析结果的页面没有 info，按已知列表处理。
+        """
+        if info is not None:
+            path = urlparse(url).path
+            param = self._params.setdefault(path, info["param"])
+            listing, n = split_page(url, param)
+            state = self._listings.get(listing)
+            if state is None:
+                state = self._listings[listing] = _Listing(param)
+            state.scheduled.add(n)
+            if info.get("last"):
+                state.last = max(state.last or 0, info["last"])
+            has_next = info.get("has_next", False)
+            state.uses_next = state.uses_next or has_next
+        else:
+            loc = self._locate(url)
+            if loc is None:
+                return []
+            listing, n, state = loc
+            has_next = False
+
+        digest = hash(tuple(links))
+        if not links or digest in state.seen:
+            state.stop = n if state.stop is None else min(state.stop, n)
+            return []
+        state.seen.add(digest)
+        if state.stop is not None and n >= state.stop:
+            return []
+        if info is not None and state.uses_next and not has_next and (state.last is None or n >= state.last):
+            state.stop = n   # 本页已是末页
+            return []
+
+        target = n
+        if state.last is not None and state.last > n:
+            target = state.last
+        if has_next or (state.last is None and n > 1):
+            target = max(target, n + self.window)
+            if state.last is not None and n < state.last:
+                target = state.last   # 已知末页：不预排到末页之后（末页本身仍带 next 时末页信息已过时，照常预排）
+        # 从第 1 页起补齐：第一次见到的可能是中间某页（如 sitemap 里的 ?page=3），之前的页也要抓
+        out = [page_url(listing, state.param, p) for p in range(1, target + 1) if p not in state.scheduled]
+        state.scheduled.update(range(1, target + 1))
+        return out
@@ -1,8 +1,12 @@
 # src/parse.py
-import re, json
+import re, json, hashlib
 from bs4 import BeautifulSoup
-from typing import Dict, Any, List, Optional
-from urllib.parse import urljoin, urlparse
+from html import unescape
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import parse_qsl, urljoin, urlparse
+from requests.compat import chardet
+from metrics import METRICS, timed
+from keywords import KeywordMatcher
 
 # —— 归一化配置 ——
 CURRENCY_SYMBOL_MAP = {"$":"USD","€":"EUR","£":"GBP","¥":"CNY"}
@@ -61,7 +65,12 @@ def normalize_price_and_currency(price_raw):
     cur = ""
     for sym, code in CURRENCY_SYMBOL_MAP.items():
         if sym in s: cur = code; break
-    s_num = re.sub(r"[^0-9.,]", "", s).replace(",", "")
+    s_num = re.sub(r"[^0-9.,]", "", s)
+    # 小数逗号（"47,96" / "1.299,00"）：两种分隔符都有时后出现的是小数点；只有逗号时后面不是 3 位数字即为小数点
+    if "," in s_num and (s_num.rfind(",") > s_num.rfind(".") if "." in s_num
+                         else not re.search(r",\d{3}$", s_num)):
+        s_num = s_num.replace(".", "").replace(",", ".")
+    s_num = s_num.replace(",", "")
     try: price = float(s_num) if s_num else None
     except ValueError: price = None
     return price, cur
@@ -80,37 +89,88 @@ def absolutize_images(images, base_url):
     return dedup
 
 # —— JSON-LD 工具 ——
-def parse_json_ld_products(soup: BeautifulSoup) -> Optional[Dict[str, Any]]:
+def decode_json_ld(soup: BeautifulSoup) -> List[Any]:
+    """解码页面上全部 application/ld+json 脚本（顶层数组展开），坏块跳过。"""
+    objs: List[Any] = []
     for script in soup.select('script[type="application/ld+json"]'):
         try: obj = json.loads(script.string or "")
         except Exception: continue
-        arr = obj if isinstance(obj, list) else [obj]
-        for c in arr:
-            t = c.get("@type") or c.get("@graph", [{}])[0].get("@type")
-            types = [x.lower() for x in (t if isinstance(t, list) else [t] if t else [])]
-            if any(x == "product" for x in types):
-                return c
+        objs.extend(obj if isinstance(obj, list) else [obj])
+    return objs
+
+# 快速路径用：在原始 HTML 上正则扫描 <script>/<link> 标签，不构建 DOM
+_SCRIPT_RE = re.compile(r"<script\b([^>]*)>(.*?)</script\s*>", re.I | re.S)
+_LINK_RE = re.compile(r"<link\b([^>]*)>", re.I)
+_ATTR_RE = re.compile(r"""([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+
+def _tag_attrs(raw: str) -> Dict[str, str]:
+    attrs: Dict[str, str] = {}
+    for m in _ATTR_RE.finditer(raw):
+        name = m.group(1).lower()
+        if name not in attrs:
+            v = next((g for g in m.groups()[1:] if g is not None), "")
+            attrs[name] = unescape(v)
+    return attrs
+
+def scan_json_ld(html: str) -> List[Any]:
+    """与 decode_json_ld 结果相同，但直接扫描原始 HTML。"""
+    objs: List[Any] = []
+    for m in _SCRIPT_RE.finditer(html):
+        if _tag_attrs(m.group(1)).get("type") != "application/ld+json":
+            continue
+        try: obj = json.loads(m.group(2))
+        except Exception: continue
+        objs.extend(obj if isinstance(obj, list) else [obj])
+    return objs
+
+def scan_canonical(html: str) -> Optional[str]:
+    """第一个 <link rel="canonical"> 的地址；没有（或为空）时返回 None，由调用方回退到 DOM。"""
+    for m in _LINK_RE.finditer(html):
+        attrs = _tag_attrs(m.group(1))
+        if attrs.get("rel") == "canonical":
+            href = attrs.get("href") or attrs.get("content")
+            return href.strip() if href else None
     return None
 
-def has_jsonld_product(soup: BeautifulSoup) -> bool:
-    return parse_json_ld_products(soup) is not None
+def product_fields_from_json_ld(pjson: Dict[str, Any], url: str) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"name": pjson.get("name", "")}
+    offers = pjson.get("offers", {})
+    if isinstance(offers, list) and offers: offers = offers[0]
+    price_raw = offers.get("price") if isinstance(offers, dict) else None
+    price, cur_from_sym = normalize_price_and_currency(price_raw)
+    currency = offers.get("priceCurrency", "") if isinstance(offers, dict) else ""
+    if not currency and cur_from_sym: currency = cur_from_sym
+    out["price"] = price; out["priceCurrency"] = currency
+    # 库存状态：schema.org 枚举（"https://schema.org/InStock"）只保留末段
+    availability = offers.get("availability") if isinstance(offers, dict) else None
+    out["availability"] = str(availability).rstrip("/").rsplit("/", 1)[-1] if availability else ""
+    out["sku"] = pjson.get("sku", "")
+    brand = pjson.get("brand", {}); out["brand"] = (brand.get("name","") if isinstance(brand, dict) else brand) or ""
+    images = pjson.get("image", []); images = [images] if isinstance(images, str) else images
+    out["images"] = absolutize_images(images, url)
+    out["description"] = pjson.get("description", "")
+    return out
 
-def parse_json_ld_breadcrumbs(soup: BeautifulSoup) -> List[str]:
+def product_from_json_ld(objs: List[Any]) -> Optional[Dict[str, Any]]:
+    for c in objs:
+        t = c.get("@type") or c.get("@graph", [{}])[0].get("@type")
+        types = [x.lower() for x in (t if isinstance(t, list) else [t] if t else [])]
+        if any(x == "product" for x in types):
+            return c
+    return None
+
+def breadcrumbs_from_json_ld(objs: List[Any]) -> List[str]:
     cats = []
-    for script in soup.select('script[type="application/ld+json"]'):
-        try: obj = json.loads(script.string or "")
-        except Exception: continue
-        arr = obj if isinstance(obj, list) else [obj]
-        for item in arr:
-            if (item.get("@type") == "BreadcrumbList") or any(
-                x.get("@type")=="BreadcrumbList" for x in item.get("@graph", [])
-                if isinstance(item, dict) and isinstance(item.get("@graph"), list)
-            ):
-                elems = item.get("itemListElement") or []
-                if isinstance(elems, list):
-                    for e in elems:
-                        name = e.get("name") or (e.get("item", {}) or {}).get("name")
-                        if name: cats.append(textnorm(name))
+    for item in objs:
+        if (item.get("@type") == "BreadcrumbList") or any(
+            x.get("@type")=="BreadcrumbList" for x in item.get("@graph", [])
+            if isinstance(item, dict) and isinstance(item.get("@graph"), list)
+        ):
+            elems = item.get("itemListElement") or []
+            if isinstance(elems, list):
+                for e in elems:
+                    name = e.get("name") or (e.get("item", {}) or {}).get("name")
+                    if name: cats.append(textnorm(name))
     cats = [c for c in cats if c and c.lower() not in ("home","shop")]
     seen=set(); out=[]
     for c in cats:
@@ -118,6 +178,15 @@ def parse_json_ld_breadcrumbs(soup: BeautifulSoup) -> List[str]:
             seen.add(c); out.append(c)
     return out
 
+def parse_json_ld_products(soup: BeautifulSoup) -> Optional[Dict[str, Any]]:
+    return product_from_json_ld(decode_json_ld(soup))
+
+def has_jsonld_product(soup: BeautifulSoup) -> bool:
+    return parse_json_ld_products(soup) is not None
+
+def parse_json_ld_breadcrumbs(soup: BeautifulSoup) -> List[str]:
+    return breadcrumbs_from_json_ld(decode_json_ld(soup))
+
 def _first_text(soup, selectors: List[str]) -> str:
     for sel in selectors:
         node = soup.select_one(sel)
@@ -125,27 +194,13 @@ def _first_text(soup, selectors: List[str]) -> str:
     return ""
 
 # —— 性别/类别识别 ——
-def infer_categories_from_url_or_text(url: str, extra_text: str = "") -> List[str]:
-    ctx = (url + " " + (extra_text or "")).lower()
-    hits = []
-    for canon, keys in CATEGORY_CANON.items():
-        # 只把真正“品类”的映射加入（排除 best/new/sale 这些集合信号）
-        if canon in {"bestsellers","new-arrivals","sale"}:
-            continue
-        for k in keys:
-            if k in ctx:
-                hits.append(canon); break
-    seen=set(); out=[]
-    for c in hits:
-        if c not in seen:
-            seen.add(c); out.append(c)
-    return out
+# 关键词匹配统一走站点规则（SiteRules，见文件中部）：所有词表编译成一个正则，按文本缓存结果。
+# rules 为 None 时使用内置词表（DEFAULT_RULES）。
+def infer_categories_from_url_or_text(url: str, extra_text: str = "", rules: Optional["SiteRules"] = None) -> List[str]:
+    return (rules or DEFAULT_RULES).categories(url, extra_text)
 
-def detect_gender_from_url_or_text(url: str, extra_text: str = "") -> Optional[str]:
-    ctx = f" {url} {(extra_text or '')} ".lower()
-    if " women " in ctx or "/womens" in ctx or "womens-" in ctx: return "women"
-    if " men " in ctx or "/mens" in ctx or "mens-" in ctx: return "men"
-    return None
+def detect_gender_from_url_or_text(url: str, extra_text: str = "", rules: Optional["SiteRules"] = None) -> Optional[str]:
+    return (rules or DEFAULT_RULES).gender(url, extra_text)
 
 def get_canonical_url(soup: BeautifulSoup, url: str) -> str:
     for sel in ['link[rel="canonical"]','meta[property="og:url"]']:
@@ -155,106 +210,500 @@ def get_canonical_url(soup: BeautifulSoup, url: str) -> str:
     p = urlparse(url)
     return f"{p.scheme}://{p.netloc}{p.path}"
 
-def looks_like_listing_url(url: str, title_h1: str) -> bool:
-    u = url.lower()
-    t = (title_h1 or "").lower()
-    if "page=" in u: return True
-    # URL 或标题/H1 出现 men/women + 类目关键词，认为是列表/类目页
-    has_gender = ("men" in u or "women" in u or "men" in t or "women" in t)
-    cat_hits = any(any(k in u or k in t for k in keys) for keys in CATEGORY_CANON.values())
-    return has_gender and cat_hits
+def looks_like_listing_url(url: str, title_h1: str, rules: Optional["SiteRules"] = None) -> bool:
+    return (rules or DEFAULT_RULES).looks_like_listing(url, title_h1)
 
-def classify_page_context(html: str, url: str) -> Dict[str, Any]:
-    """返回页面上下文并标记是否为‘类目/列表页’。只有在 is_category=True 时才会给产品打来源标签。"""
-    soup = soupify(html)
-    title = _first_text(soup, ["title"])
-    h1 = _first_text(soup, ["h1","h1.page-title"])
-    gender = detect_gender_from_url_or_text(url, f"{title} {h1}")
-    cats = infer_categories_from_url_or_text(url, f"{title} {h1}")
-    is_product = has_jsonld_product(soup)
-    is_category = (not is_product) and looks_like_listing_url(url, f"{title} {h1}")
+def is_listing_page_heuristic(soup, url: str, rules: Optional["SiteRules"] = None):
+    return (rules or DEFAULT_RULES).listing_heuristic(soup, url)
+
+_PRICE_RE = re.compile(r"([$€£¥])?\s*\d[\d.,]*")
+_CARD_PRICE_RE = re.compile(r"[$€£¥]\s*\d[\d.,]*")   # 卡片没有价格节点时只认带货币符号的数字（名称里常有数字）
+_BARE_PRICE_RE = re.compile(r"\d[\d.,]*(?![\d.,]|\s*%)")   # 价格节点里没有货币符号时：不带 % 的数字（"-20%" 是折扣）
+CARD_MAX_DEPTH = 6   # 卡片根节点最多向上找几层
+# 分页识别：页码参数名（rel=next 能给出参数名时以它为准）与“共 N 件商品”计数
+PAGE_PARAMS = ("page", "p", "pg")
+_ITEM_COUNT_RE = re.compile(r"(\d[\d,]*)\s+(?:products|items|results)\b", re.I)
+
+def _first_price_text(soup) -> Optional[str]:
+    """等价于在 soup.get_text(" ", strip=True) 上找第一个价格，但逐段扫描、命中即停，不拼接整页文本。"""
+    prev = ""
+    for s in soup.stripped_strings:
+        m = _PRICE_RE.search(s)
+        if m:
+            txt = m.group(0)
+            # 货币符号可能单独落在上一段文本末尾（"$" "29.00"）
+            if m.start() == 0 and not m.group(1) and prev and prev[-1] in CURRENCY_SYMBOL_MAP:
+                txt = prev[-1] + " " + txt
+            return txt
+        prev = s
+    return None
+
+def classify_context(url: str, title: str, h1: str, is_product: bool,
+                     rules: Optional["SiteRules"] = None) -> Dict[str, Any]:
+    """classify 中只依赖 URL 与标题/H1 的部分；内容相同、URL 不同的页面可据此重算上下文而无需重新解析。"""
+    rules = rules or DEFAULT_RULES
+    th = f"{title} {h1}"
+    gender = rules.gender(url, th)
+    cats = rules.categories(url, th)
+    is_category = (not is_product) and rules.looks_like_listing(url, th)
     return {"gender": gender, "categories": cats, "title": title, "h1": h1,
             "is_product": is_product, "is_category": is_category}
 
-def is_listing_page_heuristic(soup, url: str):
-    u = url.lower()
-    if "page=" in u or "bestsellers" in u or "sale" in u: return True
-    h1 = soup.find("h1")
-    if h1:
-        t = (h1.get_text(" ", strip=True) or "").lower()
-        if any(k in t for k in ["best seller","new in","men","women","collection","category"]):
-            return True
-    return False
-
-# —— 产品详情解析（JSON-LD 优先 + 价格归一 + 类别兜底） ——
-def parse_product_page(html: str, url: str) -> Dict[str, Any]:
-    soup = soupify(html)
-    out: Dict[str, Any] = {"url": url, "canonical_url": get_canonical_url(soup, url)}
-
-    pjson = parse_json_ld_products(soup)
-    if pjson:
-        out["name"] = pjson.get("name", "")
-        offers = pjson.get("offers", {})
-        if isinstance(offers, list) and offers: offers = offers[0]
-        price_raw = offers.get("price") if isinstance(offers, dict) else None
-        price, cur_from_sym = normalize_price_and_currency(price_raw)
-        currency = offers.get("priceCurrency", "") if isinstance(offers, dict) else ""
-        if not currency and cur_from_sym: currency = cur_from_sym
-        out["price"] = price; out["priceCurrency"] = currency
-        out["sku"] = pjson.get("sku", "")
-        brand = pjson.get("brand", {}); out["brand"] = (brand.get("name","") if isinstance(brand, dict) else brand) or ""
-        images = pjson.get("image", []); images = [images] if isinstance(images, str) else images
-        out["images"] = absolutize_images(images, url)
-        out["description"] = pjson.get("description", "")
-
-    if not out.get("name"):
-        out["name"] = _first_text(soup, ["h1","[data-testid='product-title']"])
-
-    if out.get("price") is None:
-        m = re.search(r"([$€£¥])?\s*\d[\d.,]*", soup.get_text(" ", strip=True))
-        if m:
-            p, cur = normalize_price_and_currency(m.group(0))
-            out["price"] = p
-            if not out.get("priceCurrency") and cur: out["priceCurrency"] = cur
-
-    if not out.get("description"):
-        out["description"] = _first_text(soup, [".product-description","[itemprop='description']", "section.description",".description"])
-
-    if not out.get("images"):
-        imgs = [img.get("src") for img in soup.select("img[src]")]
-        imgs = [s for s in imgs if s and any(ext in s.lower() for ext in (".jpg",".jpeg",".png",".webp"))]
-        out["images"] = absolutize_images(imgs[:10], url)
-
-    # 详情页自己的类目（面包屑/URL 兜底）
-    cats = parse_json_ld_breadcrumbs(soup)
-    if not cats:
-        title = _first_text(soup, ["title"])
-        h1 = _first_text(soup, ["h1"])
-        cats = infer_categories_from_url_or_text(url, f"{title} {h1}")
-    out["categories"] = cats
-
-    # 若像列表页但无 Product JSON-LD，则丢弃（防止把列表页当产品）
-    if is_listing_page_heuristic(soup, url) and not pjson:
-        return {}
-    return out
+# 详情页链接 / 扩展探索页链接的过滤关键词
+PRODUCT_LINK_DENY = ["account","cart","search","help","login","bestsellers","new-in","sale","page=","/blog","/travel"]
+CATEGORY_DENY = ["account","cart","login","help","search","blog","travel"]
+EXPAND_KEYWORDS = [
+    "jacket","pant","goggle","fleece","base","hoodie","t-shirt","beanie",
+    "glove","helmet","mask","sock","backpack","outerwear","facemask",
+]
+COLLECTION_SIGNALS = {"bestsellers","new-arrivals","sale"}   # CATEGORY_CANON 中只表示“集合页”的条目
 
-# —— 只抽取“像详情页”的链接（/slug 形式；过滤集合页关键词与 query） ——
-def discover_product_links_from_html(html: str, base_url: str) -> List[str]:
-    soup = soupify(html)
-    links = []
-    for a in soup.select("a[href]"):
-        href = a.get("href",""); 
-        if not href or href.startswith("#"): continue
+GENDER_KEYWORDS = {"women": [" women ", "/womens", "womens-"], "men": [" men ", "/mens", "mens-"]}
+# DOM 兜底用的 CSS 选择器，按顺序取第一个命中
+SELECTORS = {
+    "title":       ["title"],
+    "h1":          ["h1", "h1.page-title"],
+    "name":        ["h1", "[data-testid='product-title']"],
+    "description": [".product-description", "[itemprop='description']", "section.description", ".description"],
+    "images":      ["img[src]"],
+    # 列表页产品卡片（product_cards）：卡片内的名称 / 价格节点；都没命中时名称取链接文字，价格取带货币符号的文本
+    "card_name":   [".product-card__title", ".card__heading", ".product-item__title", "[itemprop='name']", ".name"],
+    "card_price":  [".price", "[itemprop='price']", "[class*='price']"],
+}
+
+class SiteRules:
+    """一个站点的词表与选择器：类目映射、集合页信号、链接过滤词、性别写法、兜底选择器。
+
+    全部词表编译成一个匹配器：每段文本扫描一次得到命中的全部组，结果按文本缓存（同一链接在各页反复出现）。
+    未给出的参数沿用内置（dopesnow）词表。pickle 时只传参数的 JSON，子进程按它取回（或构建一次）同一份规则。
+    """
+
+    def __init__(self, category_canon: Optional[Dict[str, List[str]]] = None,
+                 collection_signals: Optional[List[str]] = None,
+                 product_link_deny: Optional[List[str]] = None, category_deny: Optional[List[str]] = None,
+                 expand_keywords: Optional[List[str]] = None, gender_keywords: Optional[Dict[str, List[str]]] = None,
+                 selectors: Optional[Dict[str, List[str]]] = None):
+        canon = CATEGORY_CANON if category_canon is None else category_canon
+        self.category_canon = {c: list(keys) for c, keys in canon.items()}
+        self.collection_signals = frozenset(COLLECTION_SIGNALS if collection_signals is None else collection_signals)
+        self.product_link_deny = list(PRODUCT_LINK_DENY if product_link_deny is None else product_link_deny)
+        self.category_deny = list(CATEGORY_DENY if category_deny is None else category_deny)
+        self.expand_keywords = list(EXPAND_KEYWORDS if expand_keywords is None else expand_keywords)
+        genders = GENDER_KEYWORDS if gender_keywords is None else gender_keywords
+        self.gender_keywords = {g: list(genders.get(g, [])) for g in ("women", "men")}
+        self.selectors = {k: list(v) for k, v in {**SELECTORS, **(selectors or {})}.items()}
+        self.spec = json.dumps({"category_canon": self.category_canon,
+                                "collection_signals": sorted(self.collection_signals),
+                                "product_link_deny": self.product_link_deny, "category_deny": self.category_deny,
+                                "expand_keywords": self.expand_keywords, "gender_keywords": self.gender_keywords,
+                                "selectors": self.selectors}, ensure_ascii=False)
+
+        # 不限性别的“有性别词”判断用站点自己的性别写法去掉边界符（" men " / "/mens" -> men / mens），
+        # 内置词表即 men / women；站点给出 herren / damen 时按它们判断列表页、扩展链接
+        gender_words = list(dict.fromkeys(w for g in ("men", "women") for k in self.gender_keywords[g]
+                                          for w in [k.strip(" /-_")] if w))
+        self.keywords = KeywordMatcher({
+            **{f"cat:{canon}": keys for canon, keys in self.category_canon.items()},
+            "gender:women": self.gender_keywords["women"],
+            "gender:men": self.gender_keywords["men"],
+            "gender:any": gender_words,
+            "listing:url": ["page=", "bestsellers", "sale"],
+            "listing:h1": ["best seller", "new in", "collection", "category"] + gender_words,
+            "deny:product_link": self.product_link_deny,
+            "deny:category": self.category_deny,
+            "expand": ["?page="] + gender_words + self.expand_keywords,
+        })
+        self._category_groups = frozenset(f"cat:{canon}" for canon in self.category_canon)
+        self._product_category_groups = [(canon, f"cat:{canon}") for canon in self.category_canon
+                                         if canon not in self.collection_signals]
+        _RULES.setdefault(self.spec, self)
+
+    def __reduce__(self):
+        return _rules_from_spec, (self.spec,)
+
+    def categories(self, url: str, extra_text: str = "") -> List[str]:
+        hits = self.keywords.match((url + " " + (extra_text or "")).lower())
+        # 只把真正“品类”的映射加入（排除 best/new/sale 这些集合信号），顺序同 category_canon
+        return [canon for canon, group in self._product_category_groups if group in hits]
+
+    def gender(self, url: str, extra_text: str = "") -> Optional[str]:
+        hits = self.keywords.match(f" {url} {(extra_text or '')} ".lower())
+        if "gender:women" in hits: return "women"
+        if "gender:men" in hits: return "men"
+        return None
+
+    def looks_like_listing(self, url: str, title_h1: str) -> bool:
+        u = url.lower()
+        t = (title_h1 or "").lower()
+        if "page=" in u: return True
+        # URL 或标题/H1 出现 men/women + 类目关键词，认为是列表/类目页（u、t 分别匹配，不拼接）
+        hits = self.keywords.match(u) | self.keywords.match(t)
+        return "gender:any" in hits and not self._category_groups.isdisjoint(hits)
+
+    def listing_heuristic(self, soup, url: str) -> bool:
+        if self.keywords.any(url.lower(), "listing:url"): return True
+        h1 = soup.find("h1")
+        if h1:
+            t = (h1.get_text(" ", strip=True) or "").lower()
+            if self.keywords.any(t, "listing:h1"):
+                return True
+        return False
+
+_RULES: Dict[str, SiteRules] = {}   # spec -> 规则；同一进程内同样的词表只编译一次
+
+def _rules_from_spec(spec: str) -> SiteRules:
+    rules = _RULES.get(spec)
+    return rules if rules is not None else SiteRules(**json.loads(spec))
+
+DEFAULT_RULES = SiteRules()
+KEYWORDS = DEFAULT_RULES.keywords
+
+class PageDocument:
+    """一次解析、多处复用的页面对象。
+
+    soup 与 JSON-LD 均为惰性构建且只构建一次；分类、详情链接、扩展链接和产品字段都基于同一份解析结果。
+    """
+
+    def __init__(self, html: str, url: str, fast: bool = False, rules: Optional[SiteRules] = None):
+        self.html = html
+        self.url = url
+        self.fast = fast   # parse_product 先走不建 DOM 的快速路径，字段不全再回退
+        self.rules = rules or DEFAULT_RULES
+        self._soup: Optional[BeautifulSoup] = None
+        self._json_ld: Optional[List[Any]] = None
+        self._title: Optional[str] = None
+        self._h1: Optional[str] = None
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            self._soup = soupify(self.html)
+        return self._soup
+
+    @property
+    def json_ld(self) -> List[Any]:
+        if self._json_ld is None:
+            self._json_ld = decode_json_ld(self.soup)
+        return self._json_ld
+
+    @property
+    def title(self) -> str:
+        if self._title is None:
+            self._title = _first_text(self.soup, self.rules.selectors["title"])
+        return self._title
+
+    @property
+    def h1(self) -> str:
+        if self._h1 is None:
+            self._h1 = _first_text(self.soup, self.rules.selectors["h1"])
+        return self._h1
+
+    def product_json_ld(self) -> Optional[Dict[str, Any]]:
+        return product_from_json_ld(self.json_ld)
+
+    def breadcrumbs(self) -> List[str]:
+        return breadcrumbs_from_json_ld(self.json_ld)
+
+    @timed("classify")
+    def classify(self) -> Dict[str, Any]:
+        """返回页面上下文并标记是否为‘类目/列表页’。只有在 is_category=True 时才会给产品打来源标签。"""
+        return classify_context(self.url, self.title, self.h1, self.product_json_ld() is not None, self.rules)
+
+    # —— 只抽取“像详情页”的链接（/slug 形式；过滤集合页关键词与 query） ——
+    def is_product_href(self, href: str) -> bool:
+        if not href or href.startswith("#"): return False
         h = href.lower()
-        if any(x in h for x in ["account","cart","search","help","login","bestsellers","new-in","sale","page=","/blog","/travel"]):
-            continue
-        if "?" in h or "#" in h: continue
+        if self.rules.keywords.any(h, "deny:product_link"):
+            return False
+        if "?" in h or "#" in h: return False
         path = h.split("?")[0]
-        if path.count("/") != 1: continue   # 仅 /slug
-        if "-" not in path: continue
-        links.append(href)
-    seen=set(); out=[]
-    for h in links:
-        if h not in seen:
-            seen.add(h); out.append(h)
-    return out
+        if path.count("/") != 1: return False   # 仅 /slug
+        return "-" in path
+
+    @timed("product_links")
+    def product_links(self) -> List[str]:
+        links = [a.get("href","") for a in self.soup.select("a[href]")]
+        return list(dict.fromkeys(h for h in links if self.is_product_href(h)))
+
+    # —— 列表页产品卡片：卡片 = 只含这一个产品链接的最外层祖先节点（图片链接与标题链接通常同在一张卡片里） ——
+    @timed("product_cards")
+    def product_cards(self) -> List[Dict[str, Any]]:
+        """[{url, name, price, priceCurrency, image}]，url 为页面上的原始 href，与 product_links 顺序一致。"""
+        cards: Dict[str, Dict[str, Any]] = {}
+        for a in self.soup.select("a[href]"):
+            href = a.get("href", "")
+            if href in cards or not self.is_product_href(href):
+                continue
+            root = a
+            for parent in list(a.parents)[:CARD_MAX_DEPTH]:
+                if parent.name in ("body", "html", "[document]"):
+                    break
+                if any(x.get("href") != href and self.is_product_href(x.get("href", ""))
+                       for x in parent.select("a[href]")):
+                    break
+                root = parent
+            cards[href] = self._card_fields(root, href)
+        return list(cards.values())
+
+    def _card_fields(self, card, href: str) -> Dict[str, Any]:
+        sel = self.rules.selectors
+        img = card.find("img")
+        # 图片链接常在标题链接之前且没有文字：取卡片里指向同一产品、有文字的第一个链接
+        name = _first_text(card, sel["card_name"]) or next(
+            (t for x in card.select("a[href]") if x.get("href") == href
+             for t in [textnorm(x.get_text(" ", strip=True))] if t), "")
+        if not name and img is not None:
+            name = textnorm(img.get("alt", ""))
+        # 促销卡片同时显示原价与现价：取最低的一个（与详情页 offers.price 一致）
+        node = next((n for s in sel["card_price"] for n in [card.select_one(s)] if n is not None), None)
+        # 节点里的折扣（"-20%"）、"Save 30%" 等数字不是价格：有带货币符号的数字时只认它们
+        ptext = node.get_text(" ", strip=True) if node is not None else ""
+        texts = _CARD_PRICE_RE.findall(ptext) or _BARE_PRICE_RE.findall(ptext)
+        if not texts:
+            texts = _CARD_PRICE_RE.findall(card.get_text(" ", strip=True))
+        prices = [normalize_price_and_currency(t) for t in texts]
+        price, cur = min((p for p in prices if p[0] is not None), default=(None, ""), key=lambda p: p[0])
+        src = ""
+        if img is not None:
+            src = img.get("src") or img.get("data-src") or (img.get("srcset") or "").split(" ")[0]
+        image = absolutize_images([src], self.url) if src else []
+        return {"url": href, "name": name, "price": price, "priceCurrency": cur, "image": image[0] if image else ""}
+
+    # —— 扩展新的“探索页”：只保留同站、可能是类目/列表的 URL（绝对地址，保持页面顺序） ——
+    @timed("expansion_links")
+    def expansion_links(self, base_url: str) -> List[str]:
+        host = urlparse(base_url).netloc.lower()
+        out = []
+        for a in self.soup.select("a[href]"):
+            h = a.get("href","")
+            if not h or h.startswith("#"): continue
+            if h.startswith("/"): h = urljoin(base_url, h)
+            if urlparse(h).netloc.lower() != host:
+                continue
+            hits = self.rules.keywords.match(h.lower())
+            if "deny:category" in hits:
+                continue
+            # 具有“列表/类目页”的外观：带 men/women 或带类目词 或 ?page=
+            if "expand" in hits:
+                out.append(h)
+        return out
+
+    # —— 分页：rel=next、同一路径的页码链接、商品总数 / 本页件数，推断页码参数与末页 ——
+    @timed("pagination")
+    def pagination(self, per_page: int) -> Optional[Dict[str, Any]]:
+        """{param, current, last, has_next}；last 未知为 None。页面上没有任何分页迹象时返回 None。"""
+        here = urlparse(self.url)
+        query = dict(parse_qsl(here.query))
+        param, has_next = None, False
+        nxt = self.soup.select_one('link[rel~="next"][href], a[rel~="next"][href]')
+        if nxt is not None:
+            u = urlparse(urljoin(self.url, nxt["href"]))
+            if u.path == here.path:
+                has_next = True
+                param = next((k for k, v in parse_qsl(u.query) if v.isdigit() and query.get(k) != v), None)
+        pages = []
+        for a in self.soup.select("a[href]"):
+            if "next" in (a.get("rel") or []) or "prev" in (a.get("rel") or []):
+                continue
+            u = urlparse(urljoin(self.url, a["href"]))
+            if u.path != here.path or not u.query:
+                continue
+            for k, v in parse_qsl(u.query):
+                if v.isdigit() and (k == param or (param is None and k in PAGE_PARAMS)):
+                    param = k
+                    pages.append(int(v))
+        m = _ITEM_COUNT_RE.search(self.soup.get_text(" ", strip=True))
+        total = int(m.group(1).replace(",", "")) if m else 0
+        if param is None:
+            if not (has_next or total > per_page > 0):
+                return None
+            param = PAGE_PARAMS[0]
+        current = int(query[param]) if query.get(param, "").isdigit() else 1
+        last = max(pages) if pages else None
+        if total and per_page and current == 1:
+            last = max(last or 0, -(-total // per_page))
+        return {"param": param, "current": current, "last": last, "has_next": has_next}
+
+    def parse_product(self) -> Dict[str, Any]:
+        if self.fast:
+            out, missing = self.fast_product()
+            METRICS.inc("parse_fast_path_total", result="fallback" if out is None else "hit", missing=missing)
+            if out is not None:
+                return out
+        return self.parse_product_dom()
+
+    # —— 快速路径：不建 DOM，只扫原始 HTML 里的 JSON-LD 与 canonical；缺字段时返回 (None, 缺的字段) ——
+    @timed("parse_product_fast")
+    def fast_product(self) -> Tuple[Optional[Dict[str, Any]], str]:
+        return fast_product_fields(self.html, self.url)
+
+    # —— 产品详情解析（JSON-LD 优先 + 价格归一 + 类别兜底） ——
+    @timed("parse_product")
+    def parse_product_dom(self) -> Dict[str, Any]:
+        soup, url, sel = self.soup, self.url, self.rules.selectors
+        out: Dict[str, Any] = {"url": url, "canonical_url": get_canonical_url(soup, url)}
+
+        pjson = self.product_json_ld()
+        if pjson:
+            out.update(product_fields_from_json_ld(pjson, url))
+
+        if not out.get("name"):
+            out["name"] = _first_text(soup, sel["name"])
+
+        if out.get("price") is None:
+            txt = _first_price_text(soup)
+            if txt:
+                p, cur = normalize_price_and_currency(txt)
+                out["price"] = p
+                if not out.get("priceCurrency") and cur: out["priceCurrency"] = cur
+
+        if not out.get("description"):
+            out["description"] = _first_text(soup, sel["description"])
+
+        if not out.get("images"):
+            imgs = [img.get("src") for s in sel["images"] for img in soup.select(s)]
+            imgs = [s for s in imgs if s and any(ext in s.lower() for ext in (".jpg",".jpeg",".png",".webp"))]
+            out["images"] = absolutize_images(imgs[:10], url)
+
+        # 详情页自己的类目（面包屑/URL 兜底）
+        cats = self.breadcrumbs()
+        if not cats:
+            cats = self.rules.categories(url, f"{self.title} {self.h1}")
+        out["categories"] = cats
+
+        # 若像列表页但无 Product JSON-LD，则丢弃（防止把列表页当产品）
+        if self.rules.listing_heuristic(soup, url) and not pjson:
+            return {}
+        return out
+
+def fast_product_fields(html: str, url: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    objs = scan_json_ld(html)
+    pjson = product_from_json_ld(objs)
+    if not pjson:
+        return None, "json_ld"
+    canonical = scan_canonical(html)
+    if canonical is None:
+        return None, "canonical"
+    out: Dict[str, Any] = {"url": url, "canonical_url": canonical}
+    out.update(product_fields_from_json_ld(pjson, url))
+    out["categories"] = breadcrumbs_from_json_ld(objs)
+    # 以下字段 DOM 路径会用页面文本兜底，快速路径给不出同样的结果，只能回退
+    for field in ("name", "price", "description", "images", "categories"):
+        if out.get(field) is None or out.get(field) in ("", []):
+            return None, field
+    return out, ""
+
+def classify_page_context(html: str, url: str) -> Dict[str, Any]:
+    return PageDocument(html, url).classify()
+
+def parse_product_page(html: str, url: str, fast: bool = False) -> Dict[str, Any]:
+    return PageDocument(html, url, fast=fast).parse_product()
+
+def discover_product_links_from_html(html: str, base_url: str) -> List[str]:
+    return PageDocument(html, base_url).product_links()
+
+def discover_product_cards_from_html(html: str, base_url: str) -> List[Dict[str, Any]]:
+    return PageDocument(html, base_url).product_cards()
+
+def discover_expansion_links_from_html(html: str, base_url: str) -> List[str]:
+    return PageDocument(html, base_url).expansion_links(base_url)
+
+# —— 解析池入口：只接收原始字节、只返回可 pickle 的普通结构，可在子进程中执行 ——
+def decode_body(content: bytes, encoding: Optional[str] = None) -> str:
+    """与 requests.Response.text 相同的解码规则：无声明编码时按字节探测，解不开的字节替换。"""
+    if not encoding:
+        encoding = chardet.detect(content)["encoding"] if content else "utf-8"
+    try:
+        return str(content, encoding, errors="replace")
+    except (LookupError, TypeError):
+        return str(content, errors="replace")
+
+def analyze_listing_page(content: bytes, encoding: Optional[str], url: str, base_url: str,
+                         rules: Optional[SiteRules] = None, cards: bool = False) -> Dict[str, Any]:
+    """发现阶段：页面上下文；若为类目/列表页，附带详情链接与扩展链接（cards=True 时另附产品卡片）。"""
+    doc = PageDocument(decode_body(content, encoding), url, rules=rules)
+    ctx = doc.classify()
+    links = doc.product_links() if ctx["is_category"] else []
+    expand = doc.expansion_links(base_url) if ctx["is_category"] else []
+    page = {"context": ctx, "product_links": links, "expansion_links": expand,
+            "pagination": doc.pagination(len(links)) if ctx["is_category"] else None}
+    if cards:
+        page["product_cards"] = doc.product_cards() if ctx["is_category"] else []
+    return page
+
+def analyze_product_page(content: bytes, encoding: Optional[str], url: str, fast: bool = False,
+                         rules: Optional[SiteRules] = None) -> Dict[str, Any]:
+    return PageDocument(decode_body(content, encoding), url, fast=fast, rules=rules).parse_product()
+
+# —— 解析前去重：正文摘要 + 从 <head> 提前取 canonical ——
+_HEAD_END_RE = re.compile(rb"</head\s*>", re.I)
+
+def body_digest(content: bytes) -> bytes:
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+def head_canonical(content: bytes, encoding: Optional[str] = None, limit: int = 256 * 1024) -> Optional[str]:
+    """只扫描 </head> 之前（至多 limit 字节）的 <link rel="canonical">；没找到返回 None。
+
+    DOM 路径取文档中第一个 canonical，<head> 里的必然排在最前，所以这里找到的与完整解析结果一致。
+    """
+    m = _HEAD_END_RE.search(content, 0, limit)
+    head = content[:m.start() if m else limit]
+    try:
+        text = str(head, encoding or "utf-8", errors="replace")
+    except LookupError:
+        text = str(head, "utf-8", errors="replace")
+    return scan_canonical(text)
+
+# —— 流式抓取的提前停止（HttpClient.get_page 的 until）：在已读的原始字节上找标签，够用即截断 ——
+_TITLE_RE = re.compile(rb"<title\b[^>]*>(.*?)</title\s*>", re.I | re.S)
+_H1_RE = re.compile(rb"<h1\b[^>]*>(.*?)</h1\s*>", re.I | re.S)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+def _bytes_text(raw: bytes) -> str:
+    return textnorm(unescape(_TAG_RE.sub(" ", bytes(raw).decode("utf-8", errors="replace"))))
+
+def discovery_cut(url: str, buf: bytes, rules: Optional[SiteRules] = None, start: int = 0) -> Optional[int]:
+    """发现阶段：<title> 与第一个 <h1> 都已读到、且据此判定不是列表页时，页面其余部分用不上（不抽链接），
+    返回截断位置；列表页需要完整正文，返回 None。站点改了 title / h1 选择器时不截断。
+    start 为上次检查时已读的字节数：title / h1 在那之前就已读齐的，上次已判定过（是列表页）。"""
+    rules = rules or DEFAULT_RULES
+    if rules.selectors["title"][:1] != ["title"] or rules.selectors["h1"][:1] != ["h1"]:
+        return None
+    t = _TITLE_RE.search(buf)
+    h = _H1_RE.search(buf) if t is not None else None
+    if h is None or max(t.end(), h.end()) <= start:
+        return None
+    if rules.looks_like_listing(url, f"{_bytes_text(t.group(1))} {_bytes_text(h.group(1))}"):
+        return None
+    return max(t.end(), h.end())
+
+def product_cut(url: str, buf: bytes, rules: Optional[SiteRules] = None, start: int = 0) -> Optional[int]:
+    """详情页：截至最后一个完整 </script> 的前缀已能走通快速路径（产品 JSON-LD、面包屑、canonical 齐全）时，
+    返回截断位置，剩下的正文不再下载。
+
+    start 为上次检查时已读的字节数：之后没有读到新的完整 </script> 时前缀没变，不再重新解码、解析。
+    """
+    # 只在新读到的部分里找（留出 "</script" 跨块的余量）
+    end = buf.rfind(b"</script", max(0, start - 16))
+    end = buf.find(b">", end) if end >= 0 else -1
+    if end < start:
+        return None
+    out, _ = fast_product_fields(bytes(buf[:end + 1]).decode("utf-8", errors="replace"), url)
+    return end + 1 if out is not None else None
+
+def reuse_listing_analysis(prev: Dict[str, Any], url: str, rules: Optional[SiteRules] = None) -> Optional[Dict[str, Any]]:
+    """正文与 prev 完全相同的页面：按新 URL 重算上下文，链接直接复用。
+
+    prev 当时不是类目页（未抽取链接）而新 URL 让它成为类目页时返回 None，调用方需要完整解析。
+    """
+    old = prev["context"]
+    ctx = classify_context(url, old["title"], old["h1"], old["is_product"], rules)
+    if ctx["is_category"] and not old["is_category"]:
+        return None
+    keep = ctx["is_category"]
+    # 分页信息相对 prev 的 URL 算出，不能照搬；内容重复的分页由调用方按页码与链接识别
+    page = {"context": ctx, "product_links": prev["product_links"] if keep else [],
+            "expansion_links": prev["expansion_links"] if keep else [], "pagination": None}
+    if "product_cards" in prev:
+        page["product_cards"] = prev["product_cards"] if keep else []
+    return page
@@ -0,0 +1,83 @@
+# src/parsepool.py
+import multiprocessing, os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, Union
+
+from metrics import METRICS
+
+# 解析与网络 I/O 解耦：抓取线程只负责拿到原始字节，CPU 密集的 BeautifulSoup/lxml 解析交给进程池，
+# 不受 GIL 限制。map() 按输入顺序产出结果，在途任务数有上限——解析跟不上时停止消费上游
+# （fetch_many 的生成器），抓取随之暂停，内存中积压的页面数始终有界。
+Task = Tuple[Any, Union[tuple, Exception, "Ready"]]   # (key, 参数元组)；给异常 / Ready 时不解析，原样透传
+
+class Ready:
+    """已经有结果的任务（如去重命中），不进入进程池，但仍按输入顺序产出。"""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+def _run(fn: Callable, args: tuple):
+    """子进程入口：异常作为结果返回；子进程内记录的指标随结果带回父进程汇总。"""
+    METRICS.drain()
+    try:
+        result = fn(*args)
+    except Exception as e:
+        result = e
+    return result, METRICS.drain()
+
+class ParsePool:
+    """workers=0 时在调用线程内联执行（默认，行为与单进程一致）；>0 时使用 workers 个子进程，<0 表示每核一个。"""
+
+    def __init__(self, workers: Optional[int] = 0, max_pending: Optional[int] = None):
+        if workers is not None and workers < 0:
+            workers = os.cpu_count() or 1
+        self.workers = workers or 0
+        self.max_pending = max(1, max_pending or 2 * self.workers)
+        # spawn 而非 fork：fork 时抓取线程可能正持有锁（日志 / 指标 / urllib3），子进程会继承到死锁状态
+        self._pool = (ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                      if self.workers else None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def map(self, fn: Callable, tasks: Iterable[Task]) -> Iterator[Tuple[Any, Any]]:
+        """按输入顺序产出 (key, 结果或异常)。"""
+        if self._pool is None:
+            for key, args in tasks:
+                if isinstance(args, (Exception, Ready)):
+                    yield key, args.value if isinstance(args, Ready) else args
+                    continue
+                try:
+                    yield key, fn(*args)
+                except Exception as e:
+                    yield key, e
+            return
+
+        def result(fut: Future):
+            res, (counters, hists) = fut.result()
+            METRICS.merge(counters, hists)
+            return res
+
+        pending = deque()
+        for key, args in tasks:
+            if isinstance(args, (Exception, Ready)):
+                fut = Future(); fut.set_result((args.value if isinstance(args, Ready) else args, ({}, {})))
+            else:
+                fut = self._pool.submit(_run, fn, args)
+            pending.append((key, fut))
+            if len(pending) >= self.max_pending:
+                k0, f0 = pending.popleft()
+                yield k0, result(f0)
+        while pending:
+            k0, f0 = pending.popleft()
+            yield k0, result(f0)
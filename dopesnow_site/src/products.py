@@ -1,216 +1,478 @@
 # src/products.py
-from typing import List, Dict, Set
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Dict, Optional, Set, Tuple
 from urllib.parse import urljoin, urlparse
-import xml.etree.ElementTree as ET
-import requests
 from tqdm import tqdm
 
 from httpclient import HttpClient
+from state import CrawlState
+from frontier import Frontier, PriorityFn, site_priority
+from urltable import BloomFilter, Provenance
+from sitemap import fetch_sitemap_urls
+from metrics import METRICS, failure_reason
+from pagination import Paginator
+from parsepool import ParsePool, Ready, Task
+from productstore import GONE_REASONS, ProductStore
+from siteprofile import SiteProfile
 from parse import (
-    discover_product_links_from_html,
-    parse_product_page,
-    soupify,
-    classify_page_context,   # 现在包含 is_category / is_product 标记
+    analyze_listing_page,    # 每页只解析一次：分类 / 详情链接 / 扩展链接
+    analyze_product_page,    # 产品字段；两者只收原始字节，可在解析进程池中执行
+    body_digest, head_canonical, reuse_listing_analysis,   # 解析前去重
+    discovery_cut, product_cut,                            # 流式抓取：够用即停止读取
+    DEFAULT_RULES, SiteRules,
 )
 
-CATEGORY_DENY = ["account","cart","login","help","search","blog","travel"]
+if TYPE_CHECKING:
+    from distributed import Coordinator
+
+# 按正文摘要缓存最近的列表页分析结果：分页越界、同一列表的别名 URL 等返回相同内容时直接复用，不再解析
+LISTING_DEDUP_CACHE = 1024
+# 详情阶段同时未定稿的产品数：之后又有这么多个新产品出现、期间没有新的别名 URL 并入的产品即定稿写出
+FINALIZE_WINDOW = 512
+
+class Duplicate:
+    """详情页的 canonical 已经解析过：跳过解析，只合并来源。"""
+    __slots__ = ("key",)
+
+    def __init__(self, key: str):
+        self.key = key
 
 def normalize_url(u: str) -> str:
     p = urlparse(u)
     return f"{p.scheme}://{p.netloc}{p.path}"
 
-# sitemap 作为补种子（含列表页 & 详情页 URL）
-def fetch_sitemap_urls(base_url: str, limit: int = 4000) -> List[str]:
-    base = base_url.rstrip("/")
-    candidates = [f"{base}/sitemap.xml"]
+def product_key(prod: Dict) -> str:
+    """产品的去重键：canonical URL（缺省用详情页 URL）去掉查询串。"""
+    return normalize_url(prod.get("canonical_url") or prod["url"])
 
-    def fetch_one(xml_url: str):
-        try:
-            r = requests.get(xml_url, timeout=20, headers={"User-Agent":"Mozilla/5.0"})
-            r.raise_for_status()
-        except Exception:
-            return []
-        try:
-            root = ET.fromstring(r.text)
-        except Exception:
-            return []
-        ns={"sm":"http://www.sitemaps.org/schemas/sitemap/0.9"}
-        urls=[loc.text.strip() for loc in root.findall(".//sm:url/sm:loc", ns) if loc.text]
-        if urls: return urls
-        subs=[loc.text.strip() for loc in root.findall(".//sm:sitemap/sm:loc", ns) if loc.text]
-        return subs
-
-    visited_sm:set[str]=set()
-    queue=list(candidates)
-    all_urls:List[str]=[]
-    while queue and len(all_urls)<limit:
-        sm=queue.pop(0)
-        if sm in visited_sm: continue
-        visited_sm.add(sm)
-        got=fetch_one(sm)
-        if not got: continue
-        if got and got[0].lower().endswith(".xml"):
-            queue.extend([s for s in got if s not in visited_sm])
+# —— 抓取 + 解析任务：本进程的 _crawl 与分布式工作进程（distributed.run_worker）共用 ——
+def listing_fetches(client: HttpClient, batch: Iterable[str], workers: int, rules: Optional[SiteRules],
+                    listing_only: bool, cache: "OrderedDict[bytes, Dict]") -> Iterator[Task]:
+    """发现阶段：抓取 batch，产出 analyze_listing_page 的任务 ((url, 正文摘要), 参数)。
+
+    title / h1 已表明不是列表页时不再读正文；正文与 cache 中某页相同时直接复用其分析结果。
+    """
+    base_url = client.settings.base_url
+
+    def until(u: str, buf: bytes, start: int) -> Optional[int]:
+        return discovery_cut(u, buf, rules, start)
+
+    for url, resp in client.fetch_many(batch, workers, until=until):
+        if isinstance(resp, Exception):
+            yield (url, None), resp
+            continue
+        digest = body_digest(resp.content)
+        prev = cache.get(digest)
+        page = reuse_listing_analysis(prev, url, rules) if prev is not None else None
+        if page is not None:
+            METRICS.inc("crawl_dedup_total", stage="discovery", reason="content")
+            yield (url, digest), Ready(page)
         else:
-            all_urls.extend(got)
-
-    host = urlparse(base_url).netloc.lower()
-    wanted=[]
-    for u in all_urls:
-        if urlparse(u).netloc.lower()!=host: continue
-        lu=u.lower()
-        if any(k in lu for k in [
-            "men","women","snow","jacket","pant","hoodie","goggle","fleece","base","t-shirt",
-            "beanie","glove","helmet","mask","sock","backpack","outerwear","facemask"
-        ]):
-            wanted.append(u)
-
-    seen=set(); out=[]
-    for u in wanted:
-        if u not in seen:
-            seen.add(u); out.append(u)
-        if len(out)>=limit: break
-    return out
-
-def crawl_products(client: HttpClient, seeds: List[str], max_pages: int = 200) -> List[Dict]:
-    visited: Set[str] = set()
-    queue: List[str] = []
-    product_urls: Set[str] = set()
-    product_contexts: Dict[str, List[Dict]] = {}  # 仅记录来自“类目/列表页”的来源
-
-    # 初始化 seeds
-    if not seeds:
-        seeds = [client.settings.base_url]
-    if len(seeds) <= 1:
-        sm_seeds = fetch_sitemap_urls(client.settings.base_url, limit=4000)
-        if sm_seeds:
-            print(f"  Loaded {len(sm_seeds)} seeds from sitemap.xml")
-            seeds = list(set(seeds + sm_seeds))
-    for s in seeds:
-        if s.startswith("/"): s = urljoin(client.settings.base_url, s)
-        queue.append(s)
+            yield (url, digest), (resp.content, resp.encoding, url, base_url, rules, listing_only)
 
-    # BFS
+def remember_listing(cache: "OrderedDict[bytes, Dict]", digest: Optional[bytes], page: Dict) -> None:
+    if digest is None:
+        return
+    cache[digest] = page; cache.move_to_end(digest)
+    if len(cache) > LISTING_DEDUP_CACHE:
+        cache.popitem(last=False)
+
+def detail_fetches(client: HttpClient, urls: Iterable[str], workers: int, rules: Optional[SiteRules],
+                   fast: bool, keys: Set[str]) -> Iterator[Task]:
+    """详情阶段：抓取 urls，产出 analyze_product_page 的任务 (url, 参数)。
+
+    快速路径所需的 JSON-LD / canonical 读齐即停止读取（不走快速路径时需要完整 DOM）；
+    入池前从 <head> 取 canonical，已在 keys 中（已解析过）的颜色/尺码变体、别名 URL 不再解析。
+    """
+    def until(u: str, buf: bytes, start: int) -> Optional[int]:
+        return product_cut(u, buf, rules, start)
+
+    for purl, resp in client.fetch_many(urls, workers, until=until if fast else None):
+        if isinstance(resp, Exception):
+            yield purl, resp
+            continue
+        canonical = head_canonical(resp.content, resp.encoding)
+        key = normalize_url(canonical) if canonical else None
+        if key is not None and key in keys:
+            yield purl, Ready(Duplicate(key))
+        else:
+            yield purl, (resp.content, resp.encoding, purl, fast, rules)
+
+def crawl_products(client: HttpClient, seeds: List[str], max_pages: int = 200,
+                   concurrency: Optional[int] = None, priority: Optional[PriorityFn] = None) -> List[Dict]:
+    return list(iter_products(client, seeds, max_pages=max_pages, concurrency=concurrency, priority=priority))
+
+def iter_products(client: HttpClient, seeds: List[str], max_pages: int = 200,
+                  concurrency: Optional[int] = None, state: Optional[CrawlState] = None,
+                  priority: Optional[PriorityFn] = None, sitemap_since: Optional[datetime] = None,
+                  parse_workers: Optional[int] = None, profile: Optional[SiteProfile] = None,
+                  pool: Optional[ParsePool] = None, store: Optional[ProductStore] = None,
+                  listing_only: bool = False, remote: Optional["Coordinator"] = None) -> Iterator[Dict]:
+    """发现 + 详情解析；按 canonical 合并来源后逐个定稿 yield（详情阶段边解析边产出，见 FINALIZE_WINDOW），供 sink 增量写出。
+
+    传入 state 时，发现/解析进度会周期性写入检查点；state.resumed 为真则从检查点继续，
+    跳过已抓取的页面与已解析的详情 URL（其解析结果从 state 载入，不再请求）。
+    priority 决定 frontier 的出队顺序（默认：分页 > 列表页 > 其它链接 > sitemap 详情 URL）。
+    sitemap_since 非空时 sitemap 只补充 <lastmod> 晚于该时间的 URL。
+    parse_workers（默认读取 Settings.parse_workers）> 0 时页面解析交给进程池，抓取线程只搬运字节；
+    传入 pool 时使用调用方的解析池（多站点共用），parse_workers 不再生效。
+    profile 给出站点词表（分类 / 链接过滤 / 选择器 / sitemap 关键词），默认用内置词表。
+    store 给出时为增量模式：内容指纹与库中相同的产品不定稿、不 yield（见 iter_product_changes）。
+    listing_only=True 时产品数据直接取自列表页卡片（名称 / 价格 / 图片），只有卡片不全的产品才抓详情页；
+    与 store 同用时，卡片与上一轮相同的产品视为没变，卡片变了才抓详情页。
+    remote 给出时为分布式协调进程：页面的抓取与解析由租用任务的工作进程完成（见 distributed.py），
+    frontier / 来源 / 定稿 / 检查点仍在本进程；此时 concurrency 是整个集群每轮在途的页面数，本地不建解析进程。
+    """
+    if pool is not None or remote is not None:
+        yield from _crawl(client, seeds, max_pages, concurrency, state, priority, sitemap_since,
+                          pool or ParsePool(0), profile, store, listing_only, remote)
+        return
+    n = client.settings.parse_workers if parse_workers is None else parse_workers
+    with ParsePool(n) as pool:
+        yield from _crawl(client, seeds, max_pages, concurrency, state, priority, sitemap_since, pool, profile,
+                          store, listing_only)
+
+def iter_product_changes(client: HttpClient, seeds: List[str], store: ProductStore, **kwargs) -> Iterator[Dict]:
+    """增量模式：只产出相对 store 的变更记录 {"change": "added" | "changed" | "removed", "key", ["diff",] "product"}。
+
+    内容没变的产品在定稿前就被跳过；removed 只在抓取跑完后给出（中途中断不会把没抓到的产品判为下架），
+    且只包括详情页返回 404 / 410 的产品与连续多次完整运行都没见到的产品（见 ProductStore.removed）。
+    其余参数同 iter_products。
+    """
+    for product in iter_products(client, seeds, store=store, **kwargs):
+        change = store.apply(product_key(product), product)
+        if change is not None:
+            METRICS.inc("delta_products_total", result=change["change"])
+            yield change
+    for change in store.removed():
+        METRICS.inc("delta_products_total", result="removed")
+        yield change
+    METRICS.inc("delta_products_total", store.missing(), result="missing")
+
+def _crawl(client: HttpClient, seeds: List[str], max_pages: int, concurrency: Optional[int],
+           state: Optional[CrawlState], priority: Optional[PriorityFn], sitemap_since: Optional[datetime],
+           pool: ParsePool, profile: Optional[SiteProfile], store: Optional[ProductStore] = None,
+           listing_only: bool = False, remote: Optional["Coordinator"] = None) -> Iterator[Dict]:
+    # 并发度：默认读取 Settings.concurrence；每一轮按优先级出队至多 workers 个 URL 并发抓取，
+    # 结果按出队顺序依次处理，同一并发度下抓取顺序与合并结果可复现
+    workers = max(1, concurrency or client.settings.concurrence)
+    base_url = client.settings.base_url
+    # 解析进程多于抓取线程时放大每轮批次，否则解析进程吃不满
+    batch_size = max(workers, pool.workers)
+    settings = client.settings
+    # 站点词表随任务一起交给解析函数（进程池里按词表内容复用已编译的规则）；内置词表传 None
+    rules: Optional[SiteRules] = profile.rules() if profile is not None else None
+    if priority is None and rules is not None:
+        priority = site_priority(rules)
+    seen = BloomFilter(settings.seen_filter_capacity, settings.seen_filter_error) if settings.seen_filter_capacity > 0 else None
+    queue = Frontier(priority, seen=seen)
+    # 产品 URL -> 来源（仅记录来自“类目/列表页”的来源）；产品 URL 集合即其键集合
+    provenance = Provenance()
+    # listing_only：产品 URL -> 列表卡片（同一产品出现在多个列表页时保留第一张完整的卡片）
+    cards: Dict[str, Dict] = {}
     pages = 0
-    with tqdm(total=max_pages, desc="Discovering pages", unit="page") as pbar:
+
+    if state is not None and state.resumed:
+        pending, visited, product_urls, contexts, pages = state.load_discovery()
+        for purl, recs in contexts.items():
+            for r in recs:
+                provenance.add(purl, r["gender"], r["category"], r["source_url"])
+        for purl in product_urls - set(contexts):
+            provenance.extend(purl, ())
+        queue.mark_seen(visited)
+        if listing_only:
+            cards = state.cards()
+        for u, src in pending:
+            queue.push(u, src)
+        print(f"  Resumed: {len(visited)} pages fetched, {len(queue)} queued, {len(provenance)} product candidates")
+        del visited, product_urls, contexts   # 之后只保留紧凑结构
+    else:
+        # 初始化 seeds
+        if not seeds:
+            seeds = [client.settings.base_url]
+        sm_seeds: List[str] = []
+        if len(seeds) <= 1:
+            sm_seeds = fetch_sitemap_urls(client, limit=4000, since=sitemap_since,
+                                          keywords=profile.sitemap_keywords if profile is not None else None)
+            if sm_seeds:
+                print(f"  Loaded {len(sm_seeds)} seeds from sitemap.xml")
+        for s in seeds:
+            if s.startswith("/"): s = urljoin(client.settings.base_url, s)
+            queue.push(s, "seed")
+        queue.extend(sm_seeds, "sitemap")
+
+    if state is not None and state.phase in ("detail", "done"):
+        queue = Frontier(priority)  # 发现阶段已完成
+
+    listing_cache: "OrderedDict[bytes, Dict]" = OrderedDict()
+    # 分页列表直接按页码排期（一批并发抓取），空页 / 重复页之后的页不再抓
+    paginator = Paginator(window=batch_size)
+
+    # BFS
+    with tqdm(total=max_pages, initial=min(pages, max_pages), desc="Discovering pages", unit="page") as pbar:
         while queue and pages < max_pages:
-            url = queue.pop(0)
-            if url in visited: 
-                continue
-            try:
-                resp = client.get(url)
-            except Exception:
-                pages += 1; pbar.update(1); continue
-
-            visited.add(url); pages += 1; pbar.update(1)
-            html = resp.text
-            ctx = classify_page_context(html, url)  # <- 关键：判别页面类型
-            is_category = ctx["is_category"]
-            is_product  = ctx["is_product"]
-            gender = ctx.get("gender")
-            cats   = ctx.get("categories") or []
-
-            # 仅在“类目/列表页”上记录产品来源 & 抽取详情链接
-            if is_category:
-                detail_links = discover_product_links_from_html(html, client.settings.base_url)
-                for href in detail_links:
-                    absu = urljoin(client.settings.base_url, href) if href.startswith("/") else href
-                    norm = normalize_url(absu)
-                    product_urls.add(norm)
-                    # 把该产品“来自哪个 Men/Women + 类目列表页”写进 found_in
-                    if not cats:
-                        # 没识别到明确类目时，记录一个 category=None 也可（可视化时可过滤）
-                        product_contexts.setdefault(norm, []).append({
-                            "gender": gender or None,
-                            "category": None,
-                            "source_url": url,
-                        })
-                    else:
-                        for c in cats:
-                            product_contexts.setdefault(norm, []).append({
-                                "gender": gender or None,
-                                "category": c,
-                                "source_url": url,
-                            })
-
-            # 扩展新的“探索页”：只扩展可能是类目/列表的 URL，避免把详情页当入口
-            if is_category:
-                soup = soupify(html)
-                expand_links=[]
-                for a in soup.select("a[href]"):
-                    h=a.get("href",""); 
-                    if not h or h.startswith("#"): continue
-                    if h.startswith("/"): h=urljoin(client.settings.base_url, h)
-                    if urlparse(h).netloc.lower()!=urlparse(client.settings.base_url).netloc.lower(): 
-                        continue
-                    low=h.lower()
-                    if any(x in low for x in CATEGORY_DENY): 
+            batch: List[str] = []
+            sources: Dict[str, str] = {}
+            while queue and len(batch) < min(batch_size, max_pages - pages):
+                u, src = queue.pop_item()
+                if paginator.skip(u):
+                    METRICS.inc("crawl_dedup_total", stage="discovery", reason="pagination_end")
+                    continue
+                batch.append(u)
+                sources[u] = src
+
+            if remote is not None:
+                results = remote.listing(batch)
+            else:
+                results = pool.map(analyze_listing_page,
+                                   listing_fetches(client, batch, workers, rules, listing_only, listing_cache))
+            for (url, digest), page in results:
+                pages += 1; pbar.update(1)
+                if isinstance(page, Exception):
+                    reason = failure_reason(page)
+                    METRICS.inc("crawl_failures_total", stage="discovery", reason=reason)
+                    if reason in GONE_REASONS:
                         continue
-                    # 具有“列表/类目页”的外观：带 men/women 或带类目词 或 ?page=
-                    if ("?page=" in low) or ("men" in low) or ("women" in low) or any(
-                        kw in low for kw in [
-                            "jacket","pant","goggle","fleece","base","hoodie","t-shirt","beanie",
-                            "glove","helmet","mask","sock","backpack","outerwear","facemask"
-                        ]
-                    ):
-                        expand_links.append(h)
-                for link in expand_links[:50]:
-                    if link not in visited:
-                        queue.append(link)
-
-    print(f"  Discovered product URL candidates: {len(product_urls)}")
-
-    # 解析 + 合并（按 canonical URL）
-    products_by_key: Dict[str, Dict] = {}
-    for purl in tqdm(sorted(product_urls), desc="Parsing products", unit="product"):
+                    if queue.requeue(url, sources.get(url, "link")):
+                        METRICS.inc("crawl_requeues_total", stage="discovery", reason=reason)
+                    elif store is not None:
+                        store.partial("discovery_failed")   # 重试用尽：这一页上的产品本轮可能没被发现（404 / 410 的页不算）
+                    continue
+                remember_listing(listing_cache, digest, page)
+                if state is not None:
+                    state.add_visited(url)
+                ctx = page["context"]  # <- 关键：判别页面类型
+                is_category = ctx["is_category"]
+                is_product  = ctx["is_product"]
+                gender = ctx.get("gender")
+                cats   = ctx.get("categories") or []
+                METRICS.inc("crawl_pages_total", kind="category" if is_category else "product" if is_product else "other")
+
+                # 仅在“类目/列表页”上记录产品来源 & 抽取详情链接
+                if is_category:
+                    detail_links = page["product_links"]
+                    # 把该产品“来自哪个 Men/Women + 类目列表页”写进 found_in；同一页的上下文对所有产品相同，只驻留一次
+                    # 没识别到明确类目时，记录一个 category=None 也可（可视化时可过滤）
+                    ctx_ids = [provenance.context(gender or None, c, url) for c in (cats or [None])]
+                    ctxs = provenance.expand(ctx_ids) if state is not None else None
+                    for href in detail_links:
+                        absu = urljoin(base_url, href) if href.startswith("/") else href
+                        norm = normalize_url(absu)
+                        provenance.extend(norm, ctx_ids)
+                        if state is not None:
+                            state.add_product_url(norm, ctxs)
+                    for card in page.get("product_cards", ()):
+                        href = card["url"]
+                        norm = normalize_url(urljoin(base_url, href) if href.startswith("/") else href)
+                        if norm not in cards or (card_complete(card) and not card_complete(cards[norm])):
+                            cards[norm] = {**card, "url": norm}
+                            if state is not None:
+                                state.add_card(norm, cards[norm])
+
+                # 扩展新的“探索页”：只扩展可能是类目/列表的 URL，避免把详情页当入口；
+                # 已识别的分页列表由 paginator 直接排期，其页码链接不占扩展名额
+                if is_category:
+                    queue.extend(paginator.observe(url, page.get("pagination"), page["product_links"]), "page")
+                    expand_links = [u for u in page["expansion_links"] if not paginator.is_page(u)]
+                    queue.extend(expand_links[:50], "link")
+
+            if state is not None and state.due():
+                state.checkpoint("discovery", queue=queue.pending(), pages=pages, force=True)
+
+    if store is not None and (queue or sitemap_since is not None):
+        # 发现被 max_pages 截断 / sitemap 只补充了新条目：没见到的产品不能算作下架
+        store.partial("max_pages" if queue else "sitemap_since")
+    if state is not None:
+        state.checkpoint("detail", queue=[], pages=pages, force=True)
+
+    print(f"  Discovered product URL candidates: {len(provenance)}")
+
+    # 解析（按 canonical URL 分组）+ 定稿：同一 canonical 的所有详情 URL（颜色/尺码变体、别名 URL）的来源都并入该产品。
+    # 未定稿的产品放在一个有界窗口里（按最近一次并入排序）；超出 FINALIZE_WINDOW 时最早的产品定稿、交给调用方，
+    # sink 照常增量写出。定稿后才出现的别名 URL 只计数，来源不再并入（详情 URL 按字典序处理，别名多半相邻）。
+    # 定稿前的产品同时存进检查点：恢复时逐个读出重新定稿，不在内存里留整个目录
+    keys: Set[str] = set()                                              # 已解析出的产品键（含已定稿的、增量模式下没变的）
+    window: "OrderedDict[str, Tuple[List[str], Dict]]" = OrderedDict()   # 产品键 -> (详情 URL, 定稿前的解析结果)
+    summary = provenance.summarize()
+
+    def finish(key: str, purls: List[str], pdata: Dict) -> Optional[Dict]:
         try:
-            resp = client.get(purl)
-            pdata = parse_product_page(resp.text, purl)
-            if not (pdata.get("name") or (pdata.get("price") is not None)):
-                continue
-            key = normalize_url(pdata.get("canonical_url") or purl)
-            if key not in products_by_key:
-                products_by_key[key] = pdata
-                products_by_key[key]["found_in"] = []
-            # 合并 found_in（只来自类目/列表页）
-            products_by_key[key]["found_in"].extend(product_contexts.get(purl, []))
-            products_by_key[key]["found_in"].extend(product_contexts.get(key, []))
-        except Exception:
+            # 合并 found_in（只来自类目/列表页）：该产品全部详情 URL 与 canonical 的来源，
+            # 去重与性别 / 列表页数在 summary 里按产品算好
+            found_in, fin_cats, mask, listing_pages = summary.lookup(*purls, key)
+            pdata["found_in"] = found_in
+            product = finalize_product(pdata, rules, (fin_cats, mask, listing_pages))
+        except Exception as e:
+            METRICS.inc("crawl_failures_total", stage="parse", reason=failure_reason(e))
+            return None
+        METRICS.inc("crawl_products_total")
+        return product
+
+    def overflow() -> Iterator[Dict]:
+        while len(window) > FINALIZE_WINDOW:
+            key, (purls, pdata) = window.popitem(last=False)
+            product = finish(key, purls, pdata)
+            if product is not None:
+                yield product
+
+    todo = sorted(provenance.product_urls())
+    if state is not None and state.resumed:
+        # 上一轮已解析的产品（输出文件会重写）：逐个重新定稿；之后出现的别名 URL 按定稿后处理
+        for key, purls, pdata in state.iter_groups():
+            product = finish(key, purls, pdata)
+            if product is not None:
+                yield product
+        keys.update(key for _, key in state.parsed() if key is not None)
+        done = state.parsed_urls()
+        todo = [u for u in todo if u not in done]
+    fast = client.settings.fast_parse
+
+    if listing_only:
+        # 卡片齐全的产品不抓详情页：没有 store 时直接由卡片定稿；有 store 时卡片与上一轮相同即视为没变
+        fetch: List[str] = []
+        for purl in todo:
+            card = cards.get(purl)
+            if card is None or not card_complete(card):
+                METRICS.inc("crawl_cards_total", result="incomplete" if card else "missing")
+                fetch.append(purl)
+            elif store is not None:
+                if store.card_unchanged(purl, card):
+                    METRICS.inc("crawl_cards_total", result="unchanged")
+                    METRICS.inc("delta_products_total", result="unchanged")
+                    keys.add(purl)
+                    if state is not None:
+                        state.add_parsed(purl, purl, None)
+                else:
+                    METRICS.inc("crawl_cards_total", result="changed")
+                    fetch.append(purl)
+            else:
+                METRICS.inc("crawl_cards_total", result="used")
+                pdata = product_from_card(card, [])
+                keys.add(purl)
+                window[purl] = ([purl], pdata)
+                if state is not None:
+                    state.add_parsed(purl, purl, pdata)
+                    state.checkpoint("detail")
+                yield from overflow()
+        print(f"  Product cards: {len(todo) - len(fetch)} from listings, {len(fetch)} detail pages to fetch")
+        todo = fetch
+
+    if remote is not None:
+        results = remote.details(todo)
+    else:
+        results = pool.map(analyze_product_page, detail_fetches(client, todo, workers, rules, fast, keys))
+    for purl, pdata in tqdm(results, total=len(todo), desc="Parsing products", unit="product"):
+        if isinstance(pdata, Exception):
+            METRICS.inc("crawl_failures_total", stage="detail", reason=failure_reason(pdata))
+            if store is not None:
+                store.failed(purl, pdata)   # 404 / 410 记为下架，其它失败不算下架
+            continue
+        if isinstance(pdata, Duplicate):
+            # 没有解析，这个 URL 的来源照样并入该产品；检查点里只记 URL -> 产品键，恢复时据此重建分组
+            METRICS.inc("crawl_dedup_total", stage="detail", reason="canonical")
+            METRICS.inc("crawl_products_duplicate_total")
+            if pdata.key in window:
+                window[pdata.key][0].append(purl)
+                window.move_to_end(pdata.key)
+            if state is not None:
+                state.add_parsed(purl, pdata.key, None)
+                state.checkpoint("detail")
             continue
+        key = None
+        try:
+            if pdata.get("name") or (pdata.get("price") is not None):
+                key = product_key(pdata)
+        except Exception as e:
+            METRICS.inc("crawl_failures_total", stage="parse", reason=failure_reason(e))
+            if store is not None:
+                store.failed(purl, e)
+            continue
+        if key is None:
+            pdata = None
+            if store is not None:
+                store.failed(purl)   # 没解析出名称 / 价格：不算下架
+        elif key in window:
+            # 同一 canonical 的其它 URL（变体/别名）已解析：只把这个 URL 的来源并入该产品
+            METRICS.inc("crawl_products_duplicate_total")
+            window[key][0].append(purl)
+            window.move_to_end(key)
+            pdata = None
+        elif key in keys:
+            # 该产品已定稿写出（别名 URL 来得太晚，来源不再并入），或增量模式下没变的产品的其它 URL
+            METRICS.inc("crawl_products_duplicate_total")
+            pdata = None
+        elif store is not None and store.unchanged(key, pdata):
+            # 增量模式：内容指纹没变，不定稿、不写出；仍记下产品键，变体 URL 照常去重
+            METRICS.inc("delta_products_total", result="unchanged")
+            keys.add(key)
+            pdata = None
+        else:
+            keys.add(key)
+            window[key] = ([purl], pdata)
+        if state is not None:
+            state.add_parsed(purl, key, pdata)
+            state.checkpoint("detail")
+        yield from overflow()
+
+    while window:
+        key, (purls, pdata) = window.popitem(last=False)
+        product = finish(key, purls, pdata)
+        if product is not None:
+            yield product
+
+    if state is not None:
+        state.checkpoint("done", force=True)
+
+CARD_FIELDS = ("name", "price", "image")
+
+def card_complete(card: Dict) -> bool:
+    return all(card.get(f) not in (None, "") for f in CARD_FIELDS)
+
+def product_from_card(card: Dict, found_in: List[Dict]) -> Dict:
+    """只有列表卡片时的产品记录：canonical 取规范化后的详情 URL，sku / brand / description 留空。"""
+    return {"url": card["url"], "canonical_url": card["url"], "name": card["name"], "price": card["price"],
+            "priceCurrency": card.get("priceCurrency", ""), "availability": "", "sku": "", "brand": "",
+            "images": [card["image"]], "description": "", "categories": [], "found_in": found_in}
 
-    # 清洗 found_in，并输出 gender / categories
-    result = []
-    for key, prod in products_by_key.items():
+GENDER_BY_MASK = {0: "unknown", 1: "men", 2: "women", 3: "both"}   # 位图：1=men，2=women
+
+def finalize_product(prod: Dict, rules: Optional[SiteRules] = None,
+                     summary: Optional[Tuple[List[str], int, int]] = None) -> Dict:
+    """清洗 found_in，并输出 gender / categories / listing_pages（产品出现过的不同列表页数）。
+
+    summary=(来源类目, 性别位图, 列表页数) 由 ProvenanceSummary 批量算好时 found_in 已去重，直接采用；
+    否则按 found_in 逐条去重、汇总。
+    """
+    fin = prod.get("found_in", [])
+    if summary is None:
         # 去重 found_in
-        seen = set(); fin=[]
-        for r in prod.get("found_in", []):
+        seen = set(); uniq=[]
+        for r in fin:
             tup = (r.get("gender"), r.get("category"), r.get("source_url"))
             if tup not in seen:
-                seen.add(tup); fin.append(r)
-        prod["found_in"] = fin
-
-        # 汇总 gender
-        gvals = [x.get("gender") for x in fin if x.get("gender")]
-        if gvals:
-            men = sum(1 for x in gvals if x == "men")
-            women = sum(1 for x in gvals if x == "women")
-            prod["gender"] = "both" if (men and women) else ("men" if men else ("women" if women else "unknown"))
-        else:
-            prod["gender"] = "unknown"
-
-        # 汇总 categories（found_in 的 category + 详情页自身解析到的）
-        cat_from_fin = [x.get("category") for x in fin if x.get("category")]
-        all_cats = (prod.get("categories") or []) + cat_from_fin
-        clean=[]; seen=set()
-        for c in all_cats:
-            c = (c or "").strip()
-            if not c: continue
-            if c.lower() in ("home","shop","bestsellers","new-arrivals","sale"): 
-                continue
-            if c not in seen:
-                seen.add(c); clean.append(c)
-        prod["categories"] = clean
-
-        result.append(prod)
-
-    return result
+                seen.add(tup); uniq.append(r)
+        fin = uniq
+        genders = {x.get("gender") for x in fin}
+        summary = ([x.get("category") for x in fin if x.get("category")],
+                   ("men" in genders) | ("women" in genders) << 1, len({x.get("source_url") for x in fin}))
+    prod["found_in"] = fin
+    cat_from_fin, mask, listing_pages = summary
+
+    # 汇总 gender
+    prod["gender"] = GENDER_BY_MASK[mask]
+
+    # 汇总 categories（found_in 的 category + 详情页自身解析到的）
+    all_cats = (prod.get("categories") or []) + cat_from_fin
+    skip = {"home", "shop"} | (rules or DEFAULT_RULES).collection_signals
+    clean=[]; seen=set()
+    for c in all_cats:
+        c = (c or "").strip()
+        if not c: continue
+        if c.lower() in skip:
+            continue
+        if c not in seen:
+            seen.add(c); clean.append(c)
+    prod["categories"] = clean
+    prod["listing_pages"] = listing_pages
+    return prod
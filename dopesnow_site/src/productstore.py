@@ -0,0 +1,195 @@
+# src/productstore.py
+import hashlib, json, sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+
+from metrics import failure_reason
+
+# 增量（delta）模式的本地产品库（SQLite）：按 canonical URL 存每个产品上一次的内容指纹与完整记录。
+# 指纹只覆盖详情页解析出的、定稿时不会改写的内容字段（categories 会并入来源类目，found_in / gender /
+# listing_pages 由定稿补上，都不参与），所以在定稿之前就能判断"没变"，没变的产品不再定稿、不再写出。
+# 库跨运行保留；每次（非 resume）运行分配一个新的 run 号，见到的产品记上该 run 号。
+# 下架只有两种判定：详情页明确返回 404 / 410；或连续 removed_after 次完整运行都没见到（发现阶段常常不完整，
+# 一次没见到不算）。抓取 / 解析失败的产品视为见过；发现不完整的运行（max_pages 截断、列表页失败、
+# 只取新 sitemap 条目）不累计"没见到"的次数。
+# 只抓列表页的模式（listing_only）另存每个产品上一次的列表卡片：卡片没变就连详情页也不抓。
+GONE_REASONS = {"http_404", "http_410"}
+REMOVED_AFTER = 3
+
+FINGERPRINT_FIELDS = ("canonical_url", "name", "price", "priceCurrency", "availability", "sku", "brand",
+                      "description", "images")
+DIFF_FIELDS = FINGERPRINT_FIELDS + ("categories", "gender")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS products (
+    key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, data TEXT NOT NULL,
+    first_seen TEXT NOT NULL, last_changed TEXT NOT NULL, last_run INTEGER NOT NULL, url TEXT, card TEXT,
+    missed INTEGER NOT NULL DEFAULT 0, gone INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS products_last_run ON products(last_run);
+"""
+
+def product_fingerprint(prod: Dict[str, Any]) -> str:
+    """parse_product_page 输出的内容指纹（与变体 URL 无关；定稿前后的产品算出的值相同）。"""
+    raw = json.dumps([prod.get(f) for f in FINGERPRINT_FIELDS], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+def diff_products(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """字段级差异：{字段: {"old": 旧值, "new": 新值}}，只列出变化的字段。"""
+    return {f: {"old": old.get(f), "new": new.get(f)} for f in DIFF_FIELDS if old.get(f) != new.get(f)}
+
+class ProductStore:
+    """上一次运行的产品快照。
+
+    unchanged() 在定稿前调用：指纹相同则只记下"本轮见过"；apply() 对定稿后的产品给出 added / changed 记录；
+    failed() 记下详情页抓取 / 解析失败的 URL；partial() 标记本轮发现不完整；
+    removed() 在抓取跑完后调用，给出判定为下架的产品（404 / 410，或连续 removed_after 次完整运行没见到）并从库中删除。
+    resume=True 沿用上一轮（被中断的那一轮）的 run 号，已记为见过的产品不会被误判为下架。
+    """
+
+    def __init__(self, path: str, resume: bool = False, commit_every: int = 200, removed_after: int = REMOVED_AFTER):
+        self.path = path
+        self.commit_every = max(1, commit_every)
+        self.removed_after = max(1, removed_after)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        row = self.conn.execute("SELECT value FROM meta WHERE key='run'").fetchone()
+        self.run = int(row[0]) if row else 0
+        if not (resume and row):
+            self.run += 1
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('run', ?)", (str(self.run),))
+        self.now = datetime.now(timezone.utc).isoformat()
+        self._pending = 0
+        self._cards: Dict[str, Dict[str, Any]] = {}   # 详情 URL -> 本轮卡片，等详情定稿后随产品写入
+
+    def _migrate(self) -> None:
+        # 早期的库没有 url / card / missed / gone 列
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(products)")}
+        with self.conn:
+            for col in ("url", "card"):
+                if col not in cols:
+                    self.conn.execute(f"ALTER TABLE products ADD COLUMN {col} TEXT")
+            for col in ("missed", "gone"):
+                if col not in cols:
+                    self.conn.execute(f"ALTER TABLE products ADD COLUMN {col} INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS products_url ON products(url)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def _dirty(self) -> None:
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def unchanged(self, key: str, prod: Dict[str, Any]) -> bool:
+        """解析结果与库中指纹相同：记为本轮见过，返回 True（调用方跳过后续处理）。"""
+        row = self.conn.execute("SELECT fingerprint FROM products WHERE key=?", (key,)).fetchone()
+        if row is None or row[0] != product_fingerprint(prod):
+            return False
+        card = self._cards.pop(prod.get("url"), None)
+        if card is not None:
+            self.conn.execute("UPDATE products SET last_run=?, missed=0, gone=0, card=? WHERE key=?",
+                              (self.run, json.dumps(card, ensure_ascii=False), key))
+        else:
+            self.conn.execute("UPDATE products SET last_run=?, missed=0, gone=0 WHERE key=?", (self.run, key))
+        self._dirty()
+        return True
+
+    def card_unchanged(self, url: str, card: Dict[str, Any]) -> bool:
+        """列表卡片与上一次相同（按详情 URL 或 canonical 查找）：记为本轮见过，返回 True，不必抓详情页。
+
+        否则暂存这张卡片，详情页解析后随产品一起写入（见 unchanged / apply），下一轮据此比较。
+        """
+        row = self.conn.execute("SELECT key, card FROM products WHERE key=? OR url=? LIMIT 1", (url, url)).fetchone()
+        if row is not None and row[1] is not None and json.loads(row[1]) == card:
+            self.conn.execute("UPDATE products SET last_run=?, missed=0, gone=0 WHERE key=?", (self.run, row[0]))
+            self._dirty()
+            return True
+        self._cards[url] = card
+        return False
+
+    def apply(self, key: str, prod: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """写入定稿后的产品；返回变更记录（新增 / 变化），内容未变（如 resume 重放）时返回 None。"""
+        fp = product_fingerprint(prod)
+        data = json.dumps(prod, ensure_ascii=False)
+        card = self._cards.pop(prod.get("url"), None)
+        card = json.dumps(card, ensure_ascii=False) if card is not None else None
+        row = self.conn.execute("SELECT fingerprint, data, card FROM products WHERE key=?", (key,)).fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO products(key, fingerprint, data, first_seen, last_changed, last_run, url, card) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (key, fp, data, self.now, self.now, self.run, prod.get("url"), card))
+            self._dirty()
+            return {"change": "added", "key": key, "product": prod}
+        card = card or row[2]
+        if row[0] == fp:
+            self.conn.execute("UPDATE products SET last_run=?, missed=0, gone=0, url=?, card=? WHERE key=?",
+                              (self.run, prod.get("url"), card, key))
+            self._dirty()
+            return None
+        diff = diff_products(json.loads(row[1]), prod)
+        self.conn.execute("UPDATE products SET fingerprint=?, data=?, last_changed=?, last_run=?, missed=0, gone=0, "
+                          "url=?, card=? WHERE key=?", (fp, data, self.now, self.run, prod.get("url"), card, key))
+        self._dirty()
+        return {"change": "changed", "key": key, "diff": diff, "product": prod}
+
+    def failed(self, url: str, exc: Optional[BaseException] = None) -> None:
+        """详情页 url（按 canonical 或详情 URL 查找）抓取 / 解析失败：404 / 410 记为下架，其它失败记为本轮见过。"""
+        if exc is not None and failure_reason(exc) in GONE_REASONS:
+            # 同一产品的其它 URL 本轮已成功解析时不算下架
+            self.conn.execute("UPDATE products SET gone=1 WHERE (key=? OR url=?) AND last_run<?", (url, url, self.run))
+        else:
+            self.conn.execute("UPDATE products SET last_run=? WHERE (key=? OR url=?) AND gone=0", (self.run, url, url))
+        self._dirty()
+
+    def partial(self, reason: str) -> None:
+        """本轮发现不完整（reason 如 max_pages）：没见到的产品不累计缺席次数。resume 后仍然有效。"""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('partial_run', ?)",
+                              (f"{self.run}:{reason}",))
+
+    @property
+    def complete(self) -> bool:
+        row = self.conn.execute("SELECT value FROM meta WHERE key='partial_run'").fetchone()
+        return row is None or row[0].split(":", 1)[0] != str(self.run)
+
+    def removed(self) -> Iterator[Dict[str, Any]]:
+        """抓取跑完后调用：逐条给出下架的产品并从库中删除。
+
+        详情页返回 404 / 410 的产品直接下架；本轮完整时，没见到的产品缺席次数加一，连续 removed_after 次即下架。
+        """
+        if self.complete:
+            with self.conn:
+                self.conn.execute("UPDATE products SET missed=missed+1, last_run=? WHERE last_run<? AND gone=0",
+                                  (self.run, self.run))
+        where = "gone=1 OR missed>=?"
+        rows = self.conn.execute(f"SELECT key, data FROM products WHERE {where} ORDER BY key",
+                                 (self.removed_after,)).fetchall()
+        for key, data in rows:
+            yield {"change": "removed", "key": key, "product": json.loads(data)}
+        with self.conn:
+            self.conn.execute(f"DELETE FROM products WHERE {where}", (self.removed_after,))
+        self._pending = 0
+
+    def missing(self) -> int:
+        """还在库中、但最近的完整运行没见到的产品数（尚未判定下架）。"""
+        return self.conn.execute("SELECT COUNT(*) FROM products WHERE missed>0").fetchone()[0]
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
@@ -1,45 +1,312 @@
 # src/saver.py
 import os, csv, json
-from typing import List, Dict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import pyarrow as pa   # 可选依赖（parquet / arrow 输出）：pip install pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 def ensure_dir(path: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
 
-def write_site_json_single(out_path: str, menu_rows: List[Dict[str, str]], products: List[Dict]) -> None:
-    ensure_dir(out_path)
-    payload = {"menu": menu_rows, "products": products}
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+CSV_FIELDNAMES = [
+    "record_type",
+    "text","menu_url",
+    "product_url","canonical_url","name","price","priceCurrency","availability","sku","brand","description","images",
+    "image_assets","gender","categories","found_in","listing_pages",
+]
+SITE_CSV_FIELDNAMES = ["site"] + CSV_FIELDNAMES   # 多站点输出：每行带站点名
 
-def write_site_csv_single(out_path: str, menu_rows: List[Dict[str, str]], products: List[Dict]) -> None:
-    ensure_dir(out_path)
-    fieldnames = [
-        "record_type",
-        "text","menu_url",
-        "product_url","canonical_url","name","price","priceCurrency","sku","brand","description","images",
-        "gender","categories","found_in",
-    ]
-    with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
+def _with_site(row: Dict, src: Dict) -> Dict:
+    if "site" in src:
+        row["site"] = src["site"]
+    return row
+
+def product_csv_row(p: Dict) -> Dict:
+    return _with_site({
+        "record_type":"product",
+        "product_url":p.get("url",""),
+        "canonical_url":p.get("canonical_url",""),
+        "name":p.get("name",""),
+        "price":p.get("price",""),
+        "priceCurrency":p.get("priceCurrency",""),
+        "availability":p.get("availability",""),
+        "sku":p.get("sku",""),
+        "brand":p.get("brand",""),
+        "description":p.get("description",""),
+        "images":json.dumps(p.get("images",[]), ensure_ascii=False),
+        "image_assets":json.dumps(p["image_assets"], ensure_ascii=False) if "image_assets" in p else "",
+        "gender":p.get("gender",""),
+        "categories":json.dumps(p.get("categories",[]), ensure_ascii=False),
+        "found_in":json.dumps(p.get("found_in",[]), ensure_ascii=False),
+        "listing_pages":p.get("listing_pages",""),
+    }, p)
+
+# —— 增量写出（sink）：crawl 过程中每定稿一个产品就写一条，内存不随目录规模增长 ——
+class ProductSink:
+    """增量输出基类：构造时写表头/菜单，write() 逐条追加，close() 收尾。
+
+    作为上下文管理器使用时，即使抓取中途抛异常（含 KeyboardInterrupt）也会收尾，已写出的产品保持可读。
+    """
+
+    def __init__(self, out_path: str, menu_rows: List[Dict[str, str]]):
+        ensure_dir(out_path)
+        self.out_path = out_path
+        self.count = 0
+
+    def write(self, product: Dict) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+class JsonLinesSink(ProductSink):
+    """每行一条记录（record_type=menu/product），逐行 flush。"""
+
+    def __init__(self, out_path: str, menu_rows: List[Dict[str, str]]):
+        super().__init__(out_path, menu_rows)
+        self._f = open(out_path, "w", encoding="utf-8")
         for m in menu_rows:
-            w.writerow({
+            self._line(_with_site({"record_type": "menu", "text": m.get("text",""), "url": m.get("url","")}, m))
+        self._f.flush()
+
+    def _line(self, obj: Dict) -> None:
+        self._f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+    def write(self, product: Dict) -> None:
+        self._line({"record_type": "product", **product})
+        self._f.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+
+class ChangeSink(JsonLinesSink):
+    """增量模式输出：每行一条变更记录（record_type=change，change=added/changed/removed），不写菜单。"""
+
+    def __init__(self, out_path: str, menu_rows: List[Dict[str, str]] = ()):
+        super().__init__(out_path, [])
+
+    def write(self, change: Dict) -> None:
+        self._line({"record_type": "change", **change})
+        self._f.flush()
+        self.count += 1
+
+class CsvSink(ProductSink):
+    """CSV 行先缓冲，每 batch_size 条写出并 flush 一次。"""
+
+    def __init__(self, out_path: str, menu_rows: List[Dict[str, str]], batch_size: int = 100,
+                 fieldnames: List[str] = CSV_FIELDNAMES):
+        super().__init__(out_path, menu_rows)
+        self.batch_size = max(1, batch_size)
+        self._buf: List[Dict] = []
+        self._f = open(out_path, "w", newline="", encoding="utf-8-sig")
+        self._w = csv.DictWriter(self._f, fieldnames=fieldnames)
+        self._w.writeheader()
+        for m in menu_rows:
+            self._w.writerow(_with_site({
                 "record_type":"menu","text":m.get("text",""),"menu_url":m.get("url","")
-            })
-        import json as _json
+            }, m))
+        self._f.flush()
+
+    def write(self, product: Dict) -> None:
+        self._buf.append(product_csv_row(product))
+        self.count += 1
+        if len(self._buf) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buf:
+            self._w.writerows(self._buf)
+            self._buf = []
+        self._f.flush()
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self.flush()
+            self._f.close()
+
+class JsonSink(ProductSink):
+    """流式写出 {"menu": [...], "products": [...]} 外壳，输出与 json.dump(indent=2) 逐字节一致。
+
+    close() 负责补上结尾的 "]}"；进程被强杀时文件缺少结尾，但已写出的产品完整，可截断修复。
+    """
+
+    def __init__(self, out_path: str, menu_rows: List[Dict[str, str]], flush_every: int = 50):
+        super().__init__(out_path, menu_rows)
+        self.flush_every = max(1, flush_every)
+        self._f = open(out_path, "w", encoding="utf-8")
+        menu = json.dumps(menu_rows, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._f.write('{\n  "menu": ' + menu + ',\n  "products": [')
+        self._f.flush()
+
+    def write(self, product: Dict) -> None:
+        body = json.dumps(product, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        self._f.write(("," if self.count else "") + "\n    " + body)
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._f.flush()
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.write(("\n  ]" if self.count else "]") + "\n}")
+            self._f.close()
+
+# —— 列式输出（Parquet / Arrow IPC）：类型化 schema，分析端直接读列，不再解析 JSON 文本 ——
+PARTITION_COLUMNS = ("run_date", "gender")
+_TEXT_FIELDS = ["site", "url", "canonical_url", "name", "priceCurrency", "availability", "sku", "brand", "description", "gender"]
+
+def product_schema() -> "pa.Schema":
+    found_in = pa.struct([("gender", pa.string()), ("category", pa.string()), ("source_url", pa.string())])
+    asset = pa.struct([("url", pa.string()), ("sha256", pa.string()), ("size", pa.int64()), ("path", pa.string())])
+    return pa.schema([
+        ("site", pa.string()), ("url", pa.string()), ("canonical_url", pa.string()), ("name", pa.string()),
+        ("price", pa.float64()), ("priceCurrency", pa.string()), ("availability", pa.string()), ("sku", pa.string()), ("brand", pa.string()),
+        ("description", pa.string()), ("images", pa.list_(pa.string())),
+        ("image_assets", pa.list_(asset)), ("gender", pa.string()),
+        ("categories", pa.list_(pa.string())), ("found_in", pa.list_(found_in)), ("listing_pages", pa.int32()),
+        ("run_date", pa.date32()),
+    ])
+
+def product_columnar_row(p: Dict, run_date: date) -> Dict:
+    """产品 dict -> 与 product_schema 对应的行（sku 等可能是数字的字段统一转成字符串）。"""
+    row = {k: None if p.get(k) is None else str(p[k]) for k in _TEXT_FIELDS}
+    row["price"] = None if p.get("price") is None else float(p["price"])
+    row["images"] = [str(x) for x in p.get("images") or []]
+    # 没跑资产阶段时为 null（区别于"跑了但一张都没下到"的空列表）
+    row["image_assets"] = None if p.get("image_assets") is None else [
+        {k: a.get(k) for k in ("url", "sha256", "size", "path")} for a in p["image_assets"]]
+    row["categories"] = [str(x) for x in p.get("categories") or []]
+    row["found_in"] = [{"gender": r.get("gender"), "category": r.get("category"), "source_url": r.get("source_url")}
+                       for r in p.get("found_in") or []]
+    row["listing_pages"] = p.get("listing_pages")
+    row["run_date"] = run_date
+    return row
+
+class ColumnarSink(ProductSink):
+    """Parquet / Arrow IPC 输出：产品按 row_group_size 条一批写成一个 row group（IPC 为一个 record batch）。
+
+    partition_by 为空时写单个文件 out_path；否则 out_path 是数据集目录，按 Hive 风格分区
+    （<out_path>/run_date=2024-01-02/gender=men/part-<时间戳>.parquet），分区列只出现在路径里。
+    每个分区各自缓冲、各自一个 writer。菜单行（若有）另写到同目录的 <名字>.menu.<扩展名>，不混进产品数据集。
+    """
+    fmt = "parquet"
+
+    def __init__(self, out_path: str, menu_rows: List[Dict[str, str]], row_group_size: int = 10000,
+                 partition_by: Iterable[str] = (), run_date: Optional[date] = None):
+        if pa is None:
+            raise RuntimeError(f'format "{self.fmt}" requires pyarrow (pip install pyarrow)')
+        super().__init__(out_path, menu_rows)
+        self.partition_by = list(partition_by)
+        unknown = set(self.partition_by) - set(PARTITION_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot partition by: {', '.join(sorted(unknown))} (choose from {', '.join(PARTITION_COLUMNS)})")
+        self.row_group_size = max(1, row_group_size)
+        self.run_date = run_date or date.today()
+        self.run_id = datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.schema = product_schema()
+        for col in self.partition_by:
+            self.schema = self.schema.remove(self.schema.get_field_index(col))
+        self._writers: Dict[Tuple[str, ...], object] = {}
+        self._buffers: Dict[Tuple[str, ...], List[Dict]] = {}
+        if menu_rows:
+            menu = pa.Table.from_pylist([{"site": m.get("site"), "text": m.get("text", ""), "url": m.get("url", "")}
+                                         for m in menu_rows])
+            self._write_file(f"{os.path.splitext(out_path.rstrip(os.sep))[0]}.menu.{self.fmt}", menu)
+
+    def _write_file(self, path: str, table: "pa.Table") -> None:
+        writer = self._open(path, table.schema)
+        writer.write_table(table)
+        writer.close()
+
+    def _open(self, path: str, schema: "pa.Schema"):
+        ensure_dir(path)
+        if self.fmt == "arrow":
+            return pa.ipc.new_file(path, schema)
+        return pq.ParquetWriter(path, schema)
+
+    def _path(self, key: Tuple[str, ...]) -> str:
+        if not self.partition_by:
+            return self.out_path
+        dirs = [f"{col}={val}" for col, val in zip(self.partition_by, key)]
+        return os.path.join(self.out_path, *dirs, f"part-{self.run_id}.{self.fmt}")
+
+    def write(self, product: Dict) -> None:
+        row = product_columnar_row(product, self.run_date)
+        vals = [row.pop(col) for col in self.partition_by]
+        key = tuple(v.isoformat() if isinstance(v, date) else str(v) for v in vals)
+        buf = self._buffers.setdefault(key, [])
+        buf.append(row)
+        self.count += 1
+        if len(buf) >= self.row_group_size:
+            self._flush_partition(key)
+
+    def _flush_partition(self, key: Tuple[str, ...]) -> None:
+        rows = self._buffers.get(key)
+        if not rows:
+            return
+        writer = self._writers.get(key)
+        if writer is None:
+            writer = self._writers[key] = self._open(self._path(key), self.schema)
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        if self.fmt == "arrow":
+            writer.write_table(table)
+        else:
+            writer.write_table(table, row_group_size=self.row_group_size)
+        self._buffers[key] = []
+
+    def flush(self) -> None:
+        for key in list(self._buffers):
+            self._flush_partition(key)
+
+    def close(self) -> None:
+        if self._writers is None:
+            return
+        self.flush()
+        if not self._writers and not self.partition_by:
+            # 没有产品也写出带 schema 的空文件，下游读取不必特判
+            self._writers[()] = self._open(self.out_path, self.schema)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = None
+
+class ParquetSink(ColumnarSink):
+    fmt = "parquet"
+
+class ArrowSink(ColumnarSink):
+    fmt = "arrow"
+
+SINKS = {"json": JsonSink, "jsonl": JsonLinesSink, "csv": CsvSink, "parquet": ParquetSink, "arrow": ArrowSink}
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+def open_sink(fmt: str, out_path: str, menu_rows: List[Dict[str, str]], **kwargs) -> ProductSink:
+    try:
+        cls = SINKS[fmt]
+    except KeyError:
+        raise ValueError(f"Unknown output format: {fmt}")
+    return cls(out_path, menu_rows, **kwargs)
+
+def write_site_json_single(out_path: str, menu_rows: List[Dict[str, str]], products: List[Dict]) -> None:
+    with JsonSink(out_path, menu_rows) as sink:
+        for p in products:
+            sink.write(p)
+
+def write_site_csv_single(out_path: str, menu_rows: List[Dict[str, str]], products: List[Dict]) -> None:
+    with CsvSink(out_path, menu_rows) as sink:
         for p in products:
-            w.writerow({
-                "record_type":"product",
-                "product_url":p.get("url",""),
-                "canonical_url":p.get("canonical_url",""),
-                "name":p.get("name",""),
-                "price":p.get("price",""),
-                "priceCurrency":p.get("priceCurrency",""),
-                "sku":p.get("sku",""),
-                "brand":p.get("brand",""),
-                "description":p.get("description",""),
-                "images":_json.dumps(p.get("images",[]), ensure_ascii=False),
-                "gender":p.get("gender",""),
-                "categories":_json.dumps(p.get("categories",[]), ensure_ascii=False),
-                "found_in":_json.dumps(p.get("found_in",[]), ensure_ascii=False),
-            })
+            sink.write(p)
@@ -0,0 +1,108 @@
+# src/sitemap.py
+import gzip, io
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from httpclient import HttpClient
+from keywords import KeywordMatcher
+
+# sitemap 作为补种子（含列表页 & 详情页 URL）
+# 经 HttpClient 抓取（限速 / 重试 / 连接复用），iterparse 流式解析响应体，支持 .xml.gz，
+# 同一层的子 sitemap 并发抓取；给出 since 时按 <lastmod> 只保留之后变更过的条目。
+SITEMAP_KEYWORDS = [
+    "men","women","snow","jacket","pant","hoodie","goggle","fleece","base","t-shirt",
+    "beanie","glove","helmet","mask","sock","backpack","outerwear","facemask",
+]
+_SITEMAP_MATCHER = KeywordMatcher({"keep": SITEMAP_KEYWORDS}, cache_size=0)   # sitemap URL 各不相同，不缓存
+
+Entry = Tuple[str, Optional[datetime]]   # (loc, lastmod)
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """W3C Datetime（2024-01-02 / 2024-01-02T10:00:00Z / 带时区偏移），无时区按 UTC。"""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def iter_sitemap(stream) -> Iterator[Tuple[str, str, Optional[datetime]]]:
+    """流式解析 urlset / sitemapindex，逐条产出 (kind, loc, lastmod)，kind 为 "url" 或 "sitemap"。
+
+    每个条目处理完立即 clear()，内存占用与文档大小无关。
+    """
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        kind = _local(elem.tag)
+        if kind not in ("url", "sitemap"):
+            continue
+        loc = lastmod = None
+        for child in elem:
+            name = _local(child.tag)
+            if name == "loc": loc = (child.text or "").strip()
+            elif name == "lastmod": lastmod = child.text
+        if loc:
+            yield kind, loc, parse_lastmod(lastmod)
+        elem.clear()
+
+def _open_body(resp, url: str):
+    """返回可流式读取的正文；Content-Encoding 由 urllib3 解开，.gz 文件本身再套一层 GzipFile。"""
+    resp.raw.decode_content = True
+    resp.raw.auto_close = False   # 读到结尾时 urllib3 默认自动关闭，BufferedReader 会报 "read of closed file"
+    body = io.BufferedReader(resp.raw)
+    if url.lower().endswith(".gz") or body.peek(2)[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=body)
+    return body
+
+def read_sitemap(client: HttpClient, url: str) -> Tuple[List[Entry], List[Entry]]:
+    """抓取并解析一个 sitemap 文档，返回 (页面条目, 子 sitemap 条目)；失败时返回空。"""
+    urls: List[Entry] = []; subs: List[Entry] = []
+    try:
+        resp = client.get(url, stream=True)
+    except Exception:
+        return urls, subs
+    try:
+        for kind, loc, lastmod in iter_sitemap(_open_body(resp, url)):
+            (urls if kind == "url" else subs).append((loc, lastmod))
+    except (ET.ParseError, OSError, EOFError):
+        pass  # 截断 / 损坏的文档：保留已解析出的条目
+    finally:
+        resp.close()
+    return urls, subs
+
+def fetch_sitemap_urls(client: HttpClient, base_url: Optional[str] = None, limit: int = 4000,
+                       since: Optional[datetime] = None, keywords: Optional[Iterable[str]] = None) -> List[str]:
+    """keywords 给出该站点自己的 URL 关键词（默认 SITEMAP_KEYWORDS）。"""
+    base = (base_url or client.settings.base_url).rstrip("/")
+    matcher = _SITEMAP_MATCHER if keywords is None else KeywordMatcher({"keep": keywords}, cache_size=0)
+    host = urlparse(base).netloc.lower()
+    workers = max(1, client.settings.concurrence)
+
+    def changed(lastmod: Optional[datetime]) -> bool:
+        # 没有 lastmod 的条目无法判断，保守保留
+        return since is None or lastmod is None or lastmod > since
+
+    visited_sm = {f"{base}/sitemap.xml"}
+    level = [f"{base}/sitemap.xml"]
+    seen = set(); out: List[str] = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while level and len(out) < limit:
+            nxt: List[str] = []
+            # map 保持提交顺序，合并结果与并发度无关
+            for urls, subs in pool.map(lambda u: read_sitemap(client, u), level):
+                for loc, lastmod in subs:
+                    if loc not in visited_sm and changed(lastmod):
+                        visited_sm.add(loc); nxt.append(loc)
+                for loc, lastmod in urls:
+                    if len(out) >= limit: break
+                    if urlparse(loc).netloc.lower() != host or not changed(lastmod): continue
+                    if loc not in seen and matcher.any(loc.lower(), "keep"):
+                        seen.add(loc); out.append(loc)
+            level = nxt
+    return out
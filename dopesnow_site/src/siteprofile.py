@@ -0,0 +1,92 @@
+# src/siteprofile.py
+import dataclasses, json, os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import urlparse
+
+from config import Settings
+from parse import SiteRules
+
+# 站点配置（profile）：一个 JSON 文件描述一个店铺 —— 地址与域名、类目映射、过滤词、兜底选择器、站点级限速。
+# 词表类字段缺省时沿用内置（dopesnow）词表，结构相近的 Shopify 店铺通常只需给 name / base_url。
+#   {"name": "dopesnow", "base_url": "https://www.dopesnow.com/", "delay_seconds": 1.2,
+#    "category_canon": {"jackets": ["jacket", "jackets"], ...}, "selectors": {"description": [".rte"]}}
+
+@dataclass
+class SiteProfile:
+    name: str
+    base_url: str
+    allowed_domains: List[str] = field(default_factory=list)   # 空表示 base_url 的 host 及其去掉 www. 的写法
+    seeds: List[str] = field(default_factory=list)             # 额外种子（绝对地址或 /path）
+    # —— 词表 / 选择器（None 表示用内置）——
+    category_canon: Optional[Dict[str, List[str]]] = None
+    collection_signals: Optional[List[str]] = None
+    product_link_deny: Optional[List[str]] = None
+    category_deny: Optional[List[str]] = None
+    expand_keywords: Optional[List[str]] = None
+    gender_keywords: Optional[Dict[str, List[str]]] = None
+    selectors: Dict[str, List[str]] = field(default_factory=dict)   # 只需给出要覆盖的键
+    sitemap_keywords: Optional[List[str]] = None
+    # —— 站点级抓取参数（None 表示沿用全局设置）——
+    delay_seconds: Optional[float] = None
+    burst: Optional[int] = None
+    max_rate: Optional[float] = None
+    concurrency: Optional[int] = None
+    max_pages: Optional[int] = None
+
+    def __post_init__(self):
+        self._rules: Optional[SiteRules] = None
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.base_url).netloc.lower()
+
+    def domains(self) -> Set[str]:
+        if self.allowed_domains:
+            return {d.lower() for d in self.allowed_domains}
+        host = self.host.split(":")[0]
+        return {host, host[4:] if host.startswith("www.") else host}
+
+    def rules(self) -> SiteRules:
+        if self._rules is None:
+            self._rules = SiteRules(self.category_canon, self.collection_signals, self.product_link_deny,
+                                    self.category_deny, self.expand_keywords, self.gender_keywords, self.selectors)
+        return self._rules
+
+    def settings(self, base: Settings) -> Settings:
+        """在全局设置上套用本站点的地址与抓取参数。"""
+        overrides = {"delay_seconds": self.delay_seconds, "burst": self.burst, "max_rate": self.max_rate,
+                     "concurrence": self.concurrency}
+        return dataclasses.replace(base, base_url=self.base_url, allowed_domains=self.domains(),
+                                   **{k: v for k, v in overrides.items() if v is not None})
+
+PROFILE_FIELDS = {f.name for f in dataclasses.fields(SiteProfile)}
+
+def load_profile(path: str) -> SiteProfile:
+    """读取一个 profile 文件；name 缺省取文件名。字段名写错直接报错，避免静默回退到内置词表。"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: profile must be a JSON object")
+    unknown = set(data) - PROFILE_FIELDS
+    if unknown:
+        raise ValueError(f"{path}: unknown profile fields: {', '.join(sorted(unknown))}")
+    if not data.get("base_url"):
+        raise ValueError(f"{path}: base_url is required")
+    data.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return SiteProfile(**data)
+
+def load_profiles(paths: Iterable[str]) -> List[SiteProfile]:
+    """文件或目录（目录下的 *.json 按文件名排序）；站点名必须唯一（用作检查点文件名与输出中的 site 字段）。"""
+    files: List[str] = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(os.path.join(p, n) for n in sorted(os.listdir(p)) if n.endswith(".json"))
+        else:
+            files.append(p)
+    profiles = [load_profile(p) for p in files]
+    names = [p.name for p in profiles]
+    dup = sorted({n for n in names if names.count(n) > 1})
+    if dup:
+        raise ValueError(f"duplicate site names: {', '.join(dup)}")
+    return profiles
@@ -0,0 +1,146 @@
+# src/state.py
+import json, sqlite3, time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# 抓取状态持久化（SQLite）：frontier / 已访问集合 / 详情候选 / 来源记录 / 已解析的详情 URL 及其产品字段。
+# 写入在同一个事务里累积，checkpoint() 时连同队列快照一起提交 —— 崩溃后恢复到最近一次检查点。
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS frontier (seq INTEGER PRIMARY KEY, url TEXT NOT NULL, source TEXT);
+CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS product_urls (url TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS provenance (product_url TEXT NOT NULL, gender TEXT, category TEXT, source_url TEXT);
+CREATE INDEX IF NOT EXISTS provenance_product ON provenance(product_url);
+CREATE TABLE IF NOT EXISTS parsed_urls (url TEXT PRIMARY KEY, key TEXT);
+CREATE TABLE IF NOT EXISTS products (key TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS cards (url TEXT PRIMARY KEY, data TEXT NOT NULL);
+"""
+CRAWL_TABLES = ["frontier", "visited", "product_urls", "provenance", "parsed_urls", "products", "cards"]
+
+class CrawlState:
+    """可恢复的抓取状态。
+
+    resume=False 时清空上一轮的抓取表（meta 中的跨轮信息保留）；resume=True 时沿用已有内容。
+    """
+
+    def __init__(self, path: str, resume: bool = False, checkpoint_every: int = 50,
+                 checkpoint_seconds: float = 30.0):
+        self.path = path
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.checkpoint_seconds = checkpoint_seconds
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.resumed = resume and self.get_meta("phase") is not None
+        if not resume:
+            self.reset()
+        self._pending = 0
+        self._last_checkpoint = time.time()
+
+    def _migrate(self) -> None:
+        # 旧版库的 frontier 没有 source 列，parsed_urls 没有 key 列
+        for table, col in (("frontier", "source"), ("parsed_urls", "key")):
+            cols = {r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")}
+            if col not in cols:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} TEXT")
+                self.conn.commit()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS parsed_urls_key ON parsed_urls(key)")
+
+    def reset(self) -> None:
+        with self.conn:
+            for t in CRAWL_TABLES:
+                self.conn.execute(f"DELETE FROM {t}")
+            self.conn.execute("DELETE FROM meta WHERE key IN ('phase','pages')")
+
+    # —— meta ——
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value, commit: bool = False) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, str(value)))
+        if commit:
+            self.conn.commit()
+
+    @property
+    def phase(self) -> Optional[str]:
+        return self.get_meta("phase")
+
+    # —— 发现阶段 ——
+    def load_discovery(self) -> Tuple[List[Tuple[str, str]], Set[str], Set[str], Dict[str, List[Dict]], int]:
+        queue = [(u, src or "link") for u, src in self.conn.execute("SELECT url, source FROM frontier ORDER BY seq")]
+        visited = {r[0] for r in self.conn.execute("SELECT url FROM visited")}
+        product_urls = {r[0] for r in self.conn.execute("SELECT url FROM product_urls")}
+        contexts: Dict[str, List[Dict]] = {}
+        for purl, g, c, src in self.conn.execute(
+                "SELECT product_url, gender, category, source_url FROM provenance ORDER BY rowid"):
+            contexts.setdefault(purl, []).append({"gender": g, "category": c, "source_url": src})
+        return queue, visited, product_urls, contexts, int(self.get_meta("pages", "0"))
+
+    def add_visited(self, url: str) -> None:
+        self.conn.execute("INSERT OR IGNORE INTO visited(url) VALUES (?)", (url,))
+        self._pending += 1
+
+    def add_product_url(self, url: str, contexts: List[Dict]) -> None:
+        self.conn.execute("INSERT OR IGNORE INTO product_urls(url) VALUES (?)", (url,))
+        self.conn.executemany(
+            "INSERT INTO provenance(product_url, gender, category, source_url) VALUES (?, ?, ?, ?)",
+            [(url, r.get("gender"), r.get("category"), r.get("source_url")) for r in contexts])
+
+    def add_card(self, url: str, card: Dict) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO cards(url, data) VALUES (?, ?)", (url, json.dumps(card, ensure_ascii=False)))
+
+    def cards(self) -> Dict[str, Dict]:
+        return {url: json.loads(data) for url, data in self.conn.execute("SELECT url, data FROM cards")}
+
+    # —— 详情阶段 ——
+    def parsed_urls(self) -> Set[str]:
+        return {r[0] for r in self.conn.execute("SELECT url FROM parsed_urls")}
+
+    def parsed(self) -> Iterator[Tuple[str, Optional[str]]]:
+        """已处理的详情 URL 及其产品键（按处理顺序）。"""
+        return iter(self.conn.execute("SELECT url, key FROM parsed_urls ORDER BY rowid").fetchall())
+
+    def iter_groups(self) -> Iterator[Tuple[str, List[str], Dict]]:
+        """已保存的产品（定稿前）及解析到其键的全部详情 URL（按处理顺序），逐个读出，不整体载入内存。"""
+        for key, data in self.conn.execute("SELECT key, data FROM products ORDER BY rowid"):
+            urls = [r[0] for r in self.conn.execute("SELECT url FROM parsed_urls WHERE key=? ORDER BY rowid", (key,))]
+            yield key, urls, json.loads(data)
+
+    def add_parsed(self, url: str, key: Optional[str] = None, product: Optional[Dict] = None) -> None:
+        """记录已处理的详情 URL 及其产品键；product 非空时同时保存解析结果（定稿前），恢复时据此重新定稿。"""
+        self.conn.execute("INSERT OR IGNORE INTO parsed_urls(url, key) VALUES (?, ?)", (url, key))
+        if key and product is not None:
+            self.conn.execute("INSERT OR REPLACE INTO products(key, data) VALUES (?, ?)",
+                              (key, json.dumps(product, ensure_ascii=False)))
+        self._pending += 1
+
+    # —— 检查点 ——
+    def due(self) -> bool:
+        return self._pending >= self.checkpoint_every or bool(
+            self._pending and time.time() - self._last_checkpoint >= self.checkpoint_seconds)
+
+    def checkpoint(self, phase: str, queue: Optional[List[Tuple[str, str]]] = None, pages: Optional[int] = None,
+                   force: bool = False) -> bool:
+        """累计写入达到 checkpoint_every 条、或距上次提交超过 checkpoint_seconds（或 force）时提交；
+        传入 queue（[(url, source)]，按出队顺序）时一并替换 frontier 快照。"""
+        if not (force or self.due()):
+            return False
+        if queue is not None:
+            self.conn.execute("DELETE FROM frontier")
+            self.conn.executemany("INSERT INTO frontier(seq, url, source) VALUES (?, ?, ?)",
+                                  ((i, u, src) for i, (u, src) in enumerate(queue)))
+        if pages is not None:
+            self.set_meta("pages", pages)
+        self.set_meta("phase", phase)
+        self.conn.commit()
+        self._pending = 0
+        self._last_checkpoint = time.time()
+        return True
+
+    def close(self) -> None:
+        # 未到检查点的写入直接丢弃：已访问集合与 frontier 快照必须来自同一次提交
+        self.conn.rollback()
+        self.conn.close()
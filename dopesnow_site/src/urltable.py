@@ -0,0 +1,196 @@
+# src/urltable.py
+import hashlib, math
+from array import array
+from typing import Dict, Generic, Hashable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+# 大规模抓取时的紧凑存储：
+#   Interner / UrlTable —— 值 <-> 连续整数 ID，每个 URL 字符串只存一份，其余结构只保存 ID；
+#   Provenance         —— 产品来源表：来源上下文 (gender, category, 来源页 ID) 驻留为 ID，
+#                         一条来源记录 8 字节（产品 ID + 上下文 ID，原先是一个 dict）；
+#   ProvenanceSummary  —— 按产品聚合来源（去重、性别、列表页数），全部在整数 ID 上完成；
+#   BloomFilter        —— frontier 可选的概率型 seen 集合，约 1.8 字节/URL（千分之一误判），
+#                         代价是极少数新 URL 被误判为见过而不入队。
+T = TypeVar("T", bound=Hashable)
+
+class Interner(Generic[T]):
+    __slots__ = ("_ids", "_values")
+
+    def __init__(self):
+        self._ids: Dict[T, int] = {}
+        self._values: List[T] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, value: T) -> bool:
+        return value in self._ids
+
+    def intern(self, value: T) -> int:
+        i = self._ids.get(value)
+        if i is None:
+            i = self._ids[value] = len(self._values)
+            self._values.append(value)
+        return i
+
+    def get(self, value: T) -> Optional[int]:
+        return self._ids.get(value)
+
+    def value(self, i: int) -> T:
+        return self._values[i]
+
+UrlTable = Interner   # Interner[str]
+
+Context = Tuple[Optional[str], Optional[str], int]   # (gender, category, 来源页 URL ID)
+
+class Provenance:
+    """产品 URL -> 来源列表页上下文，按写入顺序保存；records() 还原为 found_in 使用的 dict。
+
+    写入只追加到两条平行数组（产品 ID、上下文 ID），每条记录 8 字节，没有按产品分配的对象；
+    第一次按产品读取时用计数排序建一次 CSR 索引（稳定，保持写入顺序），之后再写入会使索引失效。
+    """
+    __slots__ = ("urls", "contexts", "_rec_product", "_rec_context", "_is_product", "_count", "_index")
+
+    def __init__(self, urls: Optional[UrlTable] = None):
+        self.urls: UrlTable = urls if urls is not None else UrlTable()
+        self.contexts: Interner[Context] = Interner()
+        self._rec_product = array("I")
+        self._rec_context = array("I")
+        self._is_product = bytearray()     # 按 URL ID 标记是否为产品 URL
+        self._count = 0
+        self._index: Optional[Tuple[array, array]] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _has(self, pid: Optional[int]) -> bool:
+        return pid is not None and pid < len(self._is_product) and bool(self._is_product[pid])
+
+    def __contains__(self, product_url: str) -> bool:
+        return self._has(self.urls.get(product_url))
+
+    def context(self, gender: Optional[str], category: Optional[str], source_url: str) -> int:
+        return self.contexts.intern((gender, category, self.urls.intern(source_url)))
+
+    def extend(self, product_url: str, context_ids: Iterable[int]) -> None:
+        pid = self.urls.intern(product_url)
+        flags = self._is_product
+        if pid >= len(flags):
+            flags.extend(bytes(max(pid + 1 - len(flags), len(flags))))
+        if not flags[pid]:
+            flags[pid] = 1; self._count += 1
+        for cid in context_ids:
+            self._rec_product.append(pid); self._rec_context.append(cid)
+        self._index = None
+
+    def add(self, product_url: str, gender: Optional[str], category: Optional[str], source_url: str) -> None:
+        self.extend(product_url, (self.context(gender, category, source_url),))
+
+    def _build_index(self) -> Tuple[array, array]:
+        n = len(self.urls)
+        start = array("I", bytes(4 * (n + 1)))
+        for pid in self._rec_product:
+            start[pid + 1] += 1
+        for i in range(n):
+            start[i + 1] += start[i]
+        pos = array("I", start)
+        grouped = array("I", bytes(4 * len(self._rec_context)))
+        for pid, cid in zip(self._rec_product, self._rec_context):
+            grouped[pos[pid]] = cid; pos[pid] += 1
+        self._index = (start, grouped)
+        return self._index
+
+    def expand(self, context_ids: Iterable[int]) -> List[Dict]:
+        out = []
+        for cid in context_ids:
+            g, c, sid = self.contexts.value(cid)
+            out.append({"gender": g, "category": c, "source_url": self.urls.value(sid)})
+        return out
+
+    def records(self, product_url: str) -> List[Dict]:
+        pid = self.urls.get(product_url)
+        if not self._has(pid):
+            return []
+        start, grouped = self._index or self._build_index()
+        return self.expand(grouped[start[pid]:start[pid + 1]])
+
+    def product_urls(self) -> Iterator[str]:
+        return (self.urls.value(pid) for pid, flag in enumerate(self._is_product) if flag)
+
+    def summarize(self) -> "ProvenanceSummary":
+        return ProvenanceSummary(self)
+
+GENDER_BITS = {"men": 1, "women": 2}
+
+class ProvenanceSummary:
+    """按产品聚合来源表：found_in 去重、来源性别、不同列表页数。
+
+    来源表本身就是扁平的 (产品 ID, 上下文 ID) 两列，CSR 索引即按产品分组的结果。构建时把每个上下文的
+    性别位与 (gender, category, 来源页 URL) 展开成按上下文 ID 索引的表（上下文远少于来源记录）；
+    查询时先在整数上去重，再只为去重后的上下文建 found_in dict、合并性别位、统计来源页，
+    不再为每条原始记录建 dict 再按三元组去重。上下文按三元组驻留，整数去重与按三元组去重结果一致。
+    """
+    __slots__ = ("_start", "_grouped", "_gender_bit", "_context", "_urls")
+
+    def __init__(self, prov: Provenance):
+        self._start, self._grouped = prov._index or prov._build_index()
+        contexts = prov.contexts._values
+        self._gender_bit = bytes(GENDER_BITS.get(g, 0) for g, _, _ in contexts)
+        self._context = [(g, c, prov.urls.value(sid)) for g, c, sid in contexts]
+        self._urls = prov.urls
+
+    def _ids(self, url: Optional[str]) -> Iterable[int]:
+        pid = self._urls.get(url) if url is not None else None
+        if pid is None or pid + 1 >= len(self._start):
+            return ()
+        return self._grouped[self._start[pid]:self._start[pid + 1]]
+
+    def lookup(self, *urls: str) -> Tuple[List[Dict], List[str], int, int]:
+        """urls（同一产品的详情 URL、变体 / 别名 URL 与 canonical）合并后的
+        (去重的 found_in 记录, 来源类目, 性别位图, 不同列表页数)。"""
+        ids = [cid for url in dict.fromkeys(urls) for cid in self._ids(url)]
+        ctx, bit = self._context, self._gender_bit
+        found_in: List[Dict] = []; cats: List[str] = []; sources = set(); mask = 0
+        for cid in dict.fromkeys(ids):
+            g, c, u = ctx[cid]
+            found_in.append({"gender": g, "category": c, "source_url": u})
+            mask |= bit[cid]; sources.add(u)
+            if c: cats.append(c)
+        return found_in, cats, mask, len(sources)
+
+class BloomFilter:
+    """set 的近似替代（只支持 add / in）：不存在假阴性，假阳性率约为 error_rate（按 capacity 个元素设计）。"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))   # 位数
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # 双重哈希：一次 128 位摘要拆成两个 64 位数，g_i = h1 + i*h2
+        d = hashlib.blake2b(item.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(d[:8], "little"), int.from_bytes(d[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item: str) -> bool:
+        """加入元素；返回是否为新元素（可能因假阳性误报为已存在）。"""
+        new = False
+        bits = self.bits
+        for p in self._positions(item):
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask; new = True
+        self.count += new
+        return new
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,82 @@
+# tests/conftest.py
+# 模块以裸名导入（同 src/cli.py 的运行方式）；fixture_site 在 bench/ 下
+import os, sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", "bench"))
+
+import pytest                                   # noqa: E402
+from config import Settings                     # noqa: E402
+from httpclient import create_client            # noqa: E402
+from fixture_site import FixtureStore           # noqa: E402
+
+@pytest.fixture
+def fixture_store():
+    """本地合成店铺（30 个商品，每页 4 个）；测试里可改 store.products 模拟下架。"""
+    store = FixtureStore(products=30, page_size=4, description_words=8)
+    server = store.serve()
+    yield store
+    server.shutdown()
+
+@pytest.fixture
+def client(fixture_store):
+    c = create_client(Settings(base_url=fixture_store.base_url, delay_seconds=0, concurrence=4,
+                               max_retries=0, allowed_domains={"127.0.0.1"}))
+    yield c
+    c.close()
+
+class PageSite:
+    """按路径返回固定 HTML 的小站点（其余路径 404）；用于构造 canonical 别名等特殊场景。
+
+    failures[path] = n：该路径的前 n 次请求返回 503。hits 按顺序记录请求过的路径。
+    """
+
+    def __init__(self, pages):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import threading
+        site = self
+        self.pages = dict(pages)
+        self.failures = {}
+        self.hits = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                site.hits.append(self.path)
+                html = site.pages.get(self.path)
+                status = 200 if html is not None else 404
+                if site.failures.get(self.path, 0) > 0:
+                    site.failures[self.path] -= 1
+                    html, status = None, 503
+                body = (html or "<html><body>Not found</body></html>").encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return self.base_url.rstrip("/") + path
+
+    def client(self):
+        return create_client(Settings(base_url=self.base_url, delay_seconds=0, concurrence=2, max_retries=0,
+                                      allowed_domains={"127.0.0.1"}))
+
+@pytest.fixture
+def page_site():
+    sites = []
+
+    def make(pages):
+        sites.append(PageSite(pages))
+        return sites[-1]
+    yield make
+    for s in sites:
+        s.server.shutdown()
@@ -0,0 +1,65 @@
+# tests/test_assets.py
+import threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from assets import AssetStore
+from config import Settings
+from httpclient import create_client
+
+class SlowImages:
+    """每张图片 0.3 秒才返回的图片 host（按 localhost 访问，与页面的 127.0.0.1 是不同的 host）；记录最大并发数。"""
+
+    def __init__(self):
+        site = self
+        self.inflight = self.peak = 0
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with site.lock:
+                    site.inflight += 1
+                    site.peak = max(site.peak, site.inflight)
+                time.sleep(0.3)
+                body = self.path.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with site.lock:
+                    site.inflight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://localhost:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+@pytest.fixture
+def slow_images():
+    site = SlowImages()
+    yield site
+    site.server.shutdown()
+
+@pytest.mark.parametrize("delay, overlap", [(0.0, True), (None, False)])
+def test_image_host_gets_its_own_rate(slow_images, tmp_path, delay, overlap):
+    # 页面速率 1 次/秒：图片 host 沿用它时 4 张图一张一张来；单独限速后并发下载
+    client = create_client(Settings(base_url="http://127.0.0.1/", delay_seconds=1.0, concurrence=4, max_retries=0,
+                                    allowed_domains={"127.0.0.1"}))
+    product = {"images": [f"{slow_images.base_url}img/{i}.jpg" for i in range(4)]}
+    try:
+        with AssetStore(str(tmp_path), client, delay=delay) as store:
+            t0 = time.monotonic()
+            out = list(store.attach([product]))
+            elapsed = time.monotonic() - t0
+    finally:
+        client.close()
+    assert len(out[0]["image_assets"]) == 4
+    if overlap:
+        assert slow_images.peak >= 2 and elapsed < 1.0
+    else:
+        assert slow_images.peak == 1 and elapsed >= 2.5
@@ -0,0 +1,24 @@
+# tests/test_asyncclient.py
+import threading
+
+import pytest
+
+from config import Settings
+from httpclient import create_client
+
+pytest.importorskip("httpx")
+
+def test_cache_io_runs_off_the_event_loop(fixture_store, tmp_path):
+    client = create_client(Settings(base_url=fixture_store.base_url, delay_seconds=0, max_retries=0,
+                                    backend="async", cache_dir=str(tmp_path), allowed_domains={"127.0.0.1"}))
+    threads = []
+    for name in ("load", "store", "touch"):
+        fn = getattr(client.cache, name)
+        setattr(client.cache, name, lambda *a, fn=fn: threads.append(threading.current_thread().name) or fn(*a))
+    try:
+        for _ in range(2):   # 第二轮：条件请求 304 -> touch
+            list(client.fetch_many([fixture_store.base_url], 1))
+            client.get_page(fixture_store.base_url)
+    finally:
+        client.close()
+    assert threads and "http-event-loop" not in threads
@@ -0,0 +1,46 @@
+# tests/test_cli.py
+import os, subprocess, sys
+from argparse import Namespace
+
+import pytest
+
+from cli import SITE_CSV_FIELDNAMES, resolve_sitemap_since, sink_options
+from state import CrawlState
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "cli.py")
+
+def test_csv_with_partition_by_is_rejected():
+    args = Namespace(format="csv", partition_by="gender", row_group_size=1000)
+    with pytest.raises(SystemExit, match="--partition-by"):
+        sink_options(args, SITE_CSV_FIELDNAMES)
+    assert sink_options(Namespace(format="csv", partition_by="", row_group_size=1000),
+                        SITE_CSV_FIELDNAMES) == {"fieldnames": SITE_CSV_FIELDNAMES}
+
+def test_invalid_sitemap_since_is_rejected(tmp_path):
+    with pytest.raises(SystemExit, match="invalid --sitemap-since"):
+        resolve_sitemap_since("last week")
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    try:
+        assert resolve_sitemap_since("last", state) is None   # 还没有完整跑完过：不过滤
+        assert resolve_sitemap_since("2024-01-02").isoformat() == "2024-01-02T00:00:00+00:00"
+    finally:
+        state.close()
+
+def run_cli(*argv, timeout=60):
+    return subprocess.run([sys.executable, CLI, *argv], capture_output=True, text=True, timeout=timeout)
+
+@pytest.mark.parametrize("argv, message", [
+    (["--delta", "store.sqlite", "--format", "csv"], "--format must be json or jsonl"),
+    (["--format", "csv", "--partition-by", "gender"], "--partition-by requires"),
+])
+def test_invalid_options_fail_before_workers_start(tmp_path, argv, message):
+    r = run_cli("crawl", "--base", "http://127.0.0.1:9/", "--local-workers", "2", "--metrics-out", "",
+                "--state", str(tmp_path / "state.sqlite"), *argv)
+    assert r.returncode != 0 and message in r.stderr
+    assert "Coordinator listening" not in r.stdout
+
+def test_local_workers_are_stopped_when_the_crawl_fails(fixture_store, tmp_path):
+    # 输出路径是目录：打开 sink 失败时协调端点已经起来，本机工作进程必须被关掉，进程才能退出
+    r = run_cli("crawl", "--base", fixture_store.base_url, "--local-workers", "2", "--metrics-out", "",
+                "--state", str(tmp_path / "state.sqlite"), "--out", str(tmp_path))
+    assert r.returncode != 0 and "Coordinator listening" in r.stdout
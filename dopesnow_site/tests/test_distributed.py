@@ -0,0 +1,31 @@
+# tests/test_distributed.py
+import pytest
+import requests
+
+from config import Settings
+from distributed import TOKEN_HEADER, Coordinator, LeaseTable, run_worker
+from httpclient import RateLimiter
+
+def test_endpoint_requires_token():
+    with Coordinator({"base_url": "http://shop.example/"}, token="s3cret") as coord:
+        assert requests.get(f"{coord.url}/job", timeout=5).status_code == 403
+        r = requests.post(f"{coord.url}/complete", json={"worker": "x", "results": [{"id": 1}]}, timeout=5)
+        assert r.status_code == 403
+        ok = requests.get(f"{coord.url}/job", headers={TOKEN_HEADER: "s3cret"}, timeout=5)
+        assert ok.status_code == 200 and ok.json()["base_url"] == "http://shop.example/"
+        with pytest.raises(PermissionError):
+            run_worker(coord.url, Settings(), token="wrong")
+
+def test_default_bind_is_loopback():
+    with Coordinator({}) as coord:
+        assert coord.server.server_address[0] == "127.0.0.1"
+
+def test_leases_are_metered_per_host_across_workers():
+    # delay 0.5 s：一次租用最多拿到 POLL_SECONDS（1 秒）之内轮得到的 3 个，别的工作进程此时拿不到同一 host 的任务
+    table = LeaseTable(limiter=RateLimiter(0.5, adaptive=False))
+    table.add("detail", [f"http://a.example/p{i}" for i in range(10)] + ["http://b.example/p0"])
+    first = table.lease("w1", 20)
+    assert [t["url"] for t in first] == [f"http://a.example/p{i}" for i in range(3)] + ["http://b.example/p0"]
+    # 每个任务带着预约的发车时间，工作进程到点才发请求
+    assert [t["wait"] for t in first] == pytest.approx([0.0, 0.5, 1.0, 0.0], abs=0.05)
+    assert table.lease("w2", 20) == []
@@ -0,0 +1,31 @@
+# tests/test_pagination.py
+from pagination import Paginator
+
+LISTING = "https://shop.example/mens-jackets"
+
+def page(n: int) -> str:
+    return LISTING if n == 1 else f"{LISTING}?page={n}"
+
+def info(last=None, has_next=True):
+    return {"param": "page", "last": last, "has_next": has_next}
+
+def test_first_seen_middle_page_schedules_earlier_pages():
+    pg = Paginator(window=2)
+    out = pg.observe(page(3), info(last=None), ["/a-3"])
+    assert out == [page(1), page(2), page(4), page(5)]
+    assert pg.is_page(page(2))
+    # 站点自己的第 2 页链接被 is_page 过滤掉之后，第 2 页也不会被再次排期
+    assert pg.observe(page(2), info(), ["/a-2"]) == []
+
+def test_window_does_not_pass_known_last_page():
+    pg = Paginator(window=4)
+    assert pg.observe(page(1), info(last=6), ["/a-1"]) == [page(n) for n in range(2, 7)]
+    assert pg.observe(page(3), info(last=6), ["/a-3"]) == []
+    # 末页本身仍带 next：末页信息已过时，照常向后预排
+    assert pg.observe(page(6), info(last=6), ["/a-6"]) == [page(n) for n in range(7, 11)]
+
+def test_empty_page_stops_listing():
+    pg = Paginator(window=2)
+    pg.observe(page(1), info(), ["/a-1"])
+    assert pg.observe(page(3), info(), []) == []
+    assert pg.skip(page(4)) and not pg.skip(page(2))
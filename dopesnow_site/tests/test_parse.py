@@ -0,0 +1,74 @@
+# tests/test_parse.py
+import json
+
+import pytest
+
+import parse
+from httpclient import CHUNK_SIZE, PageReader
+from parse import discover_product_cards_from_html, normalize_price_and_currency, product_cut
+
+BASE = "https://shop.example/"
+
+def card_price(price_html: str):
+    html = (f'<html><body><div class="grid"><div class="product-card"><a href="/blue-jacket">'
+            f'<img src="/img/1.jpg" alt="Blue Jacket"></a><a href="/blue-jacket">Blue Jacket</a>'
+            f'{price_html}</div></div></body></html>')
+    cards = discover_product_cards_from_html(html, BASE)
+    assert len(cards) == 1
+    return cards[0]["price"], cards[0]["priceCurrency"]
+
+@pytest.mark.parametrize("price_html, expected", [
+    ('<div class="price"><s>€59,95</s> €47,96 <span>-20%</span></div>', 47.96),
+    ('<div class="price">Save 30% now €35.00</div>', 35.00),
+    ('<div class="price"><s>$120.00</s> <span>$96.00</span></div>', 96.00),
+    ('<div class="price">-15% 85.00</div>', 85.00),
+])
+def test_sale_card_price_ignores_discount_percent(price_html, expected):
+    assert card_price(price_html)[0] == pytest.approx(expected)
+
+@pytest.mark.parametrize("raw, expected", [
+    ("€47,96", (47.96, "EUR")), ("1.299,00 €", (1299.0, "EUR")), ("$1,299", (1299.0, "USD")),
+    ("1,299.00", (1299.0, "")), ("29.00", (29.0, "")),
+])
+def test_normalize_price_decimal_comma(raw, expected):
+    assert normalize_price_and_currency(raw) == expected
+
+def test_profile_gender_keywords_drive_listing_detection():
+    from parse import SiteRules, analyze_listing_page
+    rules = SiteRules(gender_keywords={"men": ["herren"], "women": ["damen"]},
+                      category_canon={"jackets": ["jacke", "jacken"]})
+    assert rules.looks_like_listing("https://shop.example/herren-jacken", "")
+    assert rules.keywords.any("https://shop.example/damen", "expand")
+    html = ('<html><head><title>Damen Jacken</title></head><body><h1>Damen Jacken</h1>'
+            '<div class="product-card"><a href="/blaue-jacke">Blaue Jacke</a></div>'
+            '<a href="/herren">Herren</a></body></html>').encode()
+    page = analyze_listing_page(html, "utf-8", "https://shop.example/damen-jacken", BASE, rules, False)
+    assert page["context"]["is_category"] and page["context"]["gender"] == "women"
+    assert page["product_links"] == ["/blaue-jacke"]
+    assert "https://shop.example/herren" in page["expansion_links"]
+
+def test_product_cut_scans_only_new_scripts(monkeypatch):
+    ld = [{"@context": "https://schema.org", "@type": "Product", "name": "Blue Jacket", "sku": "BJ1",
+           "description": "Warm jacket", "image": [BASE + "img/1.jpg"],
+           "offers": {"@type": "Offer", "price": "99.00", "priceCurrency": "EUR"}},
+          {"@context": "https://schema.org", "@type": "BreadcrumbList", "itemListElement": [
+              {"@type": "ListItem", "position": 1, "name": "Men"},
+              {"@type": "ListItem", "position": 2, "name": "Jackets"}]}]
+    head = (f'<html><head><title>Blue Jacket</title><link rel="canonical" href="{BASE}blue-jacket">'
+            f'<script>var a = 1;</script>').encode()
+    rest = (f'<script type="application/ld+json">{json.dumps(ld)}</script></head><body>'
+            + "<p>lorem ipsum</p>" * 20000 + "</body></html>").encode()
+    body = head + b"<!--" + b"x" * (3 * CHUNK_SIZE) + b"-->" + rest
+    calls = []
+    fast = parse.fast_product_fields
+    monkeypatch.setattr(parse, "fast_product_fields", lambda *a: calls.append(1) or fast(*a))
+
+    class Resp:
+        headers = {"Content-Type": "text/html"}
+    reader = PageReader(BASE + "blue-jacket", Resp(), 0, lambda u, buf, start: product_cut(u, buf, None, start))
+    chunks = [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+    n = next(i for i, c in enumerate(chunks, 1) if reader.feed(c))
+    # 只在读到新的 </script> 时解析：第一段脚本一次，JSON-LD 一次
+    assert len(calls) == 2
+    assert reader.cut == product_cut(BASE + "blue-jacket", body[:n * CHUNK_SIZE])
+    assert n < len(chunks)
@@ -0,0 +1,102 @@
+# tests/test_products.py
+import json
+
+import products
+from products import iter_products
+from state import CrawlState
+
+def listing(title: str, links) -> str:
+    cards = "".join(f'<div class="product-card"><a href="{u}">Jacket</a></div>' for u in links)
+    return (f"<html><head><title>{title} | Shop</title></head><body><h1>{title}</h1>"
+            f"<div class='grid'>{cards}</div></body></html>")
+
+def detail(canonical: str, name: str = "Blue Jacket", tag: str = "link") -> str:
+    ld = {"@context": "https://schema.org", "@type": "Product", "name": name, "sku": "BJ1",
+          "offers": {"@type": "Offer", "price": "99.00", "priceCurrency": "EUR"}}
+    # og:url 只有完整解析才读得到：入池前看不出两个 URL 是同一产品
+    link = (f'<link rel="canonical" href="{canonical}">' if tag == "link"
+            else f'<meta property="og:url" content="{canonical}">')
+    return (f'<html><head><title>{name}</title>{link}'
+            f'<script type="application/ld+json">{json.dumps(ld)}</script></head>'
+            f"<body><h1>{name}</h1></body></html>")
+
+def alias_site(page_site, tag: str = "link"):
+    site = page_site({})
+    site.pages.update({
+        "/mens-jackets": listing("Men's Jackets", ["/blue-jacket-a"]),
+        "/womens-jackets": listing("Women's Jackets", ["/blue-jacket-b"]),
+        "/blue-jacket-a": detail(site.url("/blue-jacket"), tag=tag),
+        "/blue-jacket-b": detail(site.url("/blue-jacket"), tag=tag),
+    })
+    return site
+
+def crawl(site, **kwargs):
+    client = site.client()
+    try:
+        return list(iter_products(client, [site.url("/mens-jackets"), site.url("/womens-jackets")], **kwargs))
+    finally:
+        client.close()
+
+def test_alias_urls_merge_provenance(page_site):
+    site = alias_site(page_site, tag="og")
+    products = crawl(site)
+    assert len(products) == 1
+    p = products[0]
+    assert p["canonical_url"] == site.url("/blue-jacket")
+    assert p["gender"] == "both"
+    assert sorted(r["source_url"] for r in p["found_in"]) == [site.url("/mens-jackets"), site.url("/womens-jackets")]
+    assert p["listing_pages"] == 2
+
+def test_duplicate_canonical_merges_provenance(page_site):
+    # <head> 里的 canonical 已解析过：第二个 URL 不再解析（Duplicate），来源仍并入产品
+    site = alias_site(page_site)
+    client = site.client()
+    try:
+        # 逐个抓取，第二个 URL 一定在第一个解析完之后才看 canonical
+        products = list(iter_products(client, [site.url("/mens-jackets"), site.url("/womens-jackets")], concurrency=1))
+    finally:
+        client.close()
+    assert len(products) == 1
+    assert products[0]["gender"] == "both" and products[0]["listing_pages"] == 2
+
+def test_alias_provenance_survives_resume(page_site, tmp_path):
+    site = alias_site(page_site)
+    path = str(tmp_path / "state.sqlite")
+    state = CrawlState(path)
+    first = crawl(site, state=state, concurrency=1)
+    assert state.load_discovery()[2] == {site.url("/blue-jacket-a"), site.url("/blue-jacket-b")}
+    state.close()
+    # 恢复时不再把 canonical 当作新的候选 URL 去抓
+    state = CrawlState(path, resume=True)
+    resumed = crawl(site, state=state, concurrency=1)
+    state.close()
+    assert resumed == first and first[0]["gender"] == "both"
+
+def test_failed_listing_is_requeued(page_site):
+    site = alias_site(page_site, tag="og")
+    site.failures["/womens-jackets"] = 1
+    products = crawl(site)
+    assert len(products) == 1 and products[0]["listing_pages"] == 2
+
+def test_products_stream_during_detail_phase(page_site, monkeypatch):
+    monkeypatch.setattr(products, "FINALIZE_WINDOW", 2)
+    site = page_site({})
+    slugs = [f"/jacket-{i:02d}" for i in range(40)]
+    site.pages["/mens-jackets"] = listing("Men's Jackets", slugs)
+    site.pages["/womens-jackets"] = listing("Women's Jackets", ["/jacket-00-alias"])
+    for slug in slugs:
+        site.pages[slug] = detail(site.url(slug), name=f"Jacket {slug[-2:]}", tag="og")
+    site.pages["/jacket-00-alias"] = detail(site.url("/jacket-00"), name="Jacket 00", tag="og")
+    client = site.client()
+    try:
+        it = iter_products(client, [site.url("/mens-jackets"), site.url("/womens-jackets")], concurrency=1)
+        first = next(it)
+        fetched = len(site.hits)
+        rest = list(it)
+        # 第一个产品在详情阶段结束之前就已交给调用方
+        assert len(site.hits) - fetched > 30
+    finally:
+        client.close()
+    # 别名 URL 紧随其后处理，来源照样并入
+    assert first["canonical_url"] == site.url("/jacket-00") and first["gender"] == "both"
+    assert len(rest) == 39
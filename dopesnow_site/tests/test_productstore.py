@@ -0,0 +1,90 @@
+# tests/test_productstore.py
+import requests
+
+from products import iter_product_changes
+from productstore import ProductStore
+
+def product(i: int, price: str = "20.00") -> dict:
+    url = f"https://shop.example/item-{i}"
+    return {"url": url, "canonical_url": url, "name": f"Item {i}", "price": price, "images": []}
+
+def http_error(status: int) -> requests.HTTPError:
+    resp = requests.Response(); resp.status_code = status
+    return requests.HTTPError(f"{status}", response=resp)
+
+def run(path: str, seen=(), failed=(), partial=None, removed_after=3):
+    """一次运行：apply 见到的产品、记下失败的 URL，返回本轮下架的键。"""
+    store = ProductStore(path, removed_after=removed_after)
+    try:
+        for i in seen:
+            store.apply(product(i)["url"], product(i))
+        for url, exc in failed:
+            store.failed(url, exc)
+        if partial:
+            store.partial(partial)
+        return sorted(c["key"] for c in store.removed())
+    finally:
+        store.close()
+
+def test_unseen_products_removed_after_k_complete_runs(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    assert run(path, seen=range(3)) == []
+    assert run(path, seen=[0, 1]) == []
+    assert run(path, seen=[0, 1]) == []
+    assert run(path, seen=[0, 1]) == [product(2)["url"]]
+
+def test_seen_again_resets_missed_count(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    run(path, seen=range(2))
+    run(path, seen=[0]); run(path, seen=[0])
+    assert run(path, seen=[0, 1]) == []
+    assert run(path, seen=[0]) == [] and run(path, seen=[0]) == []
+    assert run(path, seen=[0]) == [product(1)["url"]]
+
+def test_partial_runs_never_count(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    run(path, seen=range(3))
+    for _ in range(5):
+        assert run(path, seen=[0], partial="max_pages") == []
+    store = ProductStore(path)
+    assert len(store) == 3
+    store.close()
+
+def test_fetch_failure_keeps_product(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    run(path, seen=range(2))
+    url = product(1)["url"]
+    for _ in range(4):
+        assert run(path, seen=[0], failed=[(url, requests.ConnectionError("reset"))], removed_after=1) == []
+        assert run(path, seen=[0], failed=[(url, http_error(503))], removed_after=1) == []
+        assert run(path, seen=[0], failed=[(url, None)], removed_after=1) == []   # 没解析出名称
+
+def test_gone_detail_page_removes_at_once(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    run(path, seen=range(3))
+    failed = [(product(1)["url"], http_error(404)), (product(2)["url"], http_error(410))]
+    assert run(path, seen=[0], failed=failed, partial="max_pages") == [product(1)["url"], product(2)["url"]]
+
+def test_gone_ignored_when_another_url_of_product_parsed(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    run(path, seen=[0])
+    assert run(path, seen=[0], failed=[(product(0)["url"], http_error(404))]) == []
+
+def test_truncated_crawl_reports_no_removals(tmp_path, fixture_store, client):
+    path = str(tmp_path / "store.sqlite")
+    seeds = fixture_store.seeds()
+    with ProductStore(path) as store:
+        first = list(iter_product_changes(client, seeds, store, max_pages=200))
+    assert {c["change"] for c in first} == {"added"} and len(first) == 30
+    # max_pages 截断：大部分列表页没抓到，这些产品本轮没见到，但不能算作下架
+    with ProductStore(path, removed_after=1) as store:
+        changes = list(iter_product_changes(client, seeds, store, max_pages=5))
+        assert [c for c in changes if c["change"] == "removed"] == []
+        assert len(store) == 30
+    # 商品真正下架后（列表页不再列出），完整运行达到次数才报告
+    fixture_store.products = 28
+    with ProductStore(path, removed_after=2) as store:
+        assert [c for c in iter_product_changes(client, seeds, store, max_pages=200) if c["change"] == "removed"] == []
+    with ProductStore(path, removed_after=2) as store:
+        removed = [c["key"] for c in iter_product_changes(client, seeds, store, max_pages=200) if c["change"] == "removed"]
+    assert sorted(removed) == sorted(fixture_store.base_url.rstrip("/") + fixture_store.product_path(i) for i in (28, 29))